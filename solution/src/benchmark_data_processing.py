@@ -0,0 +1,165 @@
+"""
+数据处理流水线性能基准 (Data Processing Benchmark)
+
+在按赛季复制放大的 2026_MCM_Problem_C_Data.csv 上，
+对比原逐行/逐组实现与当前向量化实现的耗时，并校验输出一致。
+
+使用方法：python benchmark_data_processing.py
+"""
+import re
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data_processing import (
+    aggregate_weekly_scores,
+    compute_standardized_score,
+    extract_week_judge_columns,
+    melt_to_long_format,
+)
+
+
+def make_scaled_raw(raw_df: pd.DataFrame, n_copies: int) -> pd.DataFrame:
+    """
+    按赛季复制原始宽表，生成结构相同的大规模合成数据
+
+    第 k 份拷贝的赛季号整体平移 k × max_season，
+    保证 (season, celebrity_name) 在合成数据中依然唯一。
+    """
+    max_season = int(raw_df['season'].max())
+    copies = []
+    for k in range(n_copies):
+        temp = raw_df.copy()
+        temp['season'] = temp['season'] + k * max_season
+        copies.append(temp)
+    return pd.concat(copies, ignore_index=True)
+
+
+def melt_to_long_format_iterrows(df: pd.DataFrame) -> pd.DataFrame:
+    """原逐行 iterrows 实现，仅作为基准参照"""
+    week_map = extract_week_judge_columns(df)
+
+    records = []
+    for week, cols in week_map.items():
+        for col in cols:
+            match = re.search(r"judge(\d+)", col, re.IGNORECASE)
+            judge_id = int(match.group(1)) if match else 0
+
+            for idx, row in df.iterrows():
+                records.append({
+                    'season': row['season'],
+                    'celebrity_name': row['celebrity_name'],
+                    'week': week,
+                    'judge_id': judge_id,
+                    'score': row[col]
+                })
+
+    long_df = pd.DataFrame(records)
+    long_df['score'] = pd.to_numeric(long_df['score'], errors='coerce')
+
+    return long_df
+
+
+def aggregate_weekly_scores_lambda(long_df: pd.DataFrame) -> pd.DataFrame:
+    """原逐组 lambda 实现，仅作为基准参照"""
+    grouped = long_df.groupby(['season', 'celebrity_name', 'week'])
+
+    weekly_agg = grouped.agg({
+        'score': lambda x: compute_standardized_score(x)
+    }).reset_index()
+
+    weekly_agg.rename(columns={'score': 'judge_total'}, inplace=True)
+
+    weekly_agg['judge_rank_in_week'] = weekly_agg.groupby(['season', 'week'])['judge_total'].rank(
+        ascending=False, method='dense'
+    )
+    weekly_agg['week_valid'] = (
+        weekly_agg['judge_total'].notna() &
+        (weekly_agg['judge_total'] > 0)
+    )
+
+    return weekly_agg
+
+
+def time_call(func: Callable, *args, repeats: int = 3):
+    """返回 (最短耗时秒数, 最后一次的返回值)"""
+    best = np.inf
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_melt(raw_df: pd.DataFrame, scales: List[int]) -> pd.DataFrame:
+    """
+    Step 1 (Melt) 基准：逐行实现 vs 列式实现
+    """
+    rows: List[Dict] = []
+    for scale in scales:
+        scaled = make_scaled_raw(raw_df, scale)
+
+        legacy_time, legacy_df = time_call(melt_to_long_format_iterrows, scaled, repeats=1)
+        fast_time, fast_df = time_call(melt_to_long_format, scaled)
+
+        pd.testing.assert_frame_equal(legacy_df, fast_df)
+
+        rows.append({
+            'scale': scale,
+            'raw_rows': len(scaled),
+            'long_rows': len(fast_df),
+            'iterrows_sec': legacy_time,
+            'vectorized_sec': fast_time,
+            'speedup': legacy_time / fast_time,
+        })
+        print(f"  - ×{scale}: {len(fast_df)} 行, iterrows {legacy_time:.3f}s, "
+              f"向量化 {fast_time:.4f}s, 加速 {legacy_time / fast_time:.0f}×")
+
+    return pd.DataFrame(rows)
+
+
+def benchmark_aggregate(raw_df: pd.DataFrame, scales: List[int]) -> pd.DataFrame:
+    """
+    Step 2 (Aggregation) 基准：逐组 lambda vs bincount 归约
+    """
+    rows: List[Dict] = []
+    for scale in scales:
+        long_df = melt_to_long_format(make_scaled_raw(raw_df, scale))
+
+        legacy_time, legacy_df = time_call(aggregate_weekly_scores_lambda, long_df, repeats=1)
+        fast_time, fast_df = time_call(aggregate_weekly_scores, long_df)
+
+        pd.testing.assert_frame_equal(legacy_df, fast_df, check_exact=True)
+
+        rows.append({
+            'scale': scale,
+            'long_rows': len(long_df),
+            'weekly_rows': len(fast_df),
+            'lambda_sec': legacy_time,
+            'vectorized_sec': fast_time,
+            'speedup': legacy_time / fast_time,
+        })
+        print(f"  - ×{scale}: {len(long_df)} 行评分, lambda {legacy_time:.3f}s, "
+              f"向量化 {fast_time:.4f}s, 加速 {legacy_time / fast_time:.0f}×")
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from config import RAW_DATA
+
+    print("=" * 60)
+    print("数据处理性能基准 (Data Processing Benchmark)")
+    print("=" * 60)
+
+    raw = pd.read_csv(RAW_DATA)
+    print(f"\n原始数据形状: {raw.shape}")
+
+    print("\n[Step 1] Melt (宽转长)")
+    benchmark_melt(raw, scales=[1, 4, 16])
+
+    print("\n[Step 2] Aggregation (周级聚合)")
+    benchmark_aggregate(raw, scales=[1, 16, 64])
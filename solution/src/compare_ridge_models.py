@@ -6,7 +6,13 @@ import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
 
-def compare_models():
+from utils.storage import read_table
+
+def compare_models(
+    v1_path: Path = Path("F:/Mathematical_modeling/solution/Data/models/ridge/ridge_fan_scores.csv"),
+    v2_path: Path = Path("F:/Mathematical_modeling/solution/Data/models/ridge_v2/ridge_fan_vote_shares_v2.csv"),
+    output_dir: Path = Path("F:/Mathematical_modeling/solution/figures/ridge_comparison"),
+):
     """对比 V1 和 V2 模型的结果"""
 
     print("=" * 80)
@@ -14,11 +20,8 @@ def compare_models():
     print("=" * 80)
 
     # 加载两个版本的结果
-    v1_path = Path("F:/Mathematical_modeling/solution/Data/models/ridge/ridge_fan_scores.csv")
-    v2_path = Path("F:/Mathematical_modeling/solution/Data/models/ridge_v2/ridge_fan_vote_shares_v2.csv")
-
-    v1_df = pd.read_csv(v1_path)
-    v2_df = pd.read_csv(v2_path)
+    v1_df = read_table(v1_path)
+    v2_df = read_table(v2_path)
 
     print("\n[数据加载]")
     print(f"  V1: {len(v1_df)} 行")
@@ -92,7 +95,7 @@ def compare_models():
     print("   - V2: 预测周级结果（更精细）")
 
     # 可视化对比
-    output_dir = Path("F:/Mathematical_modeling/solution/figures/ridge_comparison")
+    output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # 对比分布
@@ -9,6 +9,9 @@ from typing import Dict, List, Tuple
 import numpy as np
 import pandas as pd
 
+from utils.cache import cached_stage
+from utils.storage import write_artifact
+
 
 def parse_elimination_week(results: str) -> int:
     """
@@ -65,31 +68,41 @@ def melt_to_long_format(df: pd.DataFrame) -> pd.DataFrame:
     Step 1: Melt (宽转长)
     将 weekX_judgeY_score 转换为长格式
 
+    列式实现：所有 week/judge 列一次性按列主序展开，
+    week 与 judge_id 由列名解析为 int64 数组后 np.repeat，
+    season / celebrity_name 按列数 np.tile，避免逐行 iterrows。
+    行顺序与原逐行实现一致：先按周、再按评委列、最后按原始行。
+
     Returns:
         DataFrame with columns: [season, celebrity_name, week, judge_id, score]
     """
     week_map = extract_week_judge_columns(df)
 
-    records = []
+    score_cols: List[str] = []
+    col_weeks: List[int] = []
+    col_judges: List[int] = []
     for week, cols in week_map.items():
         for col in cols:
             # 提取 judge_id
             match = re.search(r"judge(\d+)", col, re.IGNORECASE)
-            judge_id = int(match.group(1)) if match else 0
-
-            for idx, row in df.iterrows():
-                score_val = row[col]
-                records.append({
-                    'season': row['season'],
-                    'celebrity_name': row['celebrity_name'],
-                    'week': week,
-                    'judge_id': judge_id,
-                    'score': score_val
-                })
-
-    long_df = pd.DataFrame(records)
-    # 将 N/A 转换为 NaN
-    long_df['score'] = pd.to_numeric(long_df['score'], errors='coerce')
+            score_cols.append(col)
+            col_weeks.append(week)
+            col_judges.append(int(match.group(1)) if match else 0)
+
+    n_rows = len(df)
+    n_cols = len(score_cols)
+
+    # 将 N/A 转换为 NaN，再按列主序展平（第 1 列全部行，第 2 列全部行，...）
+    scores = df[score_cols].apply(pd.to_numeric, errors='coerce')
+    score_values = scores.to_numpy(dtype=np.float64).ravel(order='F')
+
+    long_df = pd.DataFrame({
+        'season': np.tile(df['season'].to_numpy(), n_cols),
+        'celebrity_name': np.tile(df['celebrity_name'].to_numpy(), n_cols),
+        'week': np.repeat(np.asarray(col_weeks, dtype=np.int64), n_rows),
+        'judge_id': np.repeat(np.asarray(col_judges, dtype=np.int64), n_rows),
+        'score': score_values,
+    })
 
     return long_df
 
@@ -110,15 +123,30 @@ def aggregate_weekly_scores(long_df: pd.DataFrame) -> pd.DataFrame:
     """
     Step 2: Aggregation (周级聚合)
     计算每人每周的 judge_total, judge_rank_in_week
+
+    judge_total 与 compute_standardized_score 的定义一致，
+    但改为基于组号的 NumPy 归约：np.bincount 按原始行顺序把有效分数
+    累加到各自的 (season, celebrity_name, week) 组，一次求出每组的和与个数，
+    不再逐组调用 Python 函数。组内累加顺序与原实现相同，结果逐位一致。
     """
-    # 按 season, celebrity_name, week 分组
+    # 按 season, celebrity_name, week 分组（组号与 groupby 的排序一致）
     grouped = long_df.groupby(['season', 'celebrity_name', 'week'])
+    group_ids = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
 
-    weekly_agg = grouped.agg({
-        'score': lambda x: compute_standardized_score(x)
-    }).reset_index()
+    scores = long_df['score'].to_numpy(dtype=np.float64)
+    # 组键含 NaN 的行 ngroup 为 -1，与 groupby 一样丢弃
+    valid = ~np.isnan(scores) & (group_ids >= 0)
+
+    score_sum = np.bincount(group_ids[valid], weights=scores[valid], minlength=n_groups)
+    score_count = np.bincount(group_ids[valid], minlength=n_groups)
 
-    weekly_agg.rename(columns={'score': 'judge_total'}, inplace=True)
+    # Score_std = (有效分数和 / 有效分数个数) × 30，无有效分数时为 NaN
+    with np.errstate(invalid='ignore', divide='ignore'):
+        judge_total = np.where(score_count > 0, score_sum / score_count, np.nan) * 30
+
+    weekly_agg = grouped.size().index.to_frame(index=False)
+    weekly_agg['judge_total'] = judge_total
 
     # 计算每周的排名 (Dense Rank, 降序)
     weekly_agg['judge_rank_in_week'] = weekly_agg.groupby(['season', 'week'])['judge_total'].rank(
@@ -161,6 +189,29 @@ def join_metadata(weekly_df: pd.DataFrame, raw_df: pd.DataFrame) -> pd.DataFrame
     return merged
 
 
+def _relative_judge_score(df: pd.DataFrame) -> pd.Series:
+    """当周 Z-Score：只依赖同一 (season, week) 内的分数"""
+    week_mean = df.groupby(['season', 'week'])['judge_total'].transform('mean')
+    week_std = df.groupby(['season', 'week'])['judge_total'].transform('std').replace(0, np.nan)
+    relative = (df['judge_total'] - week_mean) / week_std
+    return relative.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+
+def _is_bottom_2_judge(df: pd.DataFrame) -> pd.Series:
+    """是否在当周评委排名的倒数两名内"""
+    return df['judge_rank_in_week'] >= (
+        df.groupby(['season', 'week'])['judge_rank_in_week'].transform('max') - 1
+    )
+
+
+def _mask_eliminated_weeks(df: pd.DataFrame) -> pd.DataFrame:
+    """处理淘汰后的分数：将淘汰后的周设为无效"""
+    is_eliminated = (df['week'] > df['elimination_week']) & (df['elimination_week'] > 0)
+    df.loc[is_eliminated, 'week_valid'] = False
+    df.loc[is_eliminated, 'judge_total'] = np.nan
+    return df
+
+
 def generate_dynamic_features(df: pd.DataFrame) -> pd.DataFrame:
     """
     Step 4: Feature Generation (生成衍生特征)
@@ -170,6 +221,9 @@ def generate_dynamic_features(df: pd.DataFrame) -> pd.DataFrame:
     - cumulative_average: 截止到上周的平均分
     - trend: 本周分 - 上周分
     - is_bottom_2_judge: 是否在评委分的倒数两名内
+
+    赛季进行中逐周追加数据时，使用 compute_feature_state +
+    append_week_features 增量计算，无需对整个面板重算。
     """
     df = df.copy()
 
@@ -177,14 +231,7 @@ def generate_dynamic_features(df: pd.DataFrame) -> pd.DataFrame:
     df = df.sort_values(['season', 'celebrity_name', 'week']).reset_index(drop=True)
 
     # 1. relative_judge_score (Z-Score)
-    df['week_mean'] = df.groupby(['season', 'week'])['judge_total'].transform('mean')
-    df['week_std'] = df.groupby(['season', 'week'])['judge_total'].transform('std').replace(0, np.nan)
-    df['relative_judge_score'] = (df['judge_total'] - df['week_mean']) / df['week_std']
-    df['relative_judge_score'] = (
-        df['relative_judge_score']
-        .replace([np.inf, -np.inf], np.nan)
-        .fillna(0)
-    )
+    df['relative_judge_score'] = _relative_judge_score(df)
 
     # 2. cumulative_average (截止到上周的平均分)
     df['cumulative_average'] = df.groupby(['season', 'celebrity_name'])['judge_total'].apply(
@@ -192,25 +239,122 @@ def generate_dynamic_features(df: pd.DataFrame) -> pd.DataFrame:
     ).reset_index(level=[0, 1], drop=True)
 
     # 3. trend (本周分 - 上周分)
-    df['prev_week_score'] = df.groupby(['season', 'celebrity_name'])['judge_total'].shift(1)
-    df['trend'] = df['judge_total'] - df['prev_week_score']
+    prev_week_score = df.groupby(['season', 'celebrity_name'])['judge_total'].shift(1)
+    df['trend'] = df['judge_total'] - prev_week_score
 
     # 4. is_bottom_2_judge (是否在倒数两名内)
-    df['is_bottom_2_judge'] = df['judge_rank_in_week'] >= (
-        df.groupby(['season', 'week'])['judge_rank_in_week'].transform('max') - 1
-    )
+    df['is_bottom_2_judge'] = _is_bottom_2_judge(df)
 
     # 5. 处理淘汰后的分数：将淘汰后的周设为无效
-    df['is_eliminated'] = (df['week'] > df['elimination_week']) & (df['elimination_week'] > 0)
-    df.loc[df['is_eliminated'], 'week_valid'] = False
-    df.loc[df['is_eliminated'], 'judge_total'] = np.nan
-
-    # 清理临时列
-    df = df.drop(columns=['week_mean', 'week_std', 'prev_week_score', 'is_eliminated'])
+    df = _mask_eliminated_weeks(df)
 
     return df
 
 
+def compute_feature_state(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    计算每位选手的累计状态，供 append_week_features 增量更新
+
+    Row = Contestant，以 (season, celebrity_name) 为索引，列：
+    - last_week: 已处理的最后一周
+    - score_sum / score_count: 已处理各周有效 judge_total 的和与个数
+    - last_score: 最后一周的 judge_total（用于 trend）
+
+    Args:
+        df: join_metadata 的输出（与全量计算结果一致），
+            或已持久化的 weekly_panel（其中淘汰后的周已置为 NaN，不再计入累计，
+            只影响淘汰选手淘汰后各周的特征）
+
+    Returns:
+        DataFrame indexed by [season, celebrity_name] with columns:
+        [last_week, score_sum, score_count, last_score]
+    """
+    df = df.sort_values(['season', 'celebrity_name', 'week'])
+    grouped = df.groupby(['season', 'celebrity_name'])
+
+    state = grouped['judge_total'].agg(['sum', 'count']).rename(
+        columns={'sum': 'score_sum', 'count': 'score_count'}
+    )
+    # 取每组最后一行（'last' 会跳过 NaN，这里需要原值）
+    last_rows = grouped.tail(1).set_index(['season', 'celebrity_name'])
+    state['last_week'] = last_rows['week']
+    state['last_score'] = last_rows['judge_total']
+
+    return state[['last_week', 'score_sum', 'score_count', 'last_score']]
+
+
+def append_week_features(new_week_df: pd.DataFrame,
+                         state: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Step 4 增量版：为新一周的行生成衍生特征，并更新累计状态
+
+    只按索引读写本周出现的选手的状态，复杂度为 O(本周选手数)，与历史长度无关；
+    仅当出现新选手（赛季第一周）时才追加状态行。
+    Z-Score 和 is_bottom_2_judge 只依赖当周数据；
+    cumulative_average 和 trend 由 state 中的累计和/个数与上周分数得到。
+
+    Args:
+        new_week_df: 新一周的数据（join_metadata 的输出格式，可含多个赛季的同一周）
+        state: compute_feature_state 或上一次 append_week_features 返回的状态
+
+    Returns:
+        (featured_week_df, state)
+        featured_week_df 的列与 generate_dynamic_features 的输出一致；
+        已有选手的状态原地更新，新选手追加后返回新的 state
+
+    Raises:
+        ValueError: 当新一周不晚于某位选手已处理的最后一周时
+    """
+    df = new_week_df.sort_values(['season', 'celebrity_name', 'week']).reset_index(drop=True)
+
+    if df.duplicated(['season', 'celebrity_name']).any():
+        raise ValueError("new_week_df 中每位选手只能出现一次")
+
+    # 只取本周选手的状态
+    keys = pd.MultiIndex.from_frame(df[['season', 'celebrity_name']])
+    prior = state.reindex(keys)
+
+    if (prior['last_week'].to_numpy() >= df['week'].to_numpy()).any():
+        raise ValueError("新一周必须晚于已处理的最后一周")
+
+    judge_total = df['judge_total'].to_numpy(dtype=np.float64)
+    score_sum = prior['score_sum'].fillna(0).to_numpy(dtype=np.float64)
+    score_count = prior['score_count'].fillna(0).to_numpy(dtype=np.int64)
+
+    # 1. relative_judge_score (Z-Score)
+    df['relative_judge_score'] = _relative_judge_score(df)
+
+    # 2. cumulative_average (截止到上周的平均分)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['cumulative_average'] = np.where(score_count > 0, score_sum / score_count, np.nan)
+
+    # 3. trend (本周分 - 上周分)
+    df['trend'] = judge_total - prior['last_score'].to_numpy(dtype=np.float64)
+
+    # 4. is_bottom_2_judge (是否在倒数两名内)
+    df['is_bottom_2_judge'] = _is_bottom_2_judge(df)
+
+    # 更新状态（在淘汰屏蔽之前，与全量计算的累计口径一致）
+    valid = ~np.isnan(judge_total)
+    updated = pd.DataFrame({
+        'last_week': df['week'].to_numpy(),
+        'score_sum': score_sum + np.where(valid, judge_total, 0.0),
+        'score_count': score_count + valid,
+        'last_score': judge_total,
+    }, index=keys)
+
+    is_new = prior['last_week'].isna().to_numpy()
+    if (~is_new).any():
+        state.loc[keys[~is_new], updated.columns] = updated[~is_new]
+    if is_new.any():
+        state = pd.concat([state, updated[is_new]])
+
+    # 5. 处理淘汰后的分数：将淘汰后的周设为无效
+    df = _mask_eliminated_weeks(df)
+
+    return df, state
+
+
 def create_age_groups(age: float) -> str:
     """将年龄分组"""
     if pd.isna(age):
@@ -284,9 +428,15 @@ def split_train_test(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     return train_df, test_df
 
 
-def run_pipeline(raw_data_path: Path, output_dir: Path) -> None:
+@cached_stage("data_processing", inputs=['raw_data_path'], params=['export_csv'])
+def run_pipeline(raw_data_path: Path, output_dir: Path, export_csv: bool = True) -> None:
     """
     运行完整的数据处理流水线
+
+    Args:
+        raw_data_path: 原始 CSV 路径
+        output_dir: 输出目录（Parquet 产物，见 utils/storage.py）
+        export_csv: 是否同时导出 CSV
     """
     print("=" * 60)
     print("数据处理流水线 (Data Processing Pipeline)")
@@ -327,35 +477,28 @@ def run_pipeline(raw_data_path: Path, output_dir: Path) -> None:
     print(f"  - 训练集 (S1-S27): {train_df.shape}")
     print(f"  - 测试集 (S28-S34): {test_df.shape}")
 
-    # 创建输出目录
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # 保存 weekly_panel.csv
-    weekly_panel_path = output_dir / "weekly_panel.csv"
-    featured_df.to_csv(weekly_panel_path, index=False)
-    print(f"\n[输出] 保存 weekly_panel.csv: {weekly_panel_path}")
+    # 保存为 Parquet（显式 dtype），export_csv=True 时同时导出 CSV
+    # 保存 weekly_panel
+    weekly_panel_path = write_artifact(featured_df, output_dir, "weekly_panel", export_csv)
+    print(f"\n[输出] 保存 weekly_panel: {weekly_panel_path}")
 
-    # 保存 contestant_static.csv
+    # 保存 contestant_static
     static_df = create_contestant_static(featured_df)
-    static_path = output_dir / "contestant_static.csv"
-    static_df.to_csv(static_path, index=False)
-    print(f"[输出] 保存 contestant_static.csv: {static_path}")
+    static_path = write_artifact(static_df, output_dir, "contestant_static", export_csv)
+    print(f"[输出] 保存 contestant_static: {static_path}")
     print(f"  - 选手数量: {len(static_df)}")
 
-    # 保存 season_meta.csv
+    # 保存 season_meta
     season_meta_df = create_season_meta(featured_df)
-    season_path = output_dir / "season_meta.csv"
-    season_meta_df.to_csv(season_path, index=False)
-    print(f"[输出] 保存 season_meta.csv: {season_path}")
+    season_path = write_artifact(season_meta_df, output_dir, "season_meta", export_csv)
+    print(f"[输出] 保存 season_meta: {season_path}")
     print(f"  - 赛季数量: {len(season_meta_df)}")
 
     # 保存训练集和测试集
-    train_path = output_dir / "train_panel.csv"
-    test_path = output_dir / "test_panel.csv"
-    train_df.to_csv(train_path, index=False)
-    test_df.to_csv(test_path, index=False)
-    print(f"[输出] 保存 train_panel.csv: {train_path}")
-    print(f"[输出] 保存 test_panel.csv: {test_path}")
+    train_path = write_artifact(train_df, output_dir, "train_panel", export_csv)
+    test_path = write_artifact(test_df, output_dir, "test_panel", export_csv)
+    print(f"[输出] 保存 train_panel: {train_path}")
+    print(f"[输出] 保存 test_panel: {test_path}")
 
     print("\n" + "=" * 60)
     print("数据处理完成！")
@@ -5,13 +5,15 @@
 import pandas as pd
 from pathlib import Path
 
+from utils.storage import read_artifact
+
 def main():
     processed_dir = Path("F:/Mathematical_modeling/solution/Data/processed")
 
     # 加载数据
-    weekly = pd.read_csv(processed_dir / "weekly_panel.csv")
-    static = pd.read_csv(processed_dir / "contestant_static.csv")
-    season = pd.read_csv(processed_dir / "season_meta.csv")
+    weekly = read_artifact(processed_dir, "weekly_panel")
+    static = read_artifact(processed_dir, "contestant_static")
+    season = read_artifact(processed_dir, "season_meta")
 
     print("=" * 80)
     print("交互式数据查看工具")
@@ -1,22 +1,350 @@
-﻿import sys
+﻿"""
+全流程 DAG 运行器 (Pipeline DAG Runner)
+
+每个阶段声明输入文件、输出文件和入口函数；阶段之间的依赖由
+"某阶段的输入 = 另一阶段的输出" 自动推导。
+
+- 共享数据（数据处理、Ridge V2 训练/测试份额合并）在主进程中只生成一次，
+  下游阶段读取其列式产物
+- 相互独立的分支（Ridge V1 / Ridge V2、各可视化脚本等）提交到进程池并行运行
+- 内部自带进程池的阶段（交叉验证、按赛季并行、分片 SHAP）按 CPU 核数 // 外层进程数
+  分配内层进程数，避免进程池嵌套造成的过量订阅
+- 运行结束后输出每个阶段的耗时
+
+使用方法：
+    python main.py                      # 运行全部阶段
+    python main.py --list               # 列出阶段及依赖
+    python main.py --stages ridge ridge_v2 --jobs 2
+    python main.py --no-cache           # 忽略阶段缓存，全部重新计算
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from config import DATA_DIR, FIGURES_DIR, RAW_DATA
+
+
+class Stage:
+    """
+    流水线中的一个阶段
+
+    Args:
+        name: 阶段名
+        target: 入口函数，格式 "module:function"
+        inputs: 作为输入文件的参数 {参数名: 路径}
+        outputs: 该阶段写出的文件（供下游推导依赖）
+        params: 其余关键字参数（输出目录、超参数等）
+        in_process: 是否在主进程中运行（共享数据准备）
+        cached: 入口函数是否带 @cached_stage（接受 use_cache 参数）
+        nested: 入口函数内部是否自带进程池（接受 n_jobs 参数，由 run_dag 分配）
+    """
+
+    def __init__(self, name: str, target: str,
+                 inputs: Optional[Dict[str, Path]] = None,
+                 outputs: Sequence[Path] = (),
+                 params: Optional[Dict] = None,
+                 in_process: bool = False,
+                 cached: bool = False,
+                 nested: bool = False):
+        self.name = name
+        self.target = target
+        self.inputs = dict(inputs or {})
+        self.outputs = [Path(p) for p in outputs]
+        self.params = dict(params or {})
+        self.in_process = in_process
+        self.cached = cached
+        self.nested = nested
+        self.deps: List[str] = []
+
+    def kwargs(self, use_cache: bool = True, n_jobs: Optional[int] = None) -> Dict:
+        kwargs = {**self.inputs, **self.params}
+        if self.cached:
+            kwargs['use_cache'] = use_cache
+        if self.nested:
+            kwargs.setdefault('n_jobs', n_jobs)
+        return kwargs
+
+
+def build_stages(raw_data: Path = RAW_DATA, data_dir: Path = DATA_DIR,
+                 figures_dir: Path = FIGURES_DIR) -> List[Stage]:
+    """
+    声明全部阶段及其输入输出，并推导依赖
+    """
+    processed = data_dir / "processed"
+    weekly_panel = processed / "weekly_panel.csv"
+    season_meta = processed / "season_meta.csv"
+
+    ridge_dir = data_dir / "models" / "ridge"
+    ridge_scores = ridge_dir / "ridge_fan_scores.csv"
+
+    v2_dir = data_dir / "models" / "ridge_v2"
+    v2_shares = v2_dir / "ridge_fan_vote_shares_v2.csv"
+    v2_shares_test = v2_dir / "ridge_fan_vote_shares_v2_test.csv"
+    v2_shares_all = v2_dir / "ridge_fan_vote_shares_v2_all.csv"
+    v2_model = v2_dir / "ridge_model_v2.bundle"
+
+    rf_dir = data_dir / "models" / "random_forest"
+    rf_model = rf_dir / "random_forest_model.bundle"
+    rf_predictions = rf_dir / "rf_predictions.csv"
+    rf_importance = rf_dir / "feature_importance.csv"
+
+    twin_dir = data_dir / "twin_model"
+    twin_importance = twin_dir / "feature_importance_comparison.csv"
+
+    sim_dir = data_dir / "simulation"
+    sim_results = sim_dir / "simulation_results.csv"
+    sim_cases = sim_dir / "controversy_case_analysis.csv"
+
+    stages = [
+        # 共享数据：主进程中生成一次
+        Stage("data_processing", "data_processing:run_pipeline",
+              inputs={'raw_data_path': raw_data},
+              outputs=[weekly_panel, season_meta],
+              params={'output_dir': processed},
+              in_process=True, cached=True),
+        # 模型
+        Stage("ridge", "models.ridge_model:run_ridge_model",
+              inputs={'data_path': weekly_panel},
+              outputs=[ridge_scores],
+              params={'output_dir': ridge_dir},
+              cached=True),
+        Stage("ridge_v2", "models.ridge_model_v2:run_ridge_model_v2",
+              inputs={'data_path': weekly_panel},
+              outputs=[v2_shares, v2_shares_test, v2_model],
+              params={'output_dir': v2_dir},
+              cached=True),
+        Stage("ridge_v2_merge", "models.counterfactual_simulation:merge_ridge_v2_shares",
+              inputs={'train_path': v2_shares, 'test_path': v2_shares_test},
+              outputs=[v2_shares_all],
+              params={'output_path': v2_shares_all},
+              in_process=True),
+        Stage("random_forest", "models.random_forest_model:run_random_forest_model",
+              inputs={'ridge_results_path': v2_shares, 'weekly_panel_path': weekly_panel},
+              outputs=[rf_model, rf_predictions, rf_importance],
+              params={'output_dir': rf_dir},
+              cached=True, nested=True),
+        Stage("twin_model", "models.twin_model_analysis:run_twin_model_analysis",
+              inputs={'data_path': v2_shares, 'season_meta_path': season_meta},
+              outputs=[twin_importance],
+              params={'output_dir': twin_dir},
+              cached=True, nested=True),
+        Stage("counterfactual_simulation", "models.counterfactual_simulation:run_counterfactual_simulation",
+              inputs={'data_path': v2_shares_all, 'model_path': v2_model, 'panel_path': weekly_panel},
+              outputs=[sim_results, sim_cases],
+              params={'output_dir': sim_dir, 'n_draws': 10000, 'n_feasible_draws': 2000},
+              cached=True, nested=True),
+        Stage("shap_analysis", "shap_analysis:run_shap_analysis",
+              inputs={'model_path': rf_model, 'predictions_path': rf_predictions,
+                      'test_data_path': v2_shares_test},
+              params={'output_dir': figures_dir / "shap_analysis"},
+              nested=True),
+        # 可视化
+        Stage("visualize_ridge", "visualize_ridge:visualize_ridge_results",
+              inputs={'results_path': ridge_scores},
+              params={'output_dir': figures_dir / "ridge"}),
+        Stage("compare_ridge_models", "compare_ridge_models:compare_models",
+              inputs={'v1_path': ridge_scores, 'v2_path': v2_shares},
+              params={'output_dir': figures_dir / "ridge_comparison"}),
+        Stage("visualize_elimination_match", "visualize_elimination_match:visualize_elimination_match_rate",
+              inputs={'data_path': v2_shares},
+              params={'output_dir': figures_dir / "elimination_match_rate"}),
+        Stage("visualize_random_forest", "visualize_random_forest:visualize_random_forest_results",
+              inputs={'importance_path': rf_importance, 'predictions_path': rf_predictions},
+              params={'output_dir': figures_dir / "random_forest"}),
+        Stage("visualize_simulation", "visualize_simulation:visualize_simulation_results",
+              inputs={'results_path': sim_results, 'case_path': sim_cases},
+              params={'output_dir': figures_dir / "simulation"}),
+        Stage("visualize_flip_rate", "visualize_flip_rate:plot_flip_rate_by_season",
+              inputs={'results_path': sim_results},
+              params={'output_dir': figures_dir / "counterfactual", 'mode': "any"}),
+        Stage("visualize_twin_model", "visualize_twin_model:visualize_twin_model_results",
+              inputs={'data_path': v2_shares, 'importance_path': twin_importance,
+                      'simulation_path': sim_results},
+              params={'output_dir': figures_dir / "twin_model"}),
+    ]
+
+    resolve_dependencies(stages)
+    return stages
+
+
+def resolve_dependencies(stages: List[Stage]) -> None:
+    """由输入/输出文件推导每个阶段依赖的上游阶段"""
+    producer: Dict[Path, str] = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if path in producer:
+                raise ValueError(f"{path} is produced by both {producer[path]} and {stage.name}")
+            producer[path] = stage.name
+
+    for stage in stages:
+        deps = {producer[Path(p)] for p in stage.inputs.values() if Path(p) in producer}
+        deps.discard(stage.name)
+        stage.deps = sorted(deps)
+
 
-from config import RAW_DATA
-from utils.data import build_week_panel, load_data
+def _execute_stage(target: str, kwargs: Dict) -> Tuple[float, float, Optional[str]]:
+    """
+    运行一个阶段的入口函数（主进程或进程池工作进程中）
 
+    Returns:
+        (开始时间, 结束时间, 错误信息)；时间均为 time.time()，成功时错误信息为 None
+    """
+    start = time.time()
+    try:
+        module_name, func_name = target.split(":")
+        func = getattr(importlib.import_module(module_name), func_name)
+        func(**kwargs)
+    except Exception:
+        return start, time.time(), traceback.format_exc()
+    return start, time.time(), None
+
+
+def run_dag(stages: List[Stage], max_workers: Optional[int] = None,
+            use_cache: bool = True, inner_jobs: Optional[int] = None) -> pd.DataFrame:
+    """
+    按依赖关系运行阶段
+
+    in_process 阶段在主进程的后台线程中运行，其余阶段在依赖满足后提交到进程池；
+    调度循环同时等待两类任务，主进程阶段运行期间照常回收进程池结果、提交新就绪的阶段。
+    进程池用 forkserver 启动工作进程，不在后台线程运行时 fork 主进程。
+    某阶段失败时，其下游阶段标记为 skipped，其余分支继续运行。
+    不在 stages 中的上游阶段视为已完成（其输出需已存在）。
+
+    Args:
+        max_workers: 进程池大小，默认 CPU 核数
+        inner_jobs: nested 阶段内部进程池的大小，默认 max(1, CPU 核数 // max_workers)
+
+    Returns:
+        每个阶段的耗时表：stage, status, start_sec, end_sec, wall_sec
+    """
+    # 工作进程中只保存图片，不弹出窗口
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+    n_cpus = os.cpu_count() or 1
+    max_workers = max_workers or n_cpus
+    if inner_jobs is None:
+        inner_jobs = max(1, n_cpus // max_workers)
+
+    selected = {stage.name for stage in stages}
+    pending = list(stages)
+    status: Dict[str, str] = {}
+    timings: Dict[str, Tuple[float, float]] = {}
+    running = {}
+
+    t0 = time.time()
+
+    def record(stage: Stage, start: float, end: float, error: Optional[str] = None,
+               state: Optional[str] = None) -> None:
+        if state is None:
+            state = "failed" if error else "done"
+        if error:
+            print(f"[DAG] {stage.name} 出错:\n{error}")
+        status[stage.name] = state
+        timings[stage.name] = (start, end)
+        print(f"[DAG] {stage.name}: {state} ({end - start:.2f}s)")
+
+    pool_context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=pool_context) as executor, \
+            ThreadPoolExecutor(max_workers=1) as main_thread:
+        while pending or running:
+            for stage in list(pending):
+                deps = [d for d in stage.deps if d in selected]
+                if any(status.get(d) in ("failed", "skipped") for d in deps):
+                    pending.remove(stage)
+                    now = time.time()
+                    record(stage, now, now, state="skipped")
+                    continue
+                if not all(status.get(d) == "done" for d in deps):
+                    continue
+
+                pending.remove(stage)
+                kwargs = stage.kwargs(use_cache, n_jobs=inner_jobs)
+                if stage.in_process:
+                    print(f"[DAG] {stage.name}: 主进程运行")
+                    future = main_thread.submit(_execute_stage, stage.target, kwargs)
+                else:
+                    print(f"[DAG] {stage.name}: 提交到进程池")
+                    future = executor.submit(_execute_stage, stage.target, kwargs)
+                running[future] = stage
+
+            if not running:
+                # 剩余阶段只能被跳过，下一轮扫描处理
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record(running.pop(future), *future.result())
+
+    rows = []
+    for stage in stages:
+        start, end = timings[stage.name]
+        rows.append({
+            'stage': stage.name,
+            'status': status[stage.name],
+            'start_sec': start - t0,
+            'end_sec': end - t0,
+            'wall_sec': end - start,
+        })
+    return pd.DataFrame(rows, columns=['stage', 'status', 'start_sec', 'end_sec', 'wall_sec'])
+
+
+def print_timings(timings: pd.DataFrame, total: float) -> None:
+    """输出每个阶段的耗时及并行加速比"""
+    print("\n" + "=" * 60)
+    print("阶段耗时 (Per-stage wall time)")
+    print("=" * 60)
+    print(timings.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+    stage_total = timings['wall_sec'].sum()
+    print(f"\n总耗时: {total:.2f}s, 各阶段耗时之和: {stage_total:.2f}s, "
+          f"并行加速: {stage_total / max(total, 1e-9):.2f}×")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the full modeling pipeline as a DAG")
+    parser.add_argument("--stages", nargs="+", help="只运行这些阶段（上游产物需已存在）")
+    parser.add_argument("--jobs", type=int, default=None, help="进程池大小（默认 CPU 核数）")
+    parser.add_argument("--inner-jobs", type=int, default=None,
+                        help="自带进程池的阶段内部的进程数（默认 CPU 核数 // --jobs）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略阶段缓存")
+    parser.add_argument("--list", action="store_true", help="列出阶段及依赖")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--figures-dir", type=Path, default=FIGURES_DIR)
+    args = parser.parse_args(argv)
 
-def main() -> int:
     if not RAW_DATA.exists():
         print(f"Missing data file: {RAW_DATA}")
         return 1
 
-    df = load_data(RAW_DATA)
-    panel = build_week_panel(df)
+    stages = build_stages(RAW_DATA, args.data_dir, args.figures_dir)
+
+    if args.list:
+        for stage in stages:
+            where = "main" if stage.in_process else "pool"
+            print(f"{stage.name:<30} [{where}] <- {', '.join(stage.deps) or '-'}")
+        return 0
+
+    if args.stages:
+        unknown = set(args.stages) - {stage.name for stage in stages}
+        if unknown:
+            print(f"Unknown stages: {', '.join(sorted(unknown))}")
+            return 1
+        stages = [stage for stage in stages if stage.name in args.stages]
+
+    start = time.time()
+    timings = run_dag(stages, max_workers=args.jobs, use_cache=not args.no_cache,
+                      inner_jobs=args.inner_jobs)
+    print_timings(timings, time.time() - start)
 
-    seasons = panel["season"].nunique(dropna=True)
-    print(f"Loaded {len(df)} contestants, panel rows: {len(panel)}, seasons: {seasons}")
-    print("Next: implement fan vote estimation and scheme simulation.")
-    return 0
+    return 0 if (timings['status'] == "done").all() else 1
 
 
 if __name__ == "__main__":
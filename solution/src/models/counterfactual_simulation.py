@@ -9,12 +9,26 @@ Model C: Counterfactual Simulation - Voting Method Comparison
 4. 计算 Fan Favorability Index (FFI)
 5. 推荐最佳投票机制
 """
+import os
+import sys
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import matplotlib.pyplot as plt
 
+if __name__ == "__main__":
+    # 以脚本方式运行时，添加 src 目录到路径
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.season_replay import SeasonReplayEngine
+from models.voting_rules import DEFAULT_RULES, WeekArrays, _nansum, get_rules
+from utils.cache import cached_stage
+from utils.model_bundle import load_bundle
+from utils.storage import SIMULATION_DTYPES, list_parts, read_table, write_part, write_table
+from utils.week_index import WeekIndex
+
 
 def calculate_fan_favorability_index(judge_scores: pd.Series, fan_votes: pd.Series) -> pd.Series:
     """
@@ -54,68 +68,297 @@ def calculate_fan_favorability_index(judge_scores: pd.Series, fan_votes: pd.Seri
     return ffi
 
 
-class VotingSimulator:
+class ArrayVotingEngine:
     """
-    投票规则模拟器
+    数组化投票规则引擎
 
-    支持三种规则：
-    - Rule A (Rank Sum): 评委排名 + 粉丝排名，总和最大者淘汰
-    - Rule B (Percent Sum): 评委百分比 + 粉丝百分比，总和最小者淘汰
-    - Rule C (Judge Save): Rank Sum 确定倒数两名，评委淘汰评分低者
-    """
+    面板只索引一次：每周的有效行（week_valid）按人数分桶，
+    同一桶内的周排成 (周数, 人数) 的稠密矩阵。每个桶只构建一次
+    WeekArrays，所有规则（见 models/voting_rules.py 的注册表）和 FFI
+    共享其中的排名、百分比等中间量。行内求和与 pandas 对单周 Series
+    求和的顺序相同，排名和并列规则与 VotingSimulator 的逐周实现一致。
 
-    def __init__(self):
-        self.simulation_results = []
+    粉丝投票可以是一个面板 (行数,)，也可以是一批扰动面板 (批数, 行数)。
 
-    def rank_sum_rule(self, judge_scores: pd.Series, fan_votes: pd.Series) -> str:
+    Parameters:
+    -----------
+    data : DataFrame
+        周级数据
+    total_weeks : dict 或 pd.Series, optional
+        赛季 -> 总周数（需要赛季进度的规则使用，如 AWVS），
+        默认取 data 中每个赛季的最大周次
+    """
+
+    def __init__(self, data: pd.DataFrame, total_weeks=None):
+        self.data = data
+        self.names = data['celebrity_name'].to_numpy()
+        self.judge_scores = data['judge_total'].to_numpy(dtype=float)
+        if 'trend' in data.columns:
+            self.trend = data['trend'].to_numpy(dtype=float)
+        else:
+            self.trend = np.zeros(len(data))
+
+        # 全部行的周级索引（实际淘汰者在整周中查找）
+        index = WeekIndex.from_frame(data)
+        actual_col = index.first_true(
+            (data['week'] == data['elimination_week']) & (data['elimination_week'] > 0)
+        )
+
+        # 只模拟有效周（有评委分和粉丝投票），人数 ≤ 2 的周跳过
+        valid = data['week_valid'].to_numpy() == True
+        valid_index = WeekIndex(np.where(valid, index.group_ids, -1))
+        simulated = np.flatnonzero(valid_index.sizes > 2)
+        groups = valid_index.labels[simulated]
+
+        self.n_weeks = len(simulated)
+        self.seasons = index.keys['season'].to_numpy()[groups]
+        self.weeks = index.keys['week'].to_numpy()[groups]
+        self.num_contestants = valid_index.sizes[simulated]
+
+        if total_weeks is None:
+            total_weeks = data.groupby('season')['week'].max()
+        self.total_weeks = pd.Series(total_weeks).reindex(self.seasons).to_numpy(dtype=float)
+
+        # 实际淘汰者的原始行号（没有则为 -1）
+        has_actual = actual_col[groups] >= 0
+        self.actual_row = np.full(self.n_weeks, -1, dtype=np.int64)
+        self.actual_row[has_actual] = index.order[
+            index.offsets[groups[has_actual]] + actual_col[groups[has_actual]]
+        ]
+        # 实际淘汰者在有效行中的位置（不在有效行中则为 -1）
+        self.actual_pos = np.full(self.n_weeks, -1, dtype=np.int64)
+        self.actual_pos[has_actual] = valid_index.position[self.actual_row[has_actual]]
+
+        # 按人数分桶：rows 为 (周数, 人数) 的原始行号矩阵
+        self.buckets = []
+        for size in np.unique(self.num_contestants):
+            members = np.flatnonzero(self.num_contestants == size)
+            starts = valid_index.offsets[simulated[members]]
+            rows = valid_index.order[starts[:, None] + np.arange(size)]
+            self.buckets.append((members, rows))
+
+    def evaluate(self, fan_votes: np.ndarray, judge_scores: np.ndarray = None,
+                 rules: Sequence[str] = DEFAULT_RULES) -> Dict[str, np.ndarray]:
         """
-        Rule A: Rank Sum
-        评委排名 + 粉丝排名，总和最大者淘汰（排名越大越差）
+        对所有模拟周计算各规则的淘汰者和 FFI
+
+        Parameters:
+        -----------
+        fan_votes : np.ndarray
+            (行数,) 或 (批数, 行数)，与 data 的行对齐
+        judge_scores : np.ndarray, optional
+            同形状的评委分，默认使用 data['judge_total']
+        rules : Sequence[str]
+            已注册的规则名，默认为 rank_sum / percent_sum / judge_save
+
+        Returns:
+        --------
+        dict，每个值的形状为 (批数, 周数)（一维输入时为 (周数,)）：
+            <rule>: 淘汰者的原始行号；多人淘汰规则为 (..., n_eliminated)，不足时为 -1
+            ffi_<rule>: 淘汰者的 FFI（形状同上）
+            ffi_actual: 实际淘汰者的 FFI
+            mean_ffi / std_ffi: 当周 FFI 的均值和标准差
         """
-        # 计算排名（降序，1 = 最好）
-        judge_rank = judge_scores.rank(ascending=False, method='min')
-        fan_rank = fan_votes.rank(ascending=False, method='min')
+        fan_votes = np.asarray(fan_votes, dtype=float)
+        single = fan_votes.ndim == 1
+        fan_votes = np.atleast_2d(fan_votes)
+        # 评委分不随抽样变化时只计算一次排名，再沿批维度广播
+        if judge_scores is None:
+            judge_scores = self.judge_scores
+        judge_scores = np.atleast_2d(np.asarray(judge_scores, dtype=float))
+        rules = get_rules(rules)
+
+        n_batch = fan_votes.shape[0]
+        out = {}
+        for rule in rules:
+            shape = (n_batch, self.n_weeks, rule.n_eliminated)
+            out[rule.name] = np.full(shape, -1, dtype=np.int64)
+            out['ffi_' + rule.name] = np.full(shape, np.nan)
+        for key in ['ffi_actual', 'mean_ffi', 'std_ffi']:
+            out[key] = np.full((n_batch, self.n_weeks), np.nan)
+
+        for members, rows in self.buckets:
+            arrays = WeekArrays(
+                judge=judge_scores[:, rows],  # (批数或 1, 周数, 人数)
+                fan=fan_votes[:, rows],       # (批数, 周数, 人数)
+                week=self.weeks[members],
+                total_weeks=self.total_weeks[members],
+                trend=self.trend[rows][None],
+            )
 
-        # 总和最大者淘汰
-        combined_rank = judge_rank + fan_rank
-        eliminated = combined_rank.idxmax()
+            # FFI = (评委排名 - 粉丝排名) / (N - 1)
+            ffi = arrays.ffi
+            count = (~np.isnan(ffi)).sum(axis=-1)
+            mean_ffi = _nansum(ffi) / count
+            squared = np.where(np.isnan(ffi), 0.0, (mean_ffi[..., None] - ffi) ** 2)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                std_ffi = np.where(count > 1, np.sqrt(squared.sum(axis=-1) / (count - 1)), np.nan)
+
+            week_of_bucket = np.arange(len(members))[None, :, None]
+            for rule in rules:
+                pos = rule.select(arrays)  # (批数, 周数, n_eliminated)
+                eliminated = pos >= 0
+                safe_pos = np.maximum(pos, 0)
+                out[rule.name][:, members] = np.where(eliminated, rows[week_of_bucket, safe_pos], -1)
+                out['ffi_' + rule.name][:, members] = np.where(
+                    eliminated, np.take_along_axis(ffi, safe_pos, axis=-1), np.nan
+                )
+
+            actual_pos = self.actual_pos[members]
+            has_actual = actual_pos >= 0
+            ffi_actual = np.take_along_axis(ffi, np.maximum(actual_pos, 0)[None, :, None], axis=-1)[..., 0]
+            out['ffi_actual'][:, members] = np.where(has_actual, ffi_actual, np.nan)
+            out['mean_ffi'][:, members] = mean_ffi
+            out['std_ffi'][:, members] = std_ffi
+
+        # 单人淘汰规则去掉最后一维
+        for rule in rules:
+            if rule.n_eliminated == 1:
+                out[rule.name] = out[rule.name][..., 0]
+                out['ffi_' + rule.name] = out['ffi_' + rule.name][..., 0]
+
+        if single:
+            out = {key: value[0] for key, value in out.items()}
+        return out
+
+
+MONTE_CARLO_RULES = ['rank_sum', 'percent_sum', 'judge_save']
+FLIP_PAIRS = {
+    'rank_vs_percent': ('rank_sum', 'percent_sum'),
+    'rank_vs_judge_save': ('rank_sum', 'judge_save'),
+    'percent_vs_judge_save': ('percent_sum', 'judge_save'),
+}
+
+
+def load_logit_std(model_path: Path) -> float:
+    """
+    从 Ridge V2 模型读取粉丝投票 logit 的噪声尺度 sensitivity × residual_std
 
-        return eliminated
+    FanVoteShare = softmax(sensitivity × residual)，残差的不确定性为 residual_std，
+    因此 logit 的扰动标准差为 sensitivity × residual_std。
+    """
+    meta = load_bundle(model_path).meta
+    return float(meta['sensitivity'] * meta['residual_std'])
 
-    def percent_sum_rule(self, judge_scores: pd.Series, fan_votes: pd.Series) -> str:
-        """
-        Rule B: Percent Sum
-        评委百分比 + 粉丝百分比，总和最小者淘汰
-        """
-        # 计算百分比
-        judge_percent = judge_scores / judge_scores.sum()
-        fan_percent = fan_votes / fan_votes.sum()
 
-        # 总和最小者淘汰
-        combined_percent = judge_percent + fan_percent
-        eliminated = combined_percent.idxmin()
+def _simulate_season_draws(season_df: pd.DataFrame, logit_std: float, n_draws: int,
+                           seed, chunk_size: int, share_draws: np.ndarray = None) -> Dict:
+    """
+    单个赛季的 Monte Carlo 模拟（在进程池工作进程中运行）
 
-        return eliminated
+    每次抽样：logit = log(fan_vote_share) + logit_std × N(0, 1)，
+    再按周 softmax 得到扰动后的粉丝投票份额，三种规则全部计算。
+    份额的对数与 sensitivity × residual 只差一个周内常数，softmax 结果不变。
+    给定 share_draws (抽样数, 行数) 时直接使用这些份额（如可行域抽样）。
+    """
+    season_df = season_df.reset_index(drop=True)
+    engine = ArrayVotingEngine(season_df)
+    week_index = WeekIndex.from_frame(season_df)
+    rng = np.random.default_rng(seed)
 
-    def judge_save_rule(self, judge_scores: pd.Series, fan_votes: pd.Series) -> str:
-        """
-        Rule C: Judge Save
-        Rank Sum 确定倒数两名，评委淘汰评分低者
-        """
-        # 使用 Rank Sum 找出倒数两名
-        judge_rank = judge_scores.rank(ascending=False, method='min')
-        fan_rank = fan_votes.rank(ascending=False, method='min')
-        combined_rank = judge_rank + fan_rank
+    base_logits = np.log(np.clip(season_df['fan_vote_share'].to_numpy(dtype=float), 1e-300, None))
+    n_rows = len(season_df)
+
+    elim_counts = {rule: np.zeros(n_rows, dtype=np.int64) for rule in MONTE_CARLO_RULES}
+    ffi_draws = {rule: [] for rule in MONTE_CARLO_RULES + ['actual']}
+    flips = {pair: [] for pair in list(FLIP_PAIRS) + ['all_different']}
+
+    for start in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws - start)
+
+        if share_draws is not None:
+            shares = share_draws[start:start + size]
+        else:
+            # (行数, 抽样数) —— 每列一次抽样，周内 softmax
+            logits = base_logits[:, None] + logit_std * rng.standard_normal((n_rows, size))
+            shares = week_index.softmax(logits).T
+
+        outcome = engine.evaluate(shares)
+
+        for rule in MONTE_CARLO_RULES:
+            elim_counts[rule] += np.bincount(outcome[rule].ravel(), minlength=n_rows)
+            ffi_draws[rule].append(outcome['ffi_' + rule])
+        ffi_draws['actual'].append(outcome['ffi_actual'])
+
+        for pair, (rule_a, rule_b) in FLIP_PAIRS.items():
+            flips[pair].append(outcome[rule_a] != outcome[rule_b])
+        flips['all_different'].append(
+            ~((outcome['rank_sum'] == outcome['percent_sum']) &
+              (outcome['percent_sum'] == outcome['judge_save']))
+        )
+
+    ffi_draws = {key: np.concatenate(value) for key, value in ffi_draws.items()}
+    flips = {key: np.concatenate(value) for key, value in flips.items()}
+
+    # 每位选手每周在各规则下被淘汰的概率
+    simulated_rows = np.zeros(n_rows, dtype=bool)
+    for _, rows in engine.buckets:
+        simulated_rows[rows.ravel()] = True
+    elimination = season_df.loc[simulated_rows, ['season', 'week', 'celebrity_name', 'fan_vote_share']].copy()
+    for rule in MONTE_CARLO_RULES:
+        elimination[f'p_{rule}'] = elim_counts[rule][simulated_rows] / n_draws
+
+    # 每周的翻转概率和被淘汰者 FFI 分布
+    weekly = pd.DataFrame({
+        'season': engine.seasons,
+        'week': engine.weeks,
+        'num_contestants': engine.num_contestants,
+    })
+    for pair, flipped in flips.items():
+        weekly[f'p_flip_{pair}'] = flipped.mean(axis=0)
+    for rule, values in ffi_draws.items():
+        # 没有实际淘汰者（或其不在有效行中）的周，对应列全为 NaN
+        observed = ~np.isnan(values).all(axis=0)
+        for stat, func in [('mean', lambda v: np.nanmean(v, axis=0)),
+                           ('q025', lambda v: np.nanpercentile(v, 2.5, axis=0)),
+                           ('q975', lambda v: np.nanpercentile(v, 97.5, axis=0))]:
+            column = np.full(engine.n_weeks, np.nan)
+            if observed.any():
+                column[observed] = func(values[:, observed])
+            weekly[f'ffi_{rule}_{stat}'] = column
+
+    # 每次抽样本赛季翻转的周数（在主进程中跨赛季汇总）
+    flip_counts = {pair: flipped.sum(axis=1) for pair, flipped in flips.items()}
+
+    return {
+        'elimination': elimination,
+        'weekly': weekly,
+        'flip_counts': flip_counts,
+        'n_weeks': engine.n_weeks,
+    }
+
+
+def _simulate_season_to_part(season_df: pd.DataFrame, parts_dir: Path, part: str) -> Tuple[str, int]:
+    """
+    模拟单个赛季并直接写出结果分片（在进程池工作进程中运行）
+
+    Returns:
+        (分片名, 模拟周数)
+    """
+    results_df = VotingSimulator().simulate_all_weeks(season_df)
+    write_part(results_df, parts_dir, part, SIMULATION_DTYPES)
+    return part, len(results_df)
+
+
+class VotingSimulator:
+    """
+    投票规则模拟器
 
-        # 找出倒数两名
-        bottom_two = combined_rank.nlargest(2).index
+    规则均来自 models/voting_rules.py 的注册表：
+    - rank_sum: 评委排名 + 粉丝排名，总和最大者淘汰
+    - percent_sum: 评委百分比 + 粉丝百分比，总和最小者淘汰
+    - judge_save: Rank Sum 确定倒数两名，评委淘汰评分低者
+    - 其余已注册规则（如 AWVS）
 
-        # 评委淘汰评分低者
-        eliminated = judge_scores.loc[bottom_two].idxmin()
+    simulate_week 评估单个规则，simulate_rules 在一次遍历中评估全部已注册规则。
+    """
 
-        return eliminated
+    def __init__(self):
+        self.simulation_results = []
+        self.monte_carlo_results = {}
+        self.replay_results = None
 
-    def simulate_week(self, week_df: pd.DataFrame, rule: str) -> str:
+    def simulate_week(self, week_df: pd.DataFrame, rule: str, total_weeks: int = None):
         """
         模拟单周的淘汰结果
 
@@ -124,35 +367,37 @@ class VotingSimulator:
         week_df : DataFrame
             当周的数据，包含 judge_total 和 fan_vote_share
         rule : str
-            规则名称：'rank_sum', 'percent_sum', 'judge_save'
+            已注册的规则名（见 models/voting_rules.py），如 'rank_sum', 'percent_sum', 'judge_save'
+        total_weeks : int, optional
+            赛季总周数（AWVS 等需要赛季进度的规则使用）
 
         Returns:
         --------
         eliminated : str
-            被淘汰的选手名字
+            被淘汰的选手名字；多人淘汰规则返回名字列表
         """
+        voting_rule = get_rules([rule])[0]
+
         if len(week_df) <= 2:
             # 人数太少，不模拟
             return None
 
-        judge_scores = week_df['judge_total']
-        fan_votes = week_df['fan_vote_share']
+        def week_array(column):
+            return week_df[column].to_numpy(dtype=float)[None, None, :]
 
-        # 设置 index 为选手名字
-        judge_scores.index = week_df['celebrity_name']
-        fan_votes.index = week_df['celebrity_name']
+        arrays = WeekArrays(
+            judge=week_array('judge_total'),
+            fan=week_array('fan_vote_share'),
+            week=week_df['week'].to_numpy()[:1] if 'week' in week_df.columns else np.zeros(1),
+            total_weeks=None if total_weeks is None else [total_weeks],
+            trend=week_array('trend') if 'trend' in week_df.columns else None,
+        )
+        pos = voting_rule.select(arrays)[0, 0]
+        eliminated = week_df['celebrity_name'].to_numpy()[pos[pos >= 0]]
 
-        if rule == 'rank_sum':
-            return self.rank_sum_rule(judge_scores, fan_votes)
-        elif rule == 'percent_sum':
-            return self.percent_sum_rule(judge_scores, fan_votes)
-        elif rule == 'judge_save':
-            if len(week_df) >= 3:
-                return self.judge_save_rule(judge_scores, fan_votes)
-            else:
-                return None
-        else:
-            raise ValueError(f"Unknown rule: {rule}")
+        if voting_rule.n_eliminated == 1:
+            return eliminated[0]
+        return list(eliminated)
 
     def simulate_all_weeks(self, data: pd.DataFrame) -> pd.DataFrame:
         """
@@ -163,57 +408,32 @@ class VotingSimulator:
         results_df : DataFrame
             包含每周三种规则下的淘汰结果
         """
-        results = []
-
-        for (season, week), group in data.groupby(['season', 'week']):
-            # 只模拟有效周（有评委分和粉丝投票）
-            valid_group = group[group['week_valid'] == True].copy()
-
-            if len(valid_group) <= 2:
-                continue
-
-            # 模拟三种规则
-            eliminated_rank_sum = self.simulate_week(valid_group, 'rank_sum')
-            eliminated_percent_sum = self.simulate_week(valid_group, 'percent_sum')
-            eliminated_judge_save = self.simulate_week(valid_group, 'judge_save')
-
-            # 实际淘汰者
-            actual_eliminated_mask = (
-                (group['week'] == group['elimination_week']) &
-                (group['elimination_week'] > 0)
-            )
-            actual_eliminated = group[actual_eliminated_mask]['celebrity_name'].values
-            actual_eliminated = actual_eliminated[0] if len(actual_eliminated) > 0 else None
-
-            # 计算 FFI
-            judge_scores = valid_group.set_index('celebrity_name')['judge_total']
-            fan_votes = valid_group.set_index('celebrity_name')['fan_vote_share']
-            ffi_values = calculate_fan_favorability_index(judge_scores, fan_votes)
+        engine = ArrayVotingEngine(data)
+        outcome = engine.evaluate(data['fan_vote_share'].to_numpy(dtype=float))
+        names = engine.names
 
-            # 获取被淘汰者的 FFI
-            ffi_rank_sum = ffi_values.get(eliminated_rank_sum, np.nan) if eliminated_rank_sum else np.nan
-            ffi_percent_sum = ffi_values.get(eliminated_percent_sum, np.nan) if eliminated_percent_sum else np.nan
-            ffi_judge_save = ffi_values.get(eliminated_judge_save, np.nan) if eliminated_judge_save else np.nan
-            ffi_actual = ffi_values.get(actual_eliminated, np.nan) if actual_eliminated else np.nan
-
-            # 计算该周的平均 FFI 和标准差
-            mean_ffi = ffi_values.mean()
-            std_ffi = ffi_values.std()
+        results = []
+        for w in range(engine.n_weeks):
+            eliminated_rank_sum = names[outcome['rank_sum'][w]]
+            eliminated_percent_sum = names[outcome['percent_sum'][w]]
+            eliminated_judge_save = names[outcome['judge_save'][w]]
+            actual_row = engine.actual_row[w]
+            actual_eliminated = names[actual_row] if actual_row >= 0 else None
 
             results.append({
-                'season': season,
-                'week': week,
-                'num_contestants': len(valid_group),
+                'season': engine.seasons[w],
+                'week': engine.weeks[w],
+                'num_contestants': int(engine.num_contestants[w]),
                 'actual_eliminated': actual_eliminated,
                 'rank_sum_eliminated': eliminated_rank_sum,
                 'percent_sum_eliminated': eliminated_percent_sum,
                 'judge_save_eliminated': eliminated_judge_save,
-                'ffi_actual': ffi_actual,
-                'ffi_rank_sum': ffi_rank_sum,
-                'ffi_percent_sum': ffi_percent_sum,
-                'ffi_judge_save': ffi_judge_save,
-                'mean_ffi': mean_ffi,
-                'std_ffi': std_ffi,
+                'ffi_actual': outcome['ffi_actual'][w],
+                'ffi_rank_sum': outcome['ffi_rank_sum'][w],
+                'ffi_percent_sum': outcome['ffi_percent_sum'][w],
+                'ffi_judge_save': outcome['ffi_judge_save'][w],
+                'mean_ffi': outcome['mean_ffi'][w],
+                'std_ffi': outcome['std_ffi'][w],
                 'rank_vs_percent_same': (eliminated_rank_sum == eliminated_percent_sum),
                 'rank_vs_judge_save_same': (eliminated_rank_sum == eliminated_judge_save),
                 'percent_vs_judge_save_same': (eliminated_percent_sum == eliminated_judge_save),
@@ -225,6 +445,229 @@ class VotingSimulator:
 
         return results_df
 
+    def simulate_rules(self, data: pd.DataFrame, rules: Sequence[str] = None,
+                       total_weeks=None) -> pd.DataFrame:
+        """
+        一次遍历评估任意多条已注册规则
+
+        Parameters:
+        -----------
+        data : DataFrame
+            包含 judge_total 和 fan_vote_share 的周级数据
+        rules : Sequence[str], optional
+            规则名，默认为全部已注册规则（见 models/voting_rules.py）
+        total_weeks : dict 或 pd.Series, optional
+            赛季 -> 总周数，默认取 data 中每个赛季的最大周次
+
+        Returns:
+        --------
+        rules_df : DataFrame
+            每周一行：<rule>_eliminated 和 ffi_<rule>；
+            多人淘汰规则为 <rule>_eliminated_1..k 和 ffi_<rule>_1..k
+        """
+        voting_rules = get_rules(rules)
+        engine = ArrayVotingEngine(data, total_weeks=total_weeks)
+        outcome = engine.evaluate(data['fan_vote_share'].to_numpy(dtype=float),
+                                  rules=[rule.name for rule in voting_rules])
+        names = np.append(engine.names, None)  # 行号 -1 对应 None
+
+        rules_df = pd.DataFrame({
+            'season': engine.seasons,
+            'week': engine.weeks,
+            'num_contestants': engine.num_contestants.astype(int),
+            'actual_eliminated': names[engine.actual_row],
+            'ffi_actual': outcome['ffi_actual'],
+        })
+        for rule in voting_rules:
+            eliminated = outcome[rule.name]
+            ffi = outcome['ffi_' + rule.name]
+            if rule.n_eliminated == 1:
+                rules_df[f'{rule.name}_eliminated'] = names[eliminated]
+                rules_df[f'ffi_{rule.name}'] = ffi
+            else:
+                for k in range(rule.n_eliminated):
+                    rules_df[f'{rule.name}_eliminated_{k + 1}'] = names[eliminated[:, k]]
+                    rules_df[f'ffi_{rule.name}_{k + 1}'] = ffi[:, k]
+
+        return rules_df
+
+    def summarize_rules(self, rules_df: pd.DataFrame, rules: Sequence[str] = None) -> pd.DataFrame:
+        """
+        汇总 simulate_rules 的结果，每条规则一行
+
+        - actual_match_rate: 有实际淘汰者的周中，规则淘汰者（之一）与实际一致的比例
+        - flip_vs_rank_sum: 与 Rank Sum 淘汰者不同的周比例
+        - mean_ffi / positive_rate: 被淘汰者 FFI 的均值和粉丝更喜欢的比例
+        """
+        has_actual = rules_df['actual_eliminated'].notna()
+        summary = []
+
+        for rule in get_rules(rules):
+            if rule.n_eliminated == 1:
+                elim_cols = [f'{rule.name}_eliminated']
+                ffi_cols = [f'ffi_{rule.name}']
+            else:
+                elim_cols = [f'{rule.name}_eliminated_{k + 1}' for k in range(rule.n_eliminated)]
+                ffi_cols = [f'ffi_{rule.name}_{k + 1}' for k in range(rule.n_eliminated)]
+
+            matched = np.zeros(len(rules_df), dtype=bool)
+            for col in elim_cols:
+                matched |= (rules_df[col] == rules_df['actual_eliminated']).to_numpy()
+            ffi = rules_df[ffi_cols].stack().dropna()
+
+            row = {
+                'rule': rule.name,
+                'selection': rule.selection,
+                'n_eliminated': rule.n_eliminated,
+                'actual_match_rate': matched[has_actual.to_numpy()].mean() if has_actual.any() else np.nan,
+                'flip_vs_rank_sum': np.nan,
+                'mean_ffi': ffi.mean(),
+                'positive_rate': (ffi > 0).mean(),
+                'description': rule.description,
+            }
+            if 'rank_sum_eliminated' in rules_df.columns:
+                row['flip_vs_rank_sum'] = (rules_df[elim_cols[0]] != rules_df['rank_sum_eliminated']).mean()
+            summary.append(row)
+
+        return pd.DataFrame(summary)
+
+    def simulate_all_weeks_streaming(self, data: pd.DataFrame, parts_dir: Path,
+                                     n_jobs: int = None, resume: bool = True) -> Path:
+        """
+        按赛季分片并行模拟，完成一个赛季就写出一个结果分片
+
+        主进程不累积结果，同时在途的赛季不超过 2 × 进程数，内存占用有上界；
+        分片原子写入，中断后已完成的赛季保留在 parts_dir 中，
+        resume=True 时重新运行会跳过这些赛季。
+        全部完成后可用 utils.storage.read_parts(parts_dir) 读取，
+        结果与 simulate_all_weeks(data) 相同。
+
+        Parameters:
+        -----------
+        data : DataFrame
+            包含 judge_total 和 fan_vote_share 的周级数据
+        parts_dir : Path
+            分片目录，每个赛季一个 season_XXXX.parquet
+        n_jobs : int
+            进程数；1 时在当前进程中顺序运行，None 时使用 CPU 核数
+        resume : bool
+            是否跳过已有分片的赛季
+
+        Returns:
+        --------
+        parts_dir : Path
+        """
+        parts_dir = Path(parts_dir)
+        done = {path.stem for path in list_parts(parts_dir)} if resume else set()
+
+        pending = []
+        for season in sorted(data['season'].unique()):
+            part = f"season_{int(season):04d}"
+            if part not in done:
+                pending.append((season, part))
+
+        print(f"  - 待模拟赛季: {len(pending)}（已完成 {len(done)}）")
+
+        def season_task(season, part):
+            return data[data['season'] == season], parts_dir, part
+
+        if n_jobs == 1:
+            for season, part in pending:
+                _simulate_season_to_part(*season_task(season, part))
+            return parts_dir
+
+        n_workers = n_jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            max_in_flight = 2 * n_workers
+            tasks = iter(pending)
+            running = set()
+
+            while True:
+                # 补充任务，保持在途赛季数有上界
+                for season, part in tasks:
+                    running.add(executor.submit(_simulate_season_to_part, *season_task(season, part)))
+                    if len(running) >= max_in_flight:
+                        break
+
+                if not running:
+                    break
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    part, n_weeks = future.result()
+                    print(f"  - {part}: {n_weeks} 周")
+
+        return parts_dir
+
+    def simulate_monte_carlo(self, data: pd.DataFrame, logit_std: float,
+                             n_draws: int = 10000, seed: int = 42,
+                             chunk_size: int = 2000, n_jobs: int = None,
+                             share_draws: np.ndarray = None) -> Dict[str, pd.DataFrame]:
+        """
+        Monte Carlo 不确定性传播
+
+        按 Ridge V2 的残差标准差对每周粉丝投票份额做 n_draws 次扰动抽样，
+        每次抽样都运行三种规则。抽样按 (抽样数 × 选手数) 批量计算，
+        各赛季在进程池中并行；每个赛季的随机种子由 seed 派生，结果与进程数无关。
+
+        Parameters:
+        -----------
+        data : DataFrame
+            包含 fan_vote_share 的周级数据
+        logit_std : float
+            logit 扰动标准差（sensitivity × residual_std，见 load_logit_std）
+        n_draws : int
+            抽样次数
+        seed : int
+            随机种子
+        chunk_size : int
+            每批抽样数（控制内存）
+        n_jobs : int
+            进程数；1 时在当前进程中顺序运行，None 时使用 CPU 核数
+        share_draws : np.ndarray, optional
+            (抽样数, len(data)) 的粉丝份额抽样，与 data 的行对齐
+            （如 FeasibleSamples.align(data)）；给定时不再做 logit 扰动，
+            logit_std 被忽略，n_draws 取其行数
+
+        Returns:
+        --------
+        results : Dict[str, DataFrame]
+            elimination: 每位选手每周在各规则下的淘汰概率
+            weekly: 每周的翻转概率及被淘汰者 FFI 的均值和 95% 区间
+            flip_rate_draws: 每次抽样的全局翻转率（翻转率的分布）
+        """
+        seasons = sorted(data['season'].unique())
+        seeds = np.random.SeedSequence(seed).spawn(len(seasons))
+        if share_draws is not None:
+            n_draws = share_draws.shape[0]
+        tasks = [
+            (data[data['season'] == season], logit_std, n_draws, season_seed, chunk_size,
+             None if share_draws is None else share_draws[:, (data['season'] == season).to_numpy()])
+            for season, season_seed in zip(seasons, seeds)
+        ]
+
+        if n_jobs == 1:
+            season_results = [_simulate_season_draws(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                season_results = list(executor.map(_simulate_season_draws, *zip(*tasks)))
+
+        total_weeks = sum(result['n_weeks'] for result in season_results)
+        flip_rate_draws = pd.DataFrame({
+            pair: sum(result['flip_counts'][pair] for result in season_results) / max(total_weeks, 1)
+            for pair in season_results[0]['flip_counts']
+        })
+        flip_rate_draws.insert(0, 'draw', np.arange(n_draws))
+
+        results = {
+            'elimination': pd.concat([r['elimination'] for r in season_results], ignore_index=True),
+            'weekly': pd.concat([r['weekly'] for r in season_results], ignore_index=True),
+            'flip_rate_draws': flip_rate_draws,
+        }
+        self.monte_carlo_results = results
+
+        return results
+
     def calculate_flip_rate(self, results_df: pd.DataFrame) -> Dict[str, float]:
         """
         计算翻转率（不同规则产生不同结果的频率）
@@ -240,8 +683,24 @@ class VotingSimulator:
 
         return flip_rates
 
+    def replay_seasons(self, data: pd.DataFrame, rules: Sequence[str] = DEFAULT_RULES,
+                       total_weeks=None) -> pd.DataFrame:
+        """
+        整季顺序回放：被淘汰者不再参加之后的周（见 models/season_replay.py）
+
+        Returns:
+        --------
+        replay_df : DataFrame
+            每个 (赛季, 选手) 一行：历史淘汰周和名次，
+            以及各规则下的 <rule>_elimination_week 和 <rule>_placement
+        """
+        replay_df = SeasonReplayEngine(data, total_weeks=total_weeks).replay_frame(rules)
+        self.replay_results = replay_df
+        return replay_df
+
     def analyze_controversy_cases(self, data: pd.DataFrame, results_df: pd.DataFrame,
-                                   cases: List[Tuple[str, int]]) -> pd.DataFrame:
+                                   cases: List[Tuple[str, int]],
+                                   replay_df: pd.DataFrame = None) -> pd.DataFrame:
         """
         分析争议案例
 
@@ -253,6 +712,8 @@ class VotingSimulator:
             模拟结果
         cases : List[Tuple[str, int]]
             争议案例列表，格式：[(选手名, 赛季), ...]
+        replay_df : DataFrame, optional
+            replay_seasons 的结果；提供时额外给出整季回放下的淘汰周和名次
 
         Returns:
         --------
@@ -298,6 +759,17 @@ class VotingSimulator:
                     'saved_by_rule': (simulated_elim_week is None or simulated_elim_week > actual_elim_week)
                 })
 
+                if replay_df is not None:
+                    replay_row = replay_df[
+                        (replay_df['season'] == season) &
+                        (replay_df['celebrity_name'] == celebrity_name)
+                    ].iloc[0]
+                    case_results[-1].update({
+                        'actual_placement': replay_row['placement'],
+                        'replay_elimination_week': replay_row[f'{rule}_elimination_week'],
+                        'replay_placement': replay_row[f'{rule}_placement'],
+                    })
+
         case_analysis_df = pd.DataFrame(case_results)
 
         return case_analysis_df
@@ -419,9 +891,30 @@ class VotingSimulator:
         return reasoning
 
 
-def run_counterfactual_simulation(data_path: Path, output_dir: Path):
+def merge_ridge_v2_shares(train_path: Path, test_path: Path, output_path: Path) -> pd.DataFrame:
+    """
+    合并 Ridge V2 训练集与测试集的投票份额，覆盖全部 34 个赛季
+    """
+    train_df = read_table(train_path)
+    test_df = read_table(test_path)
+    combined_df = pd.concat([train_df, test_df], ignore_index=True)
+    write_table(combined_df, output_path)
+    return combined_df
+
+
+@cached_stage("counterfactual_simulation", inputs=['data_path', 'model_path', 'panel_path'],
+              params=['n_draws', 'seed', 'n_feasible_draws'])
+def run_counterfactual_simulation(data_path: Path, output_dir: Path,
+                                  model_path: Path = None, n_draws: int = 0, seed: int = 42,
+                                  panel_path: Path = None, n_feasible_draws: int = 0,
+                                  n_jobs: int = None):
     """
     运行完整的反事实模拟
+
+    提供 Ridge V2 模型路径且 n_draws > 0 时，额外运行 Monte Carlo 不确定性传播。
+    提供周级面板且 n_feasible_draws > 0 时，在与实际淘汰一致的可行域上抽样
+    粉丝份额（models/feasible_sampler.py），并用这些抽样再做一次不确定性传播。
+    n_jobs 为点估计求解和 Monte Carlo 按赛季并行的进程数。
     """
     print("=" * 80)
     print("Model C: Counterfactual Simulation - Voting Method Comparison")
@@ -429,7 +922,7 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
 
     # 1. 加载数据
     print("\n[Step 1] 加载 Ridge V2 的粉丝投票份额")
-    data = pd.read_csv(data_path)
+    data = read_table(data_path)
     print(f"  - 数据形状: {data.shape}")
     print(f"  - 赛季范围: {data['season'].min()} - {data['season'].max()}")
 
@@ -446,6 +939,23 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
     results_df = simulator.simulate_all_weeks(data)
     print(f"\n  - 模拟了 {len(results_df)} 周")
 
+    # 全部已注册规则（含 AWVS）一次遍历评估
+    rules_df = simulator.simulate_rules(data)
+    rule_summary = simulator.summarize_rules(rules_df)
+    print(f"\n[已注册规则对比]")
+    for _, row in rule_summary.iterrows():
+        print(f"  - {row['rule']}: 与实际一致 {row['actual_match_rate']:.2%}, "
+              f"与 Rank Sum 不同 {row['flip_vs_rank_sum']:.2%}, 平均 FFI {row['mean_ffi']:.3f}")
+
+    # 淘汰边界：每位选手安全所需的最低粉丝份额
+    from models.elimination_margins import compute_elimination_margins
+
+    margins_df = compute_elimination_margins(data)
+    print(f"\n[淘汰边界] 份额距临界值不足 1 个百分点的选手-周")
+    for rule in ['rank_sum', 'percent_sum', 'judge_save']:
+        close = (margins_df[f'{rule}_margin'].abs() < 0.01).sum()
+        print(f"  - {rule}: {close} / {len(margins_df)}")
+
     # 4. 计算翻转率
     print("\n[Step 4] 计算翻转率")
     flip_rates = simulator.calculate_flip_rate(results_df)
@@ -499,7 +1009,9 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
         if ((data['celebrity_name'] == name) & (data['season'] == season)).any():
             available_cases.append((name, season))
 
-    case_analysis = simulator.analyze_controversy_cases(data, results_df, available_cases)
+    # 整季顺序回放：被淘汰者不再参加之后的周
+    replay_df = simulator.replay_seasons(data)
+    case_analysis = simulator.analyze_controversy_cases(data, results_df, available_cases, replay_df)
 
     if len(case_analysis) > 0:
         print(f"\n[争议案例分析]")
@@ -513,17 +1025,32 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
                 sim_week = row['simulated_elimination_week']
                 saved = "[+] Survived longer" if row['saved_by_rule'] else "[-] Eliminated earlier"
                 print(f"    - {row['rule']}: Week {sim_week} {saved if sim_week else '(Not eliminated)'}")
+                replay_week = row['replay_elimination_week']
+                print(f"      整季回放: 名次 {row['replay_placement']} (实际 {row['actual_placement']}), "
+                      f"{'进入决赛' if replay_week >= 999 else f'第 {replay_week} 周淘汰'}")
 
     # 8. 保存结果
     output_dir.mkdir(parents=True, exist_ok=True)
 
     results_path = output_dir / "simulation_results.csv"
-    results_df.to_csv(results_path, index=False)
+    write_table(results_df, results_path)
     print(f"\n[保存] 模拟结果: {results_path}")
 
+    margins_path = output_dir / "elimination_margins.csv"
+    write_table(margins_df, margins_path)
+    print(f"[保存] 淘汰边界: {margins_path}")
+
+    replay_path = output_dir / "season_replay.csv"
+    write_table(replay_df, replay_path)
+    print(f"[保存] 整季回放: {replay_path}")
+
+    rule_summary_path = output_dir / "rule_comparison.csv"
+    write_table(rule_summary, rule_summary_path)
+    print(f"[保存] 规则对比: {rule_summary_path}")
+
     if len(case_analysis) > 0:
         case_path = output_dir / "controversy_case_analysis.csv"
-        case_analysis.to_csv(case_path, index=False)
+        write_table(case_analysis, case_path)
         print(f"[保存] 争议案例分析: {case_path}")
 
     # 保存推荐结果
@@ -543,6 +1070,61 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
                 f.write(f"  - {metric}: {value:.3f}\n")
     print(f"[保存] 推荐报告: {recommendation_path}")
 
+    # 9. Monte Carlo 不确定性传播
+    if model_path is not None and n_draws > 0:
+        print(f"\n[Step 8] Monte Carlo 不确定性传播（{n_draws} 次抽样）")
+        logit_std = load_logit_std(model_path)
+        print(f"  - logit 扰动标准差 (sensitivity × residual_std): {logit_std:.4f}")
+
+        mc_results = simulator.simulate_monte_carlo(data, logit_std, n_draws=n_draws, seed=seed,
+                                                    n_jobs=n_jobs)
+
+        flip_draws = mc_results['flip_rate_draws']
+        print(f"\n[翻转率分布] 均值 [95% 区间]")
+        for pair in ['rank_vs_percent', 'rank_vs_judge_save', 'percent_vs_judge_save', 'all_different']:
+            values = flip_draws[pair]
+            print(f"  - {pair}: {values.mean():.2%} "
+                  f"[{values.quantile(0.025):.2%}, {values.quantile(0.975):.2%}]")
+
+        for name, df in mc_results.items():
+            mc_path = output_dir / f"monte_carlo_{name}.csv"
+            write_table(df, mc_path)
+            print(f"[保存] Monte Carlo {name}: {mc_path}")
+
+    # 10. 可行域抽样的不确定性传播
+    if panel_path is not None and n_feasible_draws > 0:
+        from models.feasible_sampler import ESS_FLOOR, RHAT_LIMIT, sample_feasible_shares
+
+        n_chains = 4
+        print(f"\n[Step 9] 可行域抽样（{n_chains} 条链 × {n_feasible_draws // n_chains} 个样本）")
+        panel = read_table(panel_path)
+        samples = sample_feasible_shares(panel, n_chains=n_chains,
+                                         n_samples=n_feasible_draws // n_chains, seed=seed,
+                                         config={'n_jobs': n_jobs})
+        ess, rhat = samples.weekly['ess_min'], samples.weekly['rhat_max']
+        sampler = samples.weekly['sampler']
+        print(f"  - 精确抽样的周: {(sampler == 'exact').sum()} / {len(sampler)}，"
+              f"无法复现淘汰结果（不抽样）的周: {(sampler == 'infeasible').sum()}")
+        print(f"  - 每周最小 ESS 中位数: {ess.median():.0f}，低于 {ESS_FLOOR} 的周: "
+              f"{(ess < ESS_FLOOR).sum()} / {len(ess)}，R-hat > {RHAT_LIMIT} 的周: {(rhat > RHAT_LIMIT).sum()}")
+
+        write_table(samples.weekly, output_dir / "feasible_sampler_diagnostics.csv")
+        write_table(samples.summary(), output_dir / "feasible_share_intervals.csv")
+
+        feasible_results = simulator.simulate_monte_carlo(
+            data, logit_std=None, seed=seed, share_draws=samples.align(data), n_jobs=n_jobs
+        )
+        flip_draws = feasible_results['flip_rate_draws']
+        print(f"\n[翻转率分布（可行域抽样）] 均值 [95% 区间]")
+        for pair in ['rank_vs_percent', 'rank_vs_judge_save', 'percent_vs_judge_save', 'all_different']:
+            values = flip_draws[pair]
+            print(f"  - {pair}: {values.mean():.2%} "
+                  f"[{values.quantile(0.025):.2%}, {values.quantile(0.975):.2%}]")
+
+        for name, df in feasible_results.items():
+            write_table(df, output_dir / f"monte_carlo_feasible_{name}.csv")
+        print(f"[保存] 可行域抽样结果: {output_dir}")
+
     print("\n" + "=" * 80)
     print("Model C 模拟完成！")
     print("=" * 80)
@@ -551,11 +1133,6 @@ def run_counterfactual_simulation(data_path: Path, output_dir: Path):
 
 
 if __name__ == "__main__":
-    import sys
-    from pathlib import Path
-    # 添加 src 目录到路径
-    src_dir = Path(__file__).resolve().parents[1]
-    sys.path.insert(0, str(src_dir))
     from config import DATA_DIR
 
     # Load both training and test data to cover all 34 seasons
@@ -563,14 +1140,13 @@ if __name__ == "__main__":
     test_path = DATA_DIR / "models" / "ridge_v2" / "ridge_fan_vote_shares_v2_test.csv"
 
     # Merge train and test data
-    train_df = pd.read_csv(train_path)
-    test_df = pd.read_csv(test_path)
-    combined_df = pd.concat([train_df, test_df], ignore_index=True)
-
-    # Save combined data temporarily
     temp_path = DATA_DIR / "models" / "ridge_v2" / "ridge_fan_vote_shares_v2_all.csv"
-    combined_df.to_csv(temp_path, index=False)
+    merge_ridge_v2_shares(train_path, test_path, temp_path)
 
     output_dir = DATA_DIR / "simulation"
+    model_path = DATA_DIR / "models" / "ridge_v2" / "ridge_model_v2.bundle"
 
-    simulator, results, cases, recommendation = run_counterfactual_simulation(temp_path, output_dir)
+    simulator, results, cases, recommendation = run_counterfactual_simulation(
+        temp_path, output_dir, model_path=model_path, n_draws=10000,
+        panel_path=DATA_DIR / "processed" / "weekly_panel.csv", n_feasible_draws=2000
+    )
@@ -0,0 +1,222 @@
+"""
+淘汰边界分析 (Elimination Margins)
+
+对每周每位选手，求出其粉丝份额的临界值：份额高于临界值时一定安全，
+低于临界值时（至少在某些份额上）会被淘汰。改变选手 i 的份额 s 时，
+其他选手按原比例分配剩余的 1 - s：f_j' = f_j × (1 - s) / (1 - f_i)。
+
+- percent_sum（闭式解）：i 安全当且仅当存在 j 使 jp_i + s ≥ jp_j + f_j'，
+  对每个 j 解线性方程得 s_j = (c·jp_j + f_j - c·jp_i) / (c + f_j)，c = 1 - f_i，
+  临界值为 min_j s_j
+- rank_sum / judge_save（排序阈值搜索）：i 的份额越过 f_j / (1 - f_i + f_j)
+  时排名超过 j。这些交叉点把 [0, 1] 分成至多 n 个区间，区间内所有排名不变；
+  由排序后的评委排名、粉丝份额和前缀 / 后缀最危险的两人直接判断每个区间的
+  淘汰者，每周 O(n log n + n²)。
+  临界值为此后所有区间都安全的最小交叉点（judge_save 不一定单调）
+
+所有周按人数分桶一次性计算，不做逐份额的暴力模拟。
+"""
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.counterfactual_simulation import ArrayVotingEngine
+from models.voting_rules import DEFAULT_RULES
+
+# 排名类规则：淘汰结果只取决于排名，在交叉点之间分段不变
+RANK_RULES = ('rank_sum', 'judge_save')
+
+
+def percent_thresholds(judge: np.ndarray, fan: np.ndarray) -> np.ndarray:
+    """
+    percent_sum 下每位选手的安全临界份额（闭式解）
+
+    Parameters:
+    -----------
+    judge, fan : np.ndarray
+        (周数, 人数)；fan 为当周归一化后的份额
+
+    Returns:
+    --------
+    thresholds : np.ndarray
+        (周数, 人数)，取值 [0, 1]
+    """
+    judge_percent = judge / judge.sum(axis=-1, keepdims=True)
+    jp_i = judge_percent[..., :, None]
+    jp_j = judge_percent[..., None, :]
+    c = 1 - fan[..., :, None]
+    f_j = fan[..., None, :]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = (c * jp_j + f_j - c * jp_i) / (c + f_j)
+    n = fan.shape[-1]
+    s[..., np.arange(n), np.arange(n)] = np.inf
+    return np.clip(np.nanmin(s, axis=-1), 0.0, 1.0)
+
+
+def _sorted_min_rank(x: np.ndarray):
+    """
+    最后一维的降序排序和 min 排名（与 pandas rank(ascending=False, method='min') 一致）
+
+    排序一次后由并列组的起点得到排名，O(n log n)；x 中不能有 NaN。
+
+    Returns:
+        (order, rank)：降序排列的位置 (..., 人数) 和原位置上的排名 (..., 人数)
+    """
+    n = x.shape[-1]
+    order = np.argsort(-x, axis=-1, kind='stable')
+    ordered = np.take_along_axis(x, order, axis=-1)
+    start = np.ones(x.shape, dtype=bool)
+    start[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    group_start = np.maximum.accumulate(np.where(start, np.arange(n), 0), axis=-1)
+    rank = np.empty(x.shape)
+    np.put_along_axis(rank, order, group_start + 1.0, axis=-1)
+    return order, rank
+
+
+def _running_top2(keys: np.ndarray):
+    """
+    最后一维前缀的最大和次大键：返回 (top1, top2)，形状为 (..., 长度 + 1)，
+    第 t 项对应前 t 个元素（不足时为 -1）；键须互不相同且非负
+    """
+    top1 = np.full(keys.shape[:-1] + (keys.shape[-1] + 1,), -1, dtype=keys.dtype)
+    top2 = top1.copy()
+    for t in range(keys.shape[-1]):
+        v = keys[..., t]
+        top2[..., t + 1] = np.maximum(top2[..., t], np.minimum(top1[..., t], v))
+        top1[..., t + 1] = np.maximum(top1[..., t], v)
+    return top1, top2
+
+
+def rank_thresholds(judge: np.ndarray, fan: np.ndarray, week: np.ndarray,
+                    rule_name: str) -> np.ndarray:
+    """
+    排名类规则下每位选手的安全临界份额（排序阈值搜索）
+
+    每周只对评委分和粉丝份额各排序一次。选手 i 的份额在相邻交叉点之间时，
+    有 t 位其他选手的份额高于 i：i 的粉丝排名为 t + 1，其余选手中粉丝份额
+    排在前 t 位的排名不变，其后的排名各加 1。按 (综合排名, 周内位置) 编码的
+    危险键在其他选手上取前缀 / 后缀的最大和次大值，即可 O(1) 判断 i 在每个
+    区间是否被淘汰（rank_sum 看 i 是否为最危险者；judge_save 看 i 是否进入
+    bottom two 且评委分不高于另一人）。每周 O(n log n + n²)：n 位选手各 n 个区间。
+
+    Parameters:
+    -----------
+    judge, fan : np.ndarray
+        (周数, 人数)；fan 为当周归一化后的份额，均不含 NaN
+    week : np.ndarray
+        (周数,)，保留参数以与注册表规则的输入一致
+    rule_name : str
+        'rank_sum' 或 'judge_save'
+
+    Returns:
+    --------
+    thresholds : np.ndarray
+        (周数, 人数)；任何份额都无法保证安全时为 1
+    """
+    if rule_name not in RANK_RULES:
+        raise ValueError(f"Not a rank rule: {rule_name}")
+    n_weeks, n = fan.shape
+    contestants = np.arange(n)
+
+    judge_rank = _sorted_min_rank(judge)[1]
+    order, fan_rank = _sorted_min_rank(fan)
+
+    # others[w, i]：除 i 以外的选手，按粉丝份额降序，(周数, i, n - 1)
+    order_i = np.broadcast_to(order[:, None, :], (n_weeks, n, n))
+    others = order_i[order_i != contestants[None, :, None]].reshape(n_weeks, n, n - 1)
+    rows = np.arange(n_weeks)[:, None, None]
+    f_other = fan[rows, others]
+    f_i = fan[:, :, None]
+
+    # 其他选手在 i 之上 / 之下时的危险键：综合排名越大越危险，并列时周内靠前者先淘汰
+    # （与 first_argmin 一致）；键 = 综合排名 × (n + 1) + (n - 1 - 位置)，互不相同
+    combined_above = judge_rank[rows, others] + fan_rank[rows, others] - (f_i > f_other)
+    key_above = (combined_above * (n + 1) + (n - 1 - others)).astype(np.int64)
+    key_below = key_above + (n + 1)
+
+    # 第 t 个区间（t 位其他选手在 i 之上）中其他选手的最大、次大危险键
+    prefix1, prefix2 = _running_top2(key_above)                         # 前 t 位在上
+    suffix1, suffix2 = _running_top2(key_below[..., ::-1])
+    suffix1, suffix2 = suffix1[..., ::-1], suffix2[..., ::-1]           # 第 t 位起在下
+    top1 = np.maximum(prefix1, suffix1)
+    top2 = np.maximum(np.minimum(prefix1, suffix1), np.maximum(prefix2, suffix2))
+
+    t_above = np.arange(n)
+    own_key = ((judge_rank[:, :, None] + t_above + 1) * (n + 1)
+               + (n - 1 - contestants)[None, :, None]).astype(np.int64)  # (周数, i, t)
+    if rule_name == 'rank_sum':
+        eliminated = own_key > top1
+    else:
+        top_owner = n - 1 - top1 % (n + 1)
+        top_judge = judge[rows[..., 0], top_owner.reshape(n_weeks, -1)].reshape(top1.shape)
+        own_judge = judge[:, :, None]
+        eliminated = (((own_key > top1) & (top_judge >= own_judge))
+                      | ((own_key < top1) & (own_key > top2) & (own_judge < top_judge)))
+
+    # 交叉点 f_j / (1 - f_i + f_j) 随 f_j 单调，others 降序即交叉点降序；
+    # 区间边界 [0, 升序交叉点, 1]，升序第 t' 个区间上方有 n - 1 - t' 人
+    crossing = f_other / (1 - f_i + f_other)
+    zeros = np.zeros((n_weeks, n, 1))
+    bounds = np.concatenate([zeros, crossing[..., ::-1], zeros + 1], axis=-1)  # (周数, i, n + 1)
+    nonempty = bounds[..., 1:] > bounds[..., :-1]
+    eliminated = eliminated[..., ::-1] & nonempty
+
+    # 最后一个会被淘汰的非空区间之后都安全
+    last_unsafe = np.where(eliminated, np.arange(n), -1).max(axis=-1)   # (周数, i)
+    return np.take_along_axis(bounds, (last_unsafe + 1)[..., None], axis=-1)[..., 0]
+
+
+def compute_elimination_margins(data: pd.DataFrame,
+                                rules: Sequence[str] = DEFAULT_RULES) -> pd.DataFrame:
+    """
+    所有周所有选手的淘汰边界
+
+    Parameters:
+    -----------
+    data : DataFrame
+        包含 judge_total 和 fan_vote_share 的周级数据
+    rules : Sequence[str]
+        'rank_sum', 'percent_sum', 'judge_save' 的子集
+
+    Returns:
+    --------
+    margins_df : DataFrame
+        每个模拟周的每位选手一行：fan_share（当周归一化份额），
+        <rule>_threshold（安全临界份额）和 <rule>_margin = fan_share - threshold
+        （正值为余量，负值为差距）
+    """
+    unsupported = [rule for rule in rules if rule not in RANK_RULES + ('percent_sum',)]
+    if unsupported:
+        raise ValueError(f"No analytic boundary for rule: {', '.join(unsupported)}")
+
+    engine = ArrayVotingEngine(data)
+    fan_votes = data['fan_vote_share'].to_numpy(dtype=float)
+
+    row_list, share_list = [], []
+    thresholds = {rule: [] for rule in rules}
+    for members, rows in engine.buckets:
+        judge = engine.judge_scores[rows]
+        fan = fan_votes[rows] / fan_votes[rows].sum(axis=-1, keepdims=True)
+        week = engine.weeks[members]
+
+        row_list.append(rows.ravel())
+        share_list.append(fan.ravel())
+        for rule in rules:
+            if rule == 'percent_sum':
+                threshold = percent_thresholds(judge, fan)
+            else:
+                threshold = rank_thresholds(judge, fan, week, rule)
+            thresholds[rule].append(threshold.ravel())
+
+    rows = np.concatenate(row_list)
+    share = np.concatenate(share_list)
+    margins_df = data.iloc[rows][['season', 'week', 'celebrity_name']].reset_index(drop=True)
+    margins_df['fan_share'] = share
+    for rule in rules:
+        threshold = np.concatenate(thresholds[rule])
+        margins_df[f'{rule}_threshold'] = threshold
+        margins_df[f'{rule}_margin'] = share - threshold
+
+    return margins_df.sort_values(['season', 'week', 'celebrity_name'], ignore_index=True)
@@ -1,6 +1,32 @@
 ﻿class FanVoteModel: #粉丝投票估算模型
+    """
+    粉丝投票逆向求解模型（pipeline.estimate_fan_votes 的封装）
+
+    fit 时逐赛季求解每周与淘汰结果一致的粉丝份额，predict 按
+    (season, week, celebrity_name) 取回估计值。
+
+    Args:
+        config: 求解参数（margin, min_share, n_jobs），见 pipeline.DEFAULT_CONFIG
+    """
+
+    KEYS = ['season', 'week', 'celebrity_name']
+
+    def __init__(self, config=None):
+        self.config = config
+        self.shares_ = None
+        self.diagnostics_ = None
+
     def fit(self, panel):
-        raise NotImplementedError
+        from pipeline import estimate_fan_votes
+
+        shares = estimate_fan_votes(panel, self.config)
+        self.diagnostics_ = shares.attrs['diagnostics']
+        fitted = panel.loc[shares.notna(), self.KEYS].assign(fan_vote_share=shares.dropna())
+        self.shares_ = fitted.set_index(self.KEYS)['fan_vote_share']
+        return self
 
     def predict(self, panel):
-        raise NotImplementedError
+        if self.shares_ is None:
+            raise RuntimeError("FanVoteModel 尚未拟合，请先调用 fit")
+        index = panel.set_index(self.KEYS).index
+        return self.shares_.reindex(index).to_numpy()
@@ -0,0 +1,490 @@
+"""
+可行域抽样 (Feasible-Region Sampler)
+
+pipeline.estimate_fan_votes 对每周只给出一个点估计。本模块在每周的可行多面体
+
+    {f : Σf = 1, f ≥ 0, A f ≥ b}     （A, b 见 pipeline.elimination_constraints）
+
+上均匀抽样，得到与实际淘汰结果一致的粉丝份额分布：
+
+- 无淘汰的周：整个单纯形，直接取 Dirichlet(1)
+- 排名法的周：可行域是所有能复现淘汰结果的排序锥的并（非凸）。各排序锥与
+  单纯形的交体积相同，在可行排序中均匀取一个排序，再在其排序锥（有序单纯形）
+  内取降序排列的 Dirichlet(1)，即为整个可行域上的均匀分布
+- 百分比法单人淘汰的周：固定被淘汰者的份额 x 后，其余选手的可行集是边长
+  S(x) 的平移单纯形，x 的边缘密度 ∝ S(x)^(n-2)（S 分段线性，逐段求逆 CDF）
+- 百分比法多人淘汰的周：多链 hit-and-run
+
+以上三类是独立精确抽样。没有任何份额能复现淘汰结果的周（order_feasible
+为 False）标记为 infeasible，不提供抽样。hit-and-run 的周按人数分桶，约束矩阵按桶内最大
+约束数补零后在 (周, 链) 之间共享，每一步对桶内所有周的所有链一次性更新；
+各链从多面体的 Chebyshev 中心附近的不同点出发。每周都报告多链有效样本量
+(ESS) 和 R-hat，R-hat 超过 RHAT_LIMIT 或 ESS 低于 ESS_FLOOR 的周以及
+不可行的周给出警告。
+"""
+import warnings
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import null_space
+from scipy.optimize import linprog
+
+from pipeline import (elimination_constraints, estimate_fan_votes, rank_cases, season_rule,
+                      week_eliminated)
+
+KEYS = ['season', 'week', 'celebrity_name']
+
+# 混合诊断的警告阈值
+RHAT_LIMIT = 1.1
+ESS_FLOOR = 100
+
+
+def chebyshev_center(G: np.ndarray, h: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    多面体 {f : G f ≥ h, Σf = 1} 在单纯形平面内的最大内切球
+
+    Returns:
+        (球心, 半径)；多面体为空或没有内点时半径为 0
+    """
+    n = G.shape[1]
+    # 约束在 Σf = 1 平面内的法向量长度
+    norms = np.linalg.norm(G @ null_space(np.ones((1, n))), axis=1)
+    result = linprog(
+        c=np.r_[np.zeros(n), -1.0],
+        A_ub=np.hstack([-G, norms[:, None]]),
+        b_ub=-h,
+        A_eq=np.r_[np.ones(n), 0.0][None, :],
+        b_eq=[1.0],
+        bounds=[(None, None)] * n + [(0.0, 1.0)],
+        method='highs',
+    )
+    if result.status != 0:
+        return np.full(n, 1.0 / n), 0.0
+    return result.x[:n], float(result.x[-1])
+
+
+def sample_rank_week(rule_name: str, judge: np.ndarray, eliminated: np.ndarray,
+                     n_draws: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    排名法周的可行域（所有复现淘汰结果的排序锥之并）上的均匀抽样，(抽样数, 人数)
+
+    各排序锥与单纯形的交体积相同，因此先在可行排序中均匀取一个排序，再在该
+    排序锥内均匀抽样（Dirichlet(1) 降序排列后按排序放置）。可行排序按
+    pipeline.rank_cases 分组：组内其余选手的排名只有上界，按上界升序逐个在
+    尚未占用且不超过上界的排名中均匀选取，第 i 步有 a_i = #{free ≤ u_(i)} - i
+    种选择，组内排序数为 Π a_i。按排序数选组后逐步选取即为可行排序上的均匀分布。
+    调用前须确认至少有一种排序可行。
+    """
+    n = len(judge)
+    groups, counts = [], []
+    for bottom, bottom_rank, others, upper, free in rank_cases(judge, eliminated, rule_name):
+        by_upper = np.argsort(upper, kind='stable')
+        upper = upper[by_upper]
+        choices = (free[None, :] <= upper[:, None]).sum(axis=1) - np.arange(len(upper))
+        if (choices <= 0).any():
+            continue
+        groups.append((bottom, bottom_rank, others[by_upper], upper, free))
+        counts.append(np.prod(choices.astype(float)))
+
+    # 同一周各组的 bottom 人数相同，堆叠后按抽到的组逐行取用
+    bottom, bottom_rank, others, upper, free = (np.array(part) for part in zip(*groups))
+    counts = np.array(counts)
+    pick = rng.choice(len(groups), size=n_draws, p=counts / counts.sum())
+    draw = np.arange(n_draws)
+
+    fan_rank = np.empty((n_draws, n), dtype=np.int64)
+    fan_rank[draw[:, None], bottom[pick]] = bottom_rank[pick]
+    free, upper, others = free[pick], upper[pick], others[pick]
+    taken = np.zeros(free.shape, dtype=bool)
+    for i in range(free.shape[1]):
+        allowed = (free <= upper[:, i:i + 1]) & ~taken
+        k = np.floor(rng.random(n_draws) * allowed.sum(axis=1))
+        column = (np.cumsum(allowed, axis=1) > k[:, None]).argmax(axis=1)
+        taken[draw, column] = True
+        fan_rank[draw, others[:, i]] = free[draw, column]
+
+    ordered = -np.sort(-rng.dirichlet(np.ones(n), n_draws), axis=-1)
+    return np.take_along_axis(ordered, fan_rank - 1, axis=-1)
+
+
+def sample_percent_week(eliminated: int, offset: np.ndarray, n_draws: int,
+                        rng: np.random.Generator) -> np.ndarray:
+    """
+    {f ≥ 0, Σf = 1, f_j ≥ f_e + offset_j (j ≠ e)} 上的均匀抽样，(抽样数, 人数)
+
+    固定 f_e = x 后其余选手为 f_j = l_j(x) + S(x)·D，l_j(x) = max(0, x + offset_j)，
+    S(x) = 1 - x - Σ l_j(x)，D ~ Dirichlet(1)。切片体积 ∝ S^(n-2)，S 在断点
+    -offset_j 之间线性，每段的质量和逆 CDF 都有闭式解。
+
+    Parameters:
+    -----------
+    eliminated : int
+        被淘汰者 e 的位置
+    offset : np.ndarray
+        (人数,)，offset_j = P^J_e - P^J_j；offset[e] 不使用
+    """
+    n = len(offset)
+    others = np.flatnonzero(np.arange(n) != eliminated)
+    c = offset[others]
+
+    def slack(x):
+        return 1 - x - np.maximum(0.0, x[..., None] + c).sum(axis=-1)
+
+    knots = np.unique(np.r_[0.0, -c[-c > 0]])
+    values = slack(knots)
+    if values[0] <= 0:
+        raise ValueError("Polytope has no interior: slack at f_e = 0 is not positive")
+    # S 在最后一个正值之后按斜率 1 + 活跃约束数线性降到 0
+    last = np.flatnonzero(values > 0)[-1]
+    slope_end = 1 + (knots[last] + c >= 0).sum()
+    end = knots[last] + values[last] / slope_end
+    x0 = knots[:last + 1]
+    x1 = np.r_[knots[1:last + 1], end]
+    s0, s1 = values[:last + 1], np.r_[values[1:last + 1], 0.0]
+    slope = (s0 - s1) / (x1 - x0)
+
+    power = n - 1
+    mass = (s0 ** power - s1 ** power) / (power * slope)
+    segment = rng.choice(len(mass), size=n_draws, p=mass / mass.sum())
+    u = rng.random(n_draws)
+    top = s0[segment] ** power
+    width = (top - u * (top - s1[segment] ** power)) ** (1 / power)
+    x = x0[segment] + (s0[segment] - width) / slope[segment]
+
+    draws = np.empty((n_draws, n))
+    draws[:, eliminated] = x
+    draws[:, others] = (np.maximum(0.0, x[:, None] + c)
+                        + width[:, None] * rng.dirichlet(np.ones(n - 1), n_draws))
+    return draws
+
+
+def hit_and_run(G: np.ndarray, h: np.ndarray, start: np.ndarray, n_samples: int,
+                burn_in: int = 5000, thin: int = 100,
+                rng: np.random.Generator = None) -> np.ndarray:
+    """
+    一批同人数多面体上的多链 hit-and-run
+
+    每一步在 Σf = 1 平面内取随机方向 d，求出沿 d 仍满足 G f ≥ h 的
+    弦 [t_lo, t_hi]，在弦上均匀取下一点。排名法的多面体是细长的排序锥，
+    各向同性的方向混合很慢：预烧的前半段用各向同性方向，之后按后半段
+    预烧样本的协方差取方向（rounding）。方向分布固定且关于原点对称，
+    均匀分布仍是平稳分布。
+
+    Parameters:
+    -----------
+    G : np.ndarray
+        (周数, 约束数, 人数)；补齐的约束行为 0
+    h : np.ndarray
+        (周数, 约束数)；补齐的约束取负值（恒满足）
+    start : np.ndarray
+        (周数, 链数, 人数) 严格内点
+    n_samples : int
+        每条链保留的样本数
+    burn_in, thin : int
+        预烧步数和抽稀间隔
+
+    Returns:
+    --------
+    samples : np.ndarray
+        (周数, 链数, n_samples, 人数)
+    """
+    rng = rng or np.random.default_rng()
+    n_weeks, n_chains, n = start.shape
+    basis = null_space(np.ones((1, n)))                          # (人数, 人数 - 1)
+    # 方向的线性变换（平面坐标 -> 份额），初始为各向同性
+    transform = np.broadcast_to(basis, (n_weeks, n, n - 1))
+    pilot_start = burn_in // 2
+    pilot = np.empty((n_weeks, n_chains, burn_in - pilot_start, n))
+
+    G_t = np.ascontiguousarray(G.transpose(0, 2, 1))             # (周数, 人数, 约束数)
+    f = start.copy()
+    samples = np.empty((n_weeks, n_chains, n_samples, n))
+    n_steps = burn_in + n_samples * thin
+    for step in range(n_steps):
+        if step == burn_in and burn_in - pilot_start > 1:
+            # 预烧样本的协方差在平面内的 Cholesky 因子
+            flat = pilot.reshape(n_weeks, -1, n)
+            centered = flat - flat.mean(axis=1, keepdims=True)
+            cov = basis.T @ (centered.transpose(0, 2, 1) @ centered) @ basis / (flat.shape[1] - 1)
+            cov += 1e-12 * np.eye(n - 1)
+            transform = basis @ np.linalg.cholesky(cov)
+
+        d = rng.standard_normal((n_weeks, n_chains, n - 1)) @ transform.transpose(0, 2, 1)
+
+        slack = np.maximum(f @ G_t - h[:, None, :], 0.0)
+        rate = d @ G_t
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = -slack / rate
+        t_hi = np.where(rate < 0, ratio, np.inf).min(axis=-1)
+        t_lo = np.where(rate > 0, ratio, -np.inf).max(axis=-1)
+        f += (t_lo + (t_hi - t_lo) * rng.random((n_weeks, n_chains)))[..., None] * d
+
+        if pilot_start <= step < burn_in:
+            pilot[:, :, step - pilot_start] = f
+        kept = step - burn_in
+        if kept >= 0 and kept % thin == 0:
+            samples[:, :, kept // thin] = f
+
+    return samples
+
+
+def effective_sample_size(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    多链有效样本量和 R-hat（最后两维为 (链数, 样本数)）
+
+    自协方差用 FFT 计算，链间合并方差按 Gelman et al. (BDA3)，
+    自相关之和按 Geyer 初始正序列截断。
+
+    Returns:
+        (ess, rhat)，形状为 samples.shape[:-2]
+    """
+    n_chains, n_samples = samples.shape[-2:]
+    centered = samples - samples.mean(axis=-1, keepdims=True)
+
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_samples)))
+    spectrum = np.fft.rfft(centered, n=n_fft, axis=-1)
+    acov = np.fft.irfft(spectrum * spectrum.conj(), n=n_fft, axis=-1)[..., :n_samples] / n_samples
+
+    within = (acov[..., 0] * n_samples / (n_samples - 1)).mean(axis=-1)
+    between = n_samples * samples.mean(axis=-1).var(axis=-1, ddof=1) if n_chains > 1 else 0.0
+    var_plus = (n_samples - 1) / n_samples * within + between / n_samples
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = 1 - (within[..., None] - acov.mean(axis=-2)) / var_plus[..., None]
+        rho[..., 0] = 1.0
+
+        n_pairs = n_samples // 2
+        pairs = rho[..., :2 * n_pairs].reshape(rho.shape[:-1] + (n_pairs, 2)).sum(axis=-1)
+        positive = np.cumprod(pairs > 0, axis=-1).astype(bool)
+        tau = -1 + 2 * np.where(positive, pairs, 0.0).sum(axis=-1)
+
+        total = n_chains * n_samples
+        ess = total / np.clip(tau, 1 / np.log10(total), None)
+        rhat = np.sqrt(var_plus / within)
+    return ess, rhat
+
+
+class FeasibleSamples:
+    """
+    可行域抽样结果
+
+    Attributes:
+    -----------
+    keys : DataFrame
+        抽样覆盖的选手-周（season, week, celebrity_name, fan_vote_share 点估计），
+        与 draws 的列对齐
+    draws : np.ndarray
+        (抽样数, 行数)，抽样按 (链, 样本) 展开
+    weekly : DataFrame
+        每周一行：规则、约束数、排序是否可行、内切球半径、
+        ess_min / ess_median（各选手份额的 ESS）和 rhat_max
+    """
+
+    def __init__(self, keys: pd.DataFrame, draws: np.ndarray, weekly: pd.DataFrame):
+        self.keys = keys
+        self.draws = draws
+        self.weekly = weekly
+
+    @property
+    def n_draws(self) -> int:
+        return self.draws.shape[0]
+
+    def align(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        按 (season, week, celebrity_name) 对齐到 data 的行，(抽样数, len(data))，
+        可直接作为 VotingSimulator.simulate_monte_carlo 的 share_draws；
+        未覆盖的行取 data 的 fan_vote_share
+        """
+        index = pd.MultiIndex.from_frame(self.keys[KEYS])
+        columns = index.get_indexer(pd.MultiIndex.from_frame(data[KEYS]))
+        found = columns >= 0
+
+        aligned = np.broadcast_to(
+            data['fan_vote_share'].to_numpy(dtype=float), (self.n_draws, len(data))
+        ).copy()
+        aligned[:, found] = self.draws[:, columns[found]]
+        return aligned
+
+    def summary(self, level: float = 0.95) -> pd.DataFrame:
+        """每位选手每周的后验均值和等尾可信区间"""
+        tail = (1 - level) / 2 * 100
+        summary_df = self.keys.copy()
+        summary_df['draw_mean'] = self.draws.mean(axis=0)
+        summary_df['draw_lower'] = np.percentile(self.draws, tail, axis=0)
+        summary_df['draw_upper'] = np.percentile(self.draws, 100 - tail, axis=0)
+        return summary_df
+
+
+def _week_polytopes(panel: pd.DataFrame, point: pd.Series) -> Tuple[list, pd.DataFrame]:
+    """
+    每个有效周的约束 G f ≥ h（淘汰约束 + f ≥ 0），约束以点估计所在的排序锥为准
+
+    kind 决定抽样方式：simplex（无淘汰）、rank（排名法，全部可行排序；G, h 为
+    点估计所在的排序锥，只用于内切球）、percent（百分比法单人淘汰）、polytope（其余，
+    hit-and-run）
+    """
+    weeks = []
+    keys = []
+    valid = panel[(panel['week_valid'] == True) & point.notna()]
+    for (season, week), week_df in valid.groupby(['season', 'week'], sort=True):
+        method, judge_save = season_rule(int(season))
+        prior = point.loc[week_df.index].to_numpy()
+        judge = week_df['judge_total'].to_numpy(dtype=float)
+        eliminated = week_eliminated(week_df, week)
+        A, b, info = elimination_constraints(
+            prior, judge, eliminated, method, judge_save, margin=0.0
+        )
+        n = len(week_df)
+        if len(eliminated) == 0:
+            kind = 'simplex'
+        elif method == "rank":
+            kind = 'rank'
+        elif len(eliminated) == 1:
+            kind = 'percent'
+        else:
+            kind = 'polytope'
+        weeks.append({
+            'season': season,
+            'week': week,
+            'num_contestants': n,
+            'G': np.vstack([A, np.eye(n)]),
+            'h': np.r_[b, np.zeros(n)],
+            'point': prior,
+            'kind': kind,
+            'judge': judge,
+            'eliminated': eliminated,
+            **info,
+        })
+        keys.append(week_df[KEYS].assign(fan_vote_share=prior))
+    return weeks, pd.concat(keys)
+
+
+def _exact_draws(week: Dict, n_draws: int, rng: np.random.Generator) -> np.ndarray:
+    """simplex / rank / percent 周的独立精确抽样，(抽样数, 人数)"""
+    n = week['num_contestants']
+    if week['kind'] == 'simplex':
+        return rng.dirichlet(np.ones(n), n_draws)
+    if week['kind'] == 'rank':
+        return sample_rank_week(week['rule'], week['judge'], week['eliminated'], n_draws, rng)
+    A, b = week['G'][:-n], week['h'][:-n]
+    offset = np.zeros(n)
+    offset[A.argmax(axis=1)] = b
+    return sample_percent_week(week['eliminated'][0], offset, n_draws, rng)
+
+
+def sample_feasible_shares(panel: pd.DataFrame, n_chains: int = 4, n_samples: int = 500,
+                           burn_in: int = 5000, thin: int = 100, seed: int = 42,
+                           config: Dict = None) -> FeasibleSamples:
+    """
+    在每周的可行多面体上均匀抽样粉丝份额
+
+    Parameters:
+    -----------
+    panel : DataFrame
+        weekly_panel（与 pipeline.estimate_fan_votes 的输入相同）
+    n_chains : int
+        每周的链数（精确抽样的周同样分成 n_chains 组以计算诊断量）
+    n_samples : int
+        每条链保留的样本数（总抽样数 = n_chains × n_samples）
+    burn_in, thin : int
+        hit-and-run 的预烧步数和抽稀间隔
+    seed : int
+        随机种子（每个人数桶派生一个子种子）
+    config : dict, optional
+        点估计的求解参数，见 pipeline.DEFAULT_CONFIG
+
+    Returns:
+    --------
+    samples : FeasibleSamples
+        weekly 中 sampler 列为 exact / hit_and_run / point（无内点，取点估计）/
+        infeasible（无法复现淘汰结果，不在 keys 和 draws 中）
+    """
+    point = estimate_fan_votes(panel, config)
+    weeks, keys = _week_polytopes(panel, point)
+    sizes = np.array([week['num_contestants'] for week in weeks])
+    feasible = np.array([week['order_feasible'] for week in weeks], dtype=bool)
+    keys = keys[np.repeat(feasible, sizes)]
+    offsets = np.r_[0, np.cumsum(np.where(feasible, sizes, 0))]
+    n_draws = n_chains * n_samples
+
+    draws = np.empty((n_draws, offsets[-1]))
+    weekly = pd.DataFrame([
+        {key: week[key] for key in ['season', 'week', 'num_contestants', 'rule', 'order_feasible']}
+        for week in weeks
+    ])
+    weekly['num_constraints'] = [len(week['h']) - week['num_contestants'] for week in weeks]
+    weekly['sampler'] = np.where(feasible, 'point', 'infeasible')
+    for column in ['radius', 'ess_min', 'ess_median', 'rhat_max']:
+        weekly[column] = np.nan
+
+    bucket_sizes = np.unique(sizes[feasible])
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(bucket_sizes))]
+    for n, rng in zip(bucket_sizes, rngs):
+        members = np.flatnonzero((sizes == n) & feasible)
+        centers, radii = zip(*(chebyshev_center(weeks[w]['G'], weeks[w]['h']) for w in members))
+        radii = np.array(radii)
+        weekly.loc[members, 'radius'] = radii
+
+        # 没有内点（n = 1 或多面体退化）的周直接取点估计
+        for w in members[radii <= 1e-12]:
+            draws[:, offsets[w]:offsets[w + 1]] = weeks[w]['point']
+        interior = radii > 1e-12
+        members, centers, radii = members[interior], np.array(centers)[interior], radii[interior]
+
+        # 有闭式结构的周独立精确抽样，(周数, 链数, 样本数, 人数)
+        exact = np.array([weeks[w]['kind'] != 'polytope' for w in members], dtype=bool)
+        chained = members[~exact]
+        samples = {}
+        for w in members[exact]:
+            samples[w] = _exact_draws(weeks[w], n_draws, rng).reshape(n_chains, n_samples, n)
+        weekly.loc[members[exact], 'sampler'] = 'exact'
+
+        if len(chained):
+            # 补齐约束行：G = 0, h = -1 恒满足
+            n_rows = max(len(weeks[w]['h']) for w in chained)
+            G = np.zeros((len(chained), n_rows, n))
+            h = np.full((len(chained), n_rows), -1.0)
+            for i, w in enumerate(chained):
+                G[i, :len(weeks[w]['h'])] = weeks[w]['G']
+                h[i, :len(weeks[w]['h'])] = weeks[w]['h']
+
+            # 各链从内切球内的不同随机点出发
+            basis = null_space(np.ones((1, n)))
+            direction = rng.standard_normal((len(chained), n_chains, n - 1))
+            direction /= np.linalg.norm(direction, axis=-1, keepdims=True)
+            scale = 0.9 * radii[~exact][:, None] * rng.random((len(chained), n_chains)) ** (1 / (n - 1))
+            start = centers[~exact][:, None, :] + scale[..., None] * (direction @ basis.T)
+
+            chains = hit_and_run(G, h, start, n_samples, burn_in, thin, rng)
+            samples.update(zip(chained, chains))
+            weekly.loc[chained, 'sampler'] = 'hit_and_run'
+
+        if not samples:
+            continue
+        done = np.array(list(samples))
+        stacked = np.stack([samples[w] for w in done])
+        ess, rhat = effective_sample_size(stacked.transpose(0, 3, 1, 2))   # (周数, 人数)
+        weekly.loc[done, 'ess_min'] = ess.min(axis=1)
+        weekly.loc[done, 'ess_median'] = np.median(ess, axis=1)
+        weekly.loc[done, 'rhat_max'] = rhat.max(axis=1)
+        for w, week_samples in zip(done, stacked):
+            draws[:, offsets[w]:offsets[w + 1]] = week_samples.reshape(n_draws, n)
+
+    def listed(rows: pd.DataFrame) -> str:
+        names = ', '.join(f"S{row.season} W{row.week}" for row in rows.head(10).itertuples())
+        return names + (' ...' if len(rows) > 10 else '')
+
+    problems = []
+    infeasible = weekly[weekly['sampler'] == 'infeasible']
+    if len(infeasible):
+        problems.append(f"{len(infeasible)} week(s) cannot reproduce the elimination and were "
+                        f"not sampled: {listed(infeasible)}")
+    poor = weekly[(weekly['rhat_max'] > RHAT_LIMIT) | (weekly['ess_min'] < ESS_FLOOR)]
+    if len(poor):
+        problems.append(f"{len(poor)} week(s) mixed poorly (R-hat > {RHAT_LIMIT} or "
+                        f"ESS < {ESS_FLOOR}): {listed(poor)}; increase burn_in / thin")
+    if problems:
+        warnings.warn('; '.join(problems), RuntimeWarning)
+
+    return FeasibleSamples(keys.reset_index(drop=True), draws, weekly)
@@ -11,13 +11,17 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import matplotlib.pyplot as plt
-import pickle
 from typing import Dict, Tuple
 
+from models.tree_ensemble import TreeEnsemble
+from utils.cache import cached_stage
+from utils.cross_validation import cross_validate_seasons, summarize_cv
+from utils.encoding import CategoricalEncoder
+from utils.model_bundle import ModelBundle, load_bundle, save_bundle
+from utils.storage import read_table, write_table
+
 
 class RandomForestFanPreferenceModel:
     """
@@ -51,6 +55,7 @@ class RandomForestFanPreferenceModel:
         )
         self.label_encoders = {}
         self.feature_names = None
+        self.cv_results = None
         self.is_fitted = False
 
     def prepare_features(self, df: pd.DataFrame, residuals: pd.Series = None) -> Tuple:
@@ -121,20 +126,13 @@ class RandomForestFanPreferenceModel:
         categorical_features = ['age_group', 'industry', 'homestate', 'partner']
         numerical_features = dynamic_features + ['age']
 
-        # 编码分类特征
+        # 编码分类特征（整列编码，测试集中的新类别为 UNKNOWN_CODE）
         for feat in categorical_features:
             if feat not in self.label_encoders:
-                self.label_encoders[feat] = LabelEncoder()
-                feature_df[f'{feat}_encoded'] = self.label_encoders[feat].fit_transform(
-                    feature_df[feat].astype(str)
-                )
+                self.label_encoders[feat] = CategoricalEncoder()
+                feature_df[f'{feat}_encoded'] = self.label_encoders[feat].fit_transform(feature_df[feat])
             else:
-                # 处理测试集中的新类别
-                feature_df[f'{feat}_encoded'] = feature_df[feat].astype(str).apply(
-                    lambda x: self.label_encoders[feat].transform([x])[0]
-                    if x in self.label_encoders[feat].classes_
-                    else -1
-                )
+                feature_df[f'{feat}_encoded'] = self.label_encoders[feat].transform(feature_df[feat])
 
         # 最终特征列
         encoded_categorical = [f'{feat}_encoded' for feat in categorical_features]
@@ -150,8 +148,14 @@ class RandomForestFanPreferenceModel:
 
         return X, y, feature_df
 
-    def fit(self, X, y):
-        """训练模型"""
+    def fit(self, X, y, groups=None, n_jobs=None):
+        """
+        训练模型
+
+        groups 为每行的赛季，用于按赛季分块的 5 折交叉验证；
+        未提供时按行顺序分块（不打乱的 KFold）。
+        n_jobs 为交叉验证的进程数，见 cross_validate_seasons
+        """
         print("\n" + "=" * 60)
         print("训练 Random Forest 模型")
         print("=" * 60)
@@ -176,16 +180,16 @@ class RandomForestFanPreferenceModel:
         print(f"  - RMSE: {rmse:.4f}")
         print(f"  - MAE: {mae:.4f}")
 
-        # 交叉验证
-        print(f"\n[5-Fold 交叉验证]")
-        cv_scores = cross_val_score(
-            self.model, X, y,
-            cv=5,
-            scoring='r2',
-            n_jobs=-1
-        )
-        print(f"  - CV R2 均值: {cv_scores.mean():.4f}")
-        print(f"  - CV R2 标准差: {cv_scores.std():.4f}")
+        # 交叉验证（同一赛季的周不会同时出现在训练折和验证折）
+        print(f"\n[5-Fold 交叉验证（按赛季分块）]")
+        if groups is None:
+            groups = np.arange(len(X))
+        self.cv_results = cross_validate_seasons({'residual': self.model}, X, {'residual': y}, groups,
+                                                 n_jobs=n_jobs)
+        cv_summary = summarize_cv(self.cv_results).iloc[0]
+        print(f"  - CV R2 均值: {cv_summary['r2_mean']:.4f}")
+        print(f"  - CV R2 标准差: {cv_summary['r2_std']:.4f}")
+        print(f"  - 各折拟合耗时: {', '.join(f'{t:.2f}s' for t in self.cv_results['fit_time_sec'])}")
 
         self.is_fitted = True
         return self
@@ -241,39 +245,66 @@ class RandomForestFanPreferenceModel:
         return importance_df
 
     def save_model(self, path: Path):
-        """保存模型"""
-        model_data = {
-            'model': self.model,
-            'label_encoders': self.label_encoders,
+        """
+        保存模型包（utils/model_bundle.py）
+
+        森林保存为扁平节点数组（models/tree_ensemble.py），
+        标签编码器保存为各自的类别表 encoder/<特征名>
+        """
+        forest = self.model if isinstance(self.model, TreeEnsemble) else TreeEnsemble.from_sklearn(self.model)
+        arrays = forest.to_arrays()
+        for feat, encoder in self.label_encoders.items():
+            arrays[f'encoder/{feat}'] = np.asarray(encoder.classes_, dtype=str)
+
+        save_bundle(path, arrays, meta={
+            'model_type': 'random_forest',
             'feature_names': self.feature_names,
+            'categorical_features': list(self.label_encoders),
             'n_estimators': self.n_estimators,
-            'max_depth': self.max_depth
-        }
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
+            'max_depth': self.max_depth,
+            'random_state': self.random_state,
+        })
         print(f"\n[保存] 模型已保存到: {path}")
 
     @classmethod
     def load_model(cls, path: Path):
-        """加载模型"""
-        with open(path, 'rb') as f:
-            model_data = pickle.load(f)
+        """
+        加载模型包
+
+        森林以 TreeEnsemble（内存映射的节点数组）的形式恢复，
+        predict 和 get_feature_importance 可直接使用，但不能继续训练。
+        """
+        return cls.from_bundle(load_bundle(path))
+
+    @classmethod
+    def from_bundle(cls, bundle: ModelBundle):
+        """由已加载的模型包恢复（不再读取文件），见 load_model"""
+        meta = bundle.meta
 
         instance = cls(
-            n_estimators=model_data['n_estimators'],
-            max_depth=model_data['max_depth']
+            n_estimators=meta['n_estimators'],
+            max_depth=meta['max_depth'],
+            random_state=meta['random_state']
         )
-        instance.model = model_data['model']
-        instance.label_encoders = model_data['label_encoders']
-        instance.feature_names = model_data['feature_names']
+        instance.model = TreeEnsemble(bundle)
+        for feat in meta['categorical_features']:
+            instance.label_encoders[feat] = CategoricalEncoder(classes=bundle[f'encoder/{feat}'])
+        instance.feature_names = meta['feature_names']
         instance.is_fitted = True
 
         return instance
 
 
-def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, output_dir: Path):
+@cached_stage("random_forest", inputs=['ridge_results_path', 'weekly_panel_path'],
+              params=['n_estimators', 'max_depth', 'random_state'])
+def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, output_dir: Path,
+                            n_estimators: int = 100, max_depth: int = 10, random_state: int = 42,
+                            n_jobs: int = None):
     """
     运行完整的 Random Forest 流程
+
+    n_jobs 为交叉验证的进程数（不影响结果，不计入缓存键）；
+    在 DAG 进程池中运行时由 main.run_dag 按剩余 CPU 分配
     """
     print("=" * 80)
     print("Model B2: Random Forest for Fan Preference Drivers Analysis")
@@ -281,12 +312,12 @@ def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, o
 
     # 1. 加载 Model B1 的结果（残差）
     print("\n[Step 1] 加载 Model B1 的残差")
-    ridge_results = pd.read_csv(ridge_results_path)
+    ridge_results = read_table(ridge_results_path)
     print(f"  - Ridge 结果形状: {ridge_results.shape}")
 
     # 2. 加载完整的周级面板数据
     print("\n[Step 2] 加载周级面板数据")
-    weekly_panel = pd.read_csv(weekly_panel_path)
+    weekly_panel = read_table(weekly_panel_path)
     print(f"  - 周级面板形状: {weekly_panel.shape}")
 
     # 3. 合并数据（确保有残差的行）
@@ -305,9 +336,9 @@ def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, o
 
     # 5. 初始化模型
     model = RandomForestFanPreferenceModel(
-        n_estimators=100,
-        max_depth=10,
-        random_state=42
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        random_state=random_state
     )
 
     # 6. 准备特征
@@ -318,7 +349,7 @@ def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, o
 
     # 7. 训练模型
     print("\n[Step 6] 训练模型")
-    model.fit(X_train, y_train)
+    model.fit(X_train, y_train, groups=train_df['season'].to_numpy(), n_jobs=n_jobs)
 
     # 8. 特征重要性分析
     print("\n[Step 7] 特征重要性分析")
@@ -360,20 +391,25 @@ def run_random_forest_model(ridge_results_path: Path, weekly_panel_path: Path, o
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # 保存模型
-    model_path = output_dir / "random_forest_model.pkl"
+    model_path = output_dir / "random_forest_model.bundle"
     model.save_model(model_path)
 
     # 保存特征重要性
     importance_path = output_dir / "feature_importance.csv"
-    importance_df.to_csv(importance_path, index=False)
+    write_table(importance_df, importance_path)
     print(f"[保存] 特征重要性: {importance_path}")
 
+    # 保存各折交叉验证结果
+    cv_path = output_dir / "cv_folds.csv"
+    write_table(model.cv_results, cv_path)
+    print(f"[保存] 交叉验证: {cv_path}")
+
     # 保存预测结果
     train_featured['rf_prediction'] = model.predict(X_train)
     train_featured['rf_residual'] = y_train - train_featured['rf_prediction']
 
     results_path = output_dir / "rf_predictions.csv"
-    train_featured.to_csv(results_path, index=False)
+    write_table(train_featured, results_path)
     print(f"[保存] 预测结果: {results_path}")
 
     print("\n" + "=" * 80)
@@ -7,12 +7,16 @@ Model B1: Ridge Regression for Fan Vote Estimation
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from sklearn.linear_model import Ridge, RidgeCV
+from sklearn.linear_model import Ridge
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import GroupKFold, cross_val_score
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import matplotlib.pyplot as plt
-import pickle
+
+from utils.cache import cached_stage
+from utils.cross_validation import ridge_alpha_path, season_folds
+from utils.model_bundle import linear_model_arrays, load_bundle, restore_linear_model, save_bundle
+from utils.storage import read_table, write_table
+from utils.week_index import WeekIndex
 
 
 class RidgeFanVoteModel:
@@ -40,6 +44,7 @@ class RidgeFanVoteModel:
         self.model = Ridge(alpha=alpha)
         self.scaler = StandardScaler()
         self.feature_names = None
+        self.alpha_path = None
         self.is_fitted = False
 
     def prepare_features(self, df: pd.DataFrame) -> tuple:
@@ -60,12 +65,13 @@ class RidgeFanVoteModel:
 
         # 排除决赛周（只有少数人）和人数太少的周
         # 统计每周的人数
-        week_counts = valid_df.groupby(['season', 'week']).size()
-        valid_weeks = week_counts[week_counts > 3].index
+        week_index = WeekIndex.from_frame(valid_df)
+        keep = week_index.row_sizes() > 3
 
         # 过滤数据
-        valid_df = valid_df.set_index(['season', 'week'])
-        valid_df = valid_df.loc[valid_df.index.isin(valid_weeks)].reset_index()
+        key_cols = ['season', 'week']
+        columns = key_cols + [c for c in valid_df.columns if c not in key_cols]
+        valid_df = valid_df.loc[keep, columns].reset_index(drop=True)
 
         # 特征列
         feature_cols = [
@@ -91,11 +97,14 @@ class RidgeFanVoteModel:
 
         return X, y, groups, valid_df
 
-    def find_optimal_alpha(self, X, y, groups, alphas=None):
+    def find_optimal_alpha(self, X, y, groups, alphas=None, scheme='group_kfold'):
         """
         使用交叉验证找到最优的 alpha
 
-        使用 GroupKFold 确保同一赛季的数据不会同时出现在训练集和验证集
+        使用按赛季分组的折（默认与 GroupKFold 相同）确保同一赛季的数据不会
+        同时出现在训练集和验证集。每折只做一次 SVD，整条正则化路径闭式求解
+        （utils.cross_validation.ridge_alpha_path），候选数和折数（如
+        scheme='leave_one_out'）增加时开销几乎不变。
         """
         if alphas is None:
             alphas = np.logspace(-3, 3, 50)
@@ -104,18 +113,16 @@ class RidgeFanVoteModel:
         print(f"  - 候选 alpha 范围: {alphas.min():.4f} - {alphas.max():.4f}")
         print(f"  - 候选数量: {len(alphas)}")
 
-        # 使用 RidgeCV 进行交叉验证
-        gkf = GroupKFold(n_splits=5)
-
-        ridge_cv = RidgeCV(
-            alphas=alphas,
-            cv=gkf.split(X, y, groups),
-            scoring='neg_mean_squared_error'
-        )
-
-        ridge_cv.fit(X, y)
+        folds = season_folds(groups, n_splits=5, scheme=scheme)
+        mse = ridge_alpha_path(X, y, folds, alphas)
+        self.alpha_path = pd.DataFrame({
+            'alpha': alphas,
+            'cv_mse': mse.mean(axis=0),
+            'cv_mse_std': mse.std(axis=0),
+        })
 
-        optimal_alpha = ridge_cv.alpha_
+        # 并列时取第一个（与 RidgeCV 相同）
+        optimal_alpha = float(alphas[np.argmin(mse.mean(axis=0))])
         print(f"  - 最优 alpha: {optimal_alpha:.4f}")
 
         return optimal_alpha
@@ -243,36 +250,35 @@ class RidgeFanVoteModel:
         return df_with_residuals
 
     def save_model(self, path: Path):
-        """保存模型"""
-        model_data = {
-            'model': self.model,
-            'scaler': self.scaler,
-            'alpha': self.alpha,
-            'gamma': self.gamma,
+        """保存模型包（系数和标准化统计量为原始数组，见 utils/model_bundle.py）"""
+        save_bundle(path, linear_model_arrays(self.model, self.scaler), meta={
+            'model_type': 'ridge',
+            'alpha': float(self.alpha),
+            'gamma': float(self.gamma),
             'feature_names': self.feature_names
-        }
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
+        })
         print(f"\n[保存] 模型已保存到: {path}")
 
     @classmethod
     def load_model(cls, path: Path):
-        """加载模型"""
-        with open(path, 'rb') as f:
-            model_data = pickle.load(f)
-
-        instance = cls(alpha=model_data['alpha'], gamma=model_data['gamma'])
-        instance.model = model_data['model']
-        instance.scaler = model_data['scaler']
-        instance.feature_names = model_data['feature_names']
+        """加载模型包（系数为只读内存映射）"""
+        bundle = load_bundle(path)
+        meta = bundle.meta
+
+        instance = cls(alpha=meta['alpha'], gamma=meta['gamma'])
+        instance.model, instance.scaler = restore_linear_model(bundle, meta['alpha'])
+        instance.feature_names = meta['feature_names']
         instance.is_fitted = True
 
         return instance
 
 
-def run_ridge_model(data_path: Path, output_dir: Path):
+@cached_stage("ridge", inputs=['data_path'], params=['alpha', 'gamma'])
+def run_ridge_model(data_path: Path, output_dir: Path, alpha: float = 1.0, gamma: float = 0.5):
     """
     运行完整的 Ridge 回归流程
+
+    alpha 为初始值，随后由交叉验证选择。
     """
     print("=" * 80)
     print("Model B1: Ridge Regression for Fan Vote Estimation")
@@ -280,7 +286,7 @@ def run_ridge_model(data_path: Path, output_dir: Path):
 
     # 1. 加载数据
     print("\n[Step 1] 加载处理后的数据")
-    df = pd.read_csv(data_path)
+    df = read_table(data_path)
     print(f"  - 数据形状: {df.shape}")
     print(f"  - 赛季范围: {df['season'].min()} - {df['season'].max()}")
 
@@ -290,7 +296,7 @@ def run_ridge_model(data_path: Path, output_dir: Path):
     print(f"  - 训练集形状: {train_df.shape}")
 
     # 3. 初始化模型
-    model = RidgeFanVoteModel(alpha=1.0, gamma=0.5)
+    model = RidgeFanVoteModel(alpha=alpha, gamma=gamma)
 
     # 4. 准备特征
     print("\n[Step 3] 准备特征和目标变量")
@@ -325,12 +331,12 @@ def run_ridge_model(data_path: Path, output_dir: Path):
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # 保存模型
-    model_path = output_dir / "ridge_model.pkl"
+    model_path = output_dir / "ridge_model.bundle"
     model.save_model(model_path)
 
     # 保存残差和粉丝分数
     results_path = output_dir / "ridge_fan_scores.csv"
-    df_with_residuals.to_csv(results_path, index=False)
+    write_table(df_with_residuals, results_path)
     print(f"[保存] 残差和粉丝分数已保存到: {results_path}")
 
     # 10. 在测试集上验证（S28-S34）
@@ -359,7 +365,7 @@ def run_ridge_model(data_path: Path, output_dir: Path):
 
         # 保存测试集结果
         test_results_path = output_dir / "ridge_fan_scores_test.csv"
-        test_valid_df.to_csv(test_results_path, index=False)
+        write_table(test_valid_df, test_results_path)
         print(f"[保存] 测试集结果已保存到: {test_results_path}")
 
     print("\n" + "=" * 80)
@@ -11,15 +11,47 @@ Model B1 (Updated): Ridge Regression for Weekly Fan Vote Share Estimation
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from sklearn.linear_model import Ridge, RidgeCV
+from sklearn.linear_model import Ridge
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import GroupKFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import matplotlib.pyplot as plt
-import pickle
+
+from utils.cache import cached_stage
+from utils.cross_validation import ridge_alpha_path, season_folds
+from utils.model_bundle import linear_model_arrays, load_bundle, restore_linear_model, save_bundle
+from utils.metrics import build_week_layout, rank_sum_match_rates
+from utils.storage import read_table, write_table
+from utils.week_index import WeekIndex
 from typing import Tuple, Dict
 
 
+def segment_softmax(logits: np.ndarray, groups, scale=1.0) -> np.ndarray:
+    """
+    分段 Softmax：同一组（同一周）内归一化
+
+    share_i = exp(scale × (x_i - max_g x)) / Σ_{j∈g} exp(scale × (x_j - max_g x))
+
+    按组排序后用 np.maximum.reduceat / np.add.reduceat 在一次线性扫描中
+    得到每组的最大值和总和（见 WeekIndex.softmax）。
+
+    Parameters:
+    -----------
+    logits : np.ndarray
+        形状 (n,) 或 (n, k)；k 列各自独立归一化
+    groups : array-like 或 WeekIndex
+        每行的组号（如 ngroup() 得到的周编号），或已构建的周级索引
+    scale : float 或 np.ndarray
+        指数前的系数；二维输入时可按列给出，形状 (k,)
+
+    Returns:
+    --------
+    shares : np.ndarray
+        与 logits 同形状，每组每列之和为 1
+    """
+    index = groups if isinstance(groups, WeekIndex) else WeekIndex(groups)
+    return index.softmax(logits, scale)
+
+
 class RidgeFanVoteModelV2:
     """
     Ridge 回归模型用于估计周级粉丝投票份额（更新版）
@@ -45,6 +77,7 @@ class RidgeFanVoteModelV2:
         self.model = Ridge(alpha=alpha)
         self.scaler = StandardScaler()
         self.feature_names = None
+        self.alpha_path = None
         self.is_fitted = False
         self.residual_std = None  # 用于计算不确定性
 
@@ -86,11 +119,12 @@ class RidgeFanVoteModelV2:
         valid_df = df[df['week_valid'] == True].copy()
 
         # 排除决赛周和人数太少的周
-        week_counts = valid_df.groupby(['season', 'week']).size()
-        valid_weeks = week_counts[week_counts > 3].index
+        week_index = WeekIndex.from_frame(valid_df)
+        keep = week_index.row_sizes() > 3
 
-        valid_df = valid_df.set_index(['season', 'week'])
-        valid_df = valid_df.loc[valid_df.index.isin(valid_weeks)].reset_index()
+        key_cols = ['season', 'week']
+        columns = key_cols + [c for c in valid_df.columns if c not in key_cols]
+        valid_df = valid_df.loc[keep, columns].reset_index(drop=True)
 
         # 构建周级结果分数
         valid_df['week_result_score'] = self.construct_week_result_score(valid_df)
@@ -115,23 +149,24 @@ class RidgeFanVoteModelV2:
 
         return X, y, groups, valid_df
 
-    def find_optimal_alpha(self, X, y, groups, alphas=None):
-        """使用交叉验证找到最优的 alpha"""
+    def find_optimal_alpha(self, X, y, groups, alphas=None, scheme='group_kfold'):
+        """使用交叉验证找到最优的 alpha（每折一次 SVD 闭式求解整条正则化路径）"""
         if alphas is None:
             alphas = np.logspace(-3, 3, 50)
 
         print(f"\n[交叉验证] 搜索最优 alpha...")
         print(f"  - 候选 alpha 范围: {alphas.min():.4f} - {alphas.max():.4f}")
 
-        gkf = GroupKFold(n_splits=5)
-        ridge_cv = RidgeCV(
-            alphas=alphas,
-            cv=gkf.split(X, y, groups),
-            scoring='neg_mean_squared_error'
-        )
-        ridge_cv.fit(X, y)
+        folds = season_folds(groups, n_splits=5, scheme=scheme)
+        mse = ridge_alpha_path(X, y, folds, alphas)
+        self.alpha_path = pd.DataFrame({
+            'alpha': alphas,
+            'cv_mse': mse.mean(axis=0),
+            'cv_mse_std': mse.std(axis=0),
+        })
 
-        optimal_alpha = ridge_cv.alpha_
+        # 并列时取第一个（与 RidgeCV 相同）
+        optimal_alpha = float(alphas[np.argmin(mse.mean(axis=0))])
         print(f"  - 最优 alpha: {optimal_alpha:.4f}")
 
         return optimal_alpha
@@ -193,7 +228,7 @@ class RidgeFanVoteModelV2:
         return residuals, y_pred
 
     def residuals_to_fan_vote_share(self, residuals: np.ndarray,
-                                     week_groups: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+                                     week_groups) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         将残差转换为粉丝投票份额（归一化到 100%）
 
@@ -201,94 +236,125 @@ class RidgeFanVoteModelV2:
         RawVote_i = exp(sensitivity × residual_i)
         FanVoteShare_i = RawVote_i / Σ(RawVote_j) for j in same week
 
+        week_groups 为每行的周编号（ngroup()）或 WeekIndex。
+
         Returns:
         --------
         fan_vote_share : 粉丝投票份额 [0, 1]
         uncertainty_lower : 不确定性下界
         uncertainty_upper : 不确定性上界
         """
-        # 计算原始投票（未归一化）——使用数值稳定化
-        raw_logits = self.sensitivity * residuals
-
-        # 按周归一化
-        fan_vote_share = np.zeros_like(residuals)
-        uncertainty_lower = np.zeros_like(residuals)
-        uncertainty_upper = np.zeros_like(residuals)
-
-        for week_id in week_groups.unique():
-            mask = (week_groups == week_id).values
-            week_logits = raw_logits[mask]
-            week_logits = week_logits - week_logits.max()
-            week_raw_votes = np.exp(week_logits)
-            week_sum = week_raw_votes.sum()
-
-            # 归一化到 [0, 1]
-            fan_vote_share[mask] = week_raw_votes / (week_sum + 1e-12)
-
-            # 计算不确定性（基于残差的标准差）
-            # 使用 ±1 std 作为置信区间
-            residuals_lower = residuals[mask] - self.residual_std
-            residuals_upper = residuals[mask] + self.residual_std
+        residuals = np.asarray(residuals, dtype=float)
 
-            raw_votes_lower = np.exp(self.sensitivity * (residuals_lower - residuals_lower.max()))
-            raw_votes_upper = np.exp(self.sensitivity * (residuals_upper - residuals_upper.max()))
+        # 三列一起做分段 Softmax：份额、下界、上界
+        # 不确定性基于残差的标准差，使用 ±1 std 作为置信区间
+        logits = np.column_stack([
+            self.sensitivity * residuals,
+            residuals - self.residual_std,
+            residuals + self.residual_std,
+        ])
+        scale = np.array([1.0, self.sensitivity, self.sensitivity])
 
-            # 重新归一化
-            week_sum_lower = raw_votes_lower.sum()
-            week_sum_upper = raw_votes_upper.sum()
+        shares = segment_softmax(logits, week_groups, scale)
 
-            uncertainty_lower[mask] = raw_votes_lower / (week_sum_lower + 1e-12)
-            uncertainty_upper[mask] = raw_votes_upper / (week_sum_upper + 1e-12)
+        return shares[:, 0], shares[:, 1], shares[:, 2]
 
-        return fan_vote_share, uncertainty_lower, uncertainty_upper
-
-    def calibrate_sensitivity(self, X, y, df, sensitivity_range=None):
+    def calibrate_sensitivity(self, X, y, df, sensitivity_range=None,
+                              refine_rounds: int = 0, refine_points: int = 50):
         """
         校准敏感度系数（α），使淘汰匹配率最大化
 
         策略：
-        1. 尝试不同的 sensitivity 值
-        2. 对每个值，计算估算的粉丝投票份额
-        3. 使用投票规则重建淘汰结果
-        4. 计算淘汰匹配率
-        5. 选择匹配率最高的 sensitivity
+        1. 一次性计算所有候选 sensitivity 的粉丝投票份额（候选数 × 行数 矩阵）
+        2. 按周向量化重建淘汰结果，得到每个候选的淘汰匹配率
+        3. 选择匹配率最高的 sensitivity（并列时取靠前者）
+        4. refine_rounds > 0 时，在最优值相邻两个候选之间再取 refine_points 个点，
+           逐轮缩小区间（bracket refinement）
+
+        Parameters:
+        -----------
+        sensitivity_range : array-like
+            初始候选网格，默认 np.linspace(0.1, 2.0, 20)
+        refine_rounds : int
+            区间细化轮数
+        refine_points : int
+            每轮细化的候选数
         """
         if sensitivity_range is None:
             sensitivity_range = np.linspace(0.1, 2.0, 20)
+        grid = np.asarray(sensitivity_range, dtype=float)
 
         print("\n" + "=" * 60)
         print("校准敏感度系数（Sensitivity Calibration）")
         print("=" * 60)
 
         residuals, _ = self.compute_residuals(X, y)
-        week_groups = df.groupby(['season', 'week']).ngroup()
+        layout = build_week_layout(df, WeekIndex.from_frame(df))
+
+        print(f"\n尝试 {len(grid)} 个 sensitivity 值...")
+        rates = self.batch_match_rates(residuals, grid, layout)
 
         best_sensitivity = self.sensitivity
         best_match_rate = 0
+        best_idx = int(np.argmax(rates))
+        if rates[best_idx] > best_match_rate:
+            best_match_rate = rates[best_idx]
+            best_sensitivity = grid[best_idx]
+
+        n_evaluated = len(grid)
+        for _ in range(refine_rounds):
+            lo = grid[max(best_idx - 1, 0)]
+            hi = grid[min(best_idx + 1, len(grid) - 1)]
+            if hi <= lo:
+                break
+            grid = np.linspace(lo, hi, refine_points)
+            rates = self.batch_match_rates(residuals, grid, layout)
+            n_evaluated += len(grid)
+
+            best_idx = int(np.argmax(rates))
+            if rates[best_idx] > best_match_rate:
+                best_match_rate = rates[best_idx]
+                best_sensitivity = grid[best_idx]
+            else:
+                # 没有改进时以当前最优值为中心继续缩小区间
+                best_idx = int(np.argmin(np.abs(grid - best_sensitivity)))
+
+        if refine_rounds > 0:
+            print(f"  - 区间细化 {refine_rounds} 轮，共评估 {n_evaluated} 个值")
 
-        print(f"\n尝试 {len(sensitivity_range)} 个 sensitivity 值...")
+        self.sensitivity = best_sensitivity
 
-        for sens in sensitivity_range:
-            self.sensitivity = sens
+        print(f"\n[最优 Sensitivity]: {best_sensitivity:.4f}")
+        print(f"[最高淘汰匹配率]: {best_match_rate:.2%}")
 
-            # 计算粉丝投票份额
-            fan_shares, _, _ = self.residuals_to_fan_vote_share(residuals, week_groups)
-            df_temp = df.copy()
-            df_temp['est_fan_vote_share'] = fan_shares
+        return best_sensitivity
 
-            # 计算淘汰匹配率
-            match_rate = self.compute_elimination_match_rate(df_temp)
+    def batch_match_rates(self, residuals: np.ndarray, sensitivities: np.ndarray,
+                          layout: Dict, chunk_size: int = 64) -> np.ndarray:
+        """
+        批量计算多个 sensitivity 下的淘汰匹配率
 
-            if match_rate > best_match_rate:
-                best_match_rate = match_rate
-                best_sensitivity = sens
+        与 compute_elimination_match_rate 的规则相同（Rank Sum，粉丝排名取平均名次，
+        综合排名并列时取周内靠前的行）。
 
-        self.sensitivity = best_sensitivity
+        Returns:
+        --------
+        rates : np.ndarray
+            形状 (len(sensitivities),)
+        """
+        sensitivities = np.asarray(sensitivities, dtype=float)
+        rates = np.zeros(len(sensitivities))
+        if layout['n_counted'] == 0:
+            return rates
 
-        print(f"\n[最优 Sensitivity]: {best_sensitivity:.4f}")
-        print(f"[最高淘汰匹配率]: {best_match_rate:.2%}")
+        residuals = np.asarray(residuals, dtype=float)
+        for start in range(0, len(sensitivities), chunk_size):
+            sens = sensitivities[start:start + chunk_size]
+            # (行数, 候选数)，每列一个 sensitivity
+            shares = segment_softmax(np.outer(residuals, sens), layout['index'])
+            rates[start:start + chunk_size] = rank_sum_match_rates(shares.T, layout)
 
-        return best_sensitivity
+        return rates
 
     def compute_elimination_match_rate(self, df: pd.DataFrame) -> float:
         """
@@ -299,60 +365,46 @@ class RidgeFanVoteModelV2:
         2. 找出预测的淘汰者
         3. 与实际淘汰者比较
         """
-        correct_eliminations = 0
-        total_weeks = 0
-
-        for (season, week), group in df.groupby(['season', 'week']):
-            if len(group) <= 3:  # 跳过人数太少的周
-                continue
-
-            # 使用 Rank Sum 方法（简化）
-            judge_rank = group['judge_rank_in_week']
-            fan_rank = group['est_fan_vote_share'].rank(ascending=False)
-
-            combined_rank = judge_rank + fan_rank
-
-            # 预测淘汰者（综合排名最差）
-            predicted_eliminated = combined_rank.idxmax()
-
-            # 实际淘汰者（当周被淘汰的人）
-            # 简化：假设 placement 最差且 week == elimination_week 的人
-            actual_eliminated_mask = (
-                (group['week'] == group['elimination_week']) &
-                (group['elimination_week'] > 0)
-            )
-
-            if actual_eliminated_mask.any():
-                actual_eliminated = group[actual_eliminated_mask].index[0]
-
-                if predicted_eliminated == actual_eliminated:
-                    correct_eliminations += 1
-
-                total_weeks += 1
-
-        if total_weeks == 0:
+        layout = build_week_layout(df, WeekIndex.from_frame(df))
+        if layout['n_counted'] == 0:
             return 0.0
 
-        return correct_eliminations / total_weeks
+        shares = df['est_fan_vote_share'].to_numpy(dtype=float)[None, :]
+        return float(rank_sum_match_rates(shares, layout)[0])
 
     def save_model(self, path: Path):
-        """保存模型"""
-        model_data = {
-            'model': self.model,
-            'scaler': self.scaler,
-            'alpha': self.alpha,
-            'sensitivity': self.sensitivity,
-            'feature_names': self.feature_names,
-            'residual_std': self.residual_std
-        }
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
+        """保存模型包（系数和标准化统计量为原始数组，见 utils/model_bundle.py）"""
+        save_bundle(path, linear_model_arrays(self.model, self.scaler), meta={
+            'model_type': 'ridge_v2',
+            'alpha': float(self.alpha),
+            'sensitivity': float(self.sensitivity),
+            'residual_std': float(self.residual_std),
+            'feature_names': self.feature_names
+        })
         print(f"\n[保存] 模型已保存到: {path}")
 
+    @classmethod
+    def load_model(cls, path: Path):
+        """加载模型包（系数为只读内存映射）"""
+        bundle = load_bundle(path)
+        meta = bundle.meta
+
+        instance = cls(alpha=meta['alpha'], sensitivity=meta['sensitivity'])
+        instance.model, instance.scaler = restore_linear_model(bundle, meta['alpha'])
+        instance.feature_names = meta['feature_names']
+        instance.residual_std = meta['residual_std']
+        instance.is_fitted = True
+
+        return instance
 
-def run_ridge_model_v2(data_path: Path, output_dir: Path):
+
+@cached_stage("ridge_v2", inputs=['data_path'], params=['alpha', 'sensitivity'])
+def run_ridge_model_v2(data_path: Path, output_dir: Path,
+                       alpha: float = 1.0, sensitivity: float = 1.0):
     """
     运行更新后的 Ridge 回归流程
+
+    alpha / sensitivity 为初始值，随后由交叉验证和淘汰匹配率校准。
     """
     print("=" * 80)
     print("Model B1 V2: Ridge Regression for Weekly Fan Vote Share Estimation")
@@ -360,7 +412,7 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
 
     # 1. 加载数据
     print("\n[Step 1] 加载处理后的数据")
-    df = pd.read_csv(data_path)
+    df = read_table(data_path)
     print(f"  - 数据形状: {df.shape}")
 
     # 2. 准备训练集
@@ -368,7 +420,7 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
     train_df = df[df['season'] <= 27].copy()
 
     # 3. 初始化模型
-    model = RidgeFanVoteModelV2(alpha=1.0, sensitivity=1.0)
+    model = RidgeFanVoteModelV2(alpha=alpha, sensitivity=sensitivity)
 
     # 4. 准备特征
     print("\n[Step 3] 准备特征和目标变量")
@@ -390,7 +442,7 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
 
     # 8. 计算粉丝投票份额
     print("\n[Step 7] 计算粉丝投票份额")
-    week_groups = train_valid_df.groupby(['season', 'week']).ngroup()
+    week_groups = WeekIndex.from_frame(train_valid_df)
     fan_shares, uncertainty_lower, uncertainty_upper = model.residuals_to_fan_vote_share(
         residuals, week_groups
     )
@@ -416,11 +468,11 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
     # 10. 保存结果
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    model_path = output_dir / "ridge_model_v2.pkl"
+    model_path = output_dir / "ridge_model_v2.bundle"
     model.save_model(model_path)
 
     results_path = output_dir / "ridge_fan_vote_shares_v2.csv"
-    train_valid_df.to_csv(results_path, index=False)
+    write_table(train_valid_df, results_path)
     print(f"[保存] 结果已保存到: {results_path}")
 
     # 11. 测试集验证
@@ -442,7 +494,7 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
 
         # 计算测试集的残差和粉丝投票份额
         residuals_test, _ = model.compute_residuals(X_test, y_test)
-        week_groups_test = test_valid_df.groupby(['season', 'week']).ngroup()
+        week_groups_test = WeekIndex.from_frame(test_valid_df)
         fan_shares_test, uncertainty_lower_test, uncertainty_upper_test = model.residuals_to_fan_vote_share(
             residuals_test, week_groups_test
         )
@@ -455,7 +507,7 @@ def run_ridge_model_v2(data_path: Path, output_dir: Path):
 
         # 保存测试集结果
         test_results_path = output_dir / "ridge_fan_vote_shares_v2_test.csv"
-        test_valid_df.to_csv(test_results_path, index=False)
+        write_table(test_valid_df, test_results_path)
         print(f"[保存] 测试集结果已保存到: {test_results_path}")
 
     print("\n" + "=" * 80)
@@ -0,0 +1,264 @@
+"""
+整季顺序回放 (Full-Season Sequential Replay)
+
+simulate_all_weeks 在每周的历史选手集合上独立模拟，反事实淘汰不会影响之后的周。
+回放引擎按周推进每个赛季，各规则维护自己的幸存名单：
+
+- 名单为每个赛季一个 (批数, 选手数) 的布尔数组，被淘汰者置为 False
+- 每周只在幸存者之间排名；粉丝份额在幸存者中重新归一化（周内 softmax）
+- 淘汰人数沿用历史：第 e 周淘汰历史上在第 e 周被淘汰的人数；
+  退赛者在其最后一次出场后的下一周退出
+- 历史上已离开、反事实中仍存活的选手沿用最后一次观测：
+  相对评委分（judge_total / 当周均值）与中心化的粉丝 logit（log 份额 - 当周均值）
+- 所有淘汰周之后的幸存者为决赛选手，在最后一周上反复应用规则决定名次
+
+所有规则对评委分的周内缩放不变（排名、占比、除以最高分），
+因此相对评委分可以直接代替 judge_total。
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.voting_rules import DEFAULT_RULES, WeekArrays, get_rules
+
+# 决赛选手的淘汰周（与 elimination_week 的约定一致）
+FINALIST_WEEK = 999
+
+
+def _forward_fill_index(observed: np.ndarray) -> np.ndarray:
+    """沿第 0 维（周）的最近一次观测下标，从未观测为 -1"""
+    weeks = np.arange(observed.shape[0])[:, None]
+    return np.maximum.accumulate(np.where(observed, weeks, -1), axis=0)
+
+
+class SeasonReplayEngine:
+    """
+    整季顺序回放引擎
+
+    构建时对每个赛季只做一次预处理（稠密的 周 × 选手 矩阵、淘汰日程），
+    replay 对一批粉丝投票面板 (批数, 行数) 同时回放全部赛季和规则。
+
+    Parameters:
+    -----------
+    data : DataFrame
+        周级数据（有效周的行），包含 judge_total、fan_vote_share、
+        elimination_week 和 placement
+    total_weeks : dict 或 pd.Series, optional
+        赛季 -> 总周数（AWVS 等规则使用），默认取 data 中每个赛季的最大周次
+    """
+
+    def __init__(self, data: pd.DataFrame, total_weeks=None):
+        data = data[data['week_valid'] == True].reset_index(drop=True)
+        self.data = data
+        self.n_rows = len(data)
+
+        # 选手表：每个 (赛季, 选手) 一行，全局编号即行号
+        self.contestants = (
+            data.groupby(['season', 'celebrity_name'], sort=True)
+            .agg(elimination_week=('elimination_week', 'first'), placement=('placement', 'first'))
+            .reset_index()
+        )
+        contestant_id = pd.MultiIndex.from_frame(self.contestants[['season', 'celebrity_name']])
+
+        if total_weeks is None:
+            total_weeks = data.groupby('season')['week'].max()
+        total_weeks = pd.Series(total_weeks)
+
+        judge = data['judge_total'].to_numpy(dtype=float)
+        trend = np.nan_to_num(data['trend'].to_numpy(dtype=float), nan=0.0) \
+            if 'trend' in data.columns else np.zeros(len(data))
+        row_contestant = contestant_id.get_indexer(pd.MultiIndex.from_frame(data[['season', 'celebrity_name']]))
+
+        self.plans = []
+        for season, members in self.contestants.groupby('season').groups.items():
+            self.plans.append(self._plan_season(
+                season, np.asarray(members), data, row_contestant, judge, trend,
+                float(total_weeks.loc[season])
+            ))
+
+    def _plan_season(self, season, members: np.ndarray, data: pd.DataFrame,
+                     row_contestant: np.ndarray, judge: np.ndarray, trend: np.ndarray,
+                     total_weeks: float) -> Dict:
+        """单个赛季的稠密矩阵和淘汰日程"""
+        season_rows = np.flatnonzero(data['season'].to_numpy() == season)
+        weeks = np.unique(data['week'].to_numpy()[season_rows])
+        n_weeks, n_contestants = len(weeks), len(members)
+
+        # rows[w, c]: 第 w 周选手 c 的数据行号（-1 = 无观测）
+        rows = np.full((n_weeks, n_contestants), -1, dtype=np.int64)
+        week_pos = np.searchsorted(weeks, data['week'].to_numpy()[season_rows])
+        rows[week_pos, row_contestant[season_rows] - members[0]] = season_rows
+        observed = rows >= 0
+        source = _forward_fill_index(observed)
+
+        # 相对评委分：除以当周（观测到的选手）均值，再沿用最后一次观测
+        week_judge = np.where(observed, judge[rows], np.nan)
+        relative = week_judge / np.nanmean(week_judge, axis=1, keepdims=True)
+        carried = np.maximum(source, 0)
+        columns = np.arange(n_contestants)
+        judge_rel = np.where(source >= 0, relative[carried, columns], np.nan)
+        week_trend = np.where(observed, trend[np.maximum(rows, 0)], 0.0)
+
+        # 淘汰日程：(周次标签, 使用的数据周, 淘汰人数, 退赛选手)
+        elimination_week = self.contestants['elimination_week'].to_numpy()[members]
+        last_seen = np.where(observed.any(axis=0), n_weeks - 1 - observed[::-1].argmax(axis=0), -1)
+        events = {}
+        for c in range(n_contestants):
+            if elimination_week[c] == -1:
+                # 退赛：最后一次出场后的下一周退出
+                label = weeks[last_seen[c] + 1] if last_seen[c] + 1 < n_weeks else weeks[-1] + 1
+                events.setdefault(label, [0, []])[1].append(c)
+            elif 0 < elimination_week[c] < FINALIST_WEEK:
+                events.setdefault(elimination_week[c], [0, []])[0] += 1
+
+        schedule = []
+        for label in sorted(events):
+            data_week = max(int(np.searchsorted(weeks, label, side='right')) - 1, 0)
+            n_out, withdrawn = events[label]
+            schedule.append((int(label), data_week, n_out, np.asarray(withdrawn, dtype=np.int64)))
+
+        return {
+            'season': season,
+            'members': members,
+            'weeks': weeks,
+            'rows': rows,
+            'source': source,
+            'judge_rel': judge_rel,
+            'trend': week_trend,
+            'schedule': schedule,
+            'total_weeks': total_weeks,
+        }
+
+    def _season_logits(self, plan: Dict, fan_votes: np.ndarray) -> np.ndarray:
+        """(批数, 周数, 选手数) 的中心化粉丝 logit，沿用最后一次观测"""
+        rows = plan['rows']
+        logits = np.log(np.clip(fan_votes[:, np.maximum(rows, 0)], 1e-300, None))
+        logits = np.where(rows >= 0, logits, np.nan)
+        logits = logits - np.nanmean(logits, axis=2, keepdims=True)
+
+        source = plan['source']
+        columns = np.arange(rows.shape[1])
+        carried = logits[:, np.maximum(source, 0), columns]
+        return np.where(source >= 0, carried, np.nan)
+
+    @staticmethod
+    def _week_arrays(plan: Dict, logits: np.ndarray, alive: np.ndarray, w: int,
+                     label: int) -> WeekArrays:
+        """幸存者的当周输入：淘汰者为 NaN，粉丝份额在幸存者中 softmax"""
+        fan_logit = np.where(alive, logits[:, w], np.nan)
+        raw = np.exp(fan_logit - np.nanmax(fan_logit, axis=1, keepdims=True))
+        fan = raw / np.nansum(raw, axis=1, keepdims=True)
+        judge = np.where(alive, plan['judge_rel'][w], np.nan)
+        trend = np.where(alive, plan['trend'][w], 0.0)
+        return WeekArrays(
+            judge=judge[:, None, :],
+            fan=fan[:, None, :],
+            week=np.array([label]),
+            total_weeks=np.array([plan['total_weeks']]),
+            trend=trend[:, None, :],
+        )
+
+    def _eliminate(self, rule, plan: Dict, logits: np.ndarray, alive: np.ndarray,
+                   placement: np.ndarray, w: int, label: int, n_out: int) -> np.ndarray:
+        """按规则逐个淘汰 n_out 人（每淘汰一人重新归一化），返回被淘汰者的本地编号"""
+        batch = np.arange(alive.shape[0])
+        eliminated = np.full((alive.shape[0], n_out), -1, dtype=np.int64)
+        for k in range(n_out):
+            remaining = alive.sum(axis=1)
+            active = remaining > 1
+            if not active.any():
+                break
+            pos = rule.select(self._week_arrays(plan, logits, alive, w, label))[:, 0, 0]
+            pos = np.where(active, pos, -1)
+            hit = pos >= 0
+            placement[batch[hit], pos[hit]] = remaining[hit]
+            alive[batch[hit], pos[hit]] = False
+            eliminated[:, k] = pos
+        return eliminated
+
+    def replay(self, fan_votes: np.ndarray = None,
+               rules: Sequence[str] = DEFAULT_RULES) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        回放全部赛季
+
+        Parameters:
+        -----------
+        fan_votes : np.ndarray, optional
+            (行数,) 或 (批数, 行数)，与 self.data 的行对齐；默认使用 fan_vote_share
+        rules : Sequence[str]
+            已注册的规则名
+
+        Returns:
+        --------
+        results : Dict[str, Dict]
+            results[rule]['placement']: (批数, 选手数) 反事实名次
+            results[rule]['elimination_week']: (批数, 选手数) 反事实淘汰周，决赛选手为 999
+            选手顺序与 self.contestants 一致；一维输入时去掉批维度
+        """
+        if fan_votes is None:
+            fan_votes = self.data['fan_vote_share'].to_numpy(dtype=float)
+        fan_votes = np.asarray(fan_votes, dtype=float)
+        single = fan_votes.ndim == 1
+        fan_votes = np.atleast_2d(fan_votes)
+        n_batch = fan_votes.shape[0]
+        n_total = len(self.contestants)
+
+        results = {
+            rule.name: {
+                'placement': np.zeros((n_batch, n_total), dtype=np.int16),
+                'elimination_week': np.full((n_batch, n_total), FINALIST_WEEK, dtype=np.int16),
+            }
+            for rule in get_rules(rules)
+        }
+
+        for plan in self.plans:
+            logits = self._season_logits(plan, fan_votes)
+            members = plan['members']
+            final_week = len(plan['weeks']) - 1
+
+            for rule in get_rules(rules):
+                alive = np.ones((n_batch, len(members)), dtype=bool)
+                placement = np.zeros((n_batch, len(members)), dtype=np.int16)
+                elim_week = np.full((n_batch, len(members)), FINALIST_WEEK, dtype=np.int16)
+
+                for label, w, n_out, withdrawn in plan['schedule']:
+                    # 退赛者先退出（已被淘汰的不再计入）
+                    for c in withdrawn:
+                        still = alive[:, c]
+                        placement[still, c] = alive[still].sum(axis=1)
+                        elim_week[still, c] = label
+                        alive[still, c] = False
+                    if n_out:
+                        eliminated = self._eliminate(rule, plan, logits, alive, placement, w, label, n_out)
+                        batch, k = np.nonzero(eliminated >= 0)
+                        elim_week[batch, eliminated[batch, k]] = label
+
+                # 决赛：在最后一周上反复应用规则，剩下的最后一人为冠军
+                n_final = int(alive.sum(axis=1).max())
+                if n_final > 1:
+                    self._eliminate(rule, plan, logits, alive, placement, final_week,
+                                    int(plan['weeks'][-1]), n_final - 1)
+                placement[alive] = 1
+
+                results[rule.name]['placement'][:, members] = placement
+                results[rule.name]['elimination_week'][:, members] = elim_week
+
+        if single:
+            results = {name: {key: value[0] for key, value in arrays.items()}
+                       for name, arrays in results.items()}
+        return results
+
+    def replay_frame(self, rules: Sequence[str] = DEFAULT_RULES) -> pd.DataFrame:
+        """
+        用点估计的粉丝份额回放，每个 (赛季, 选手) 一行
+
+        列：season, celebrity_name, elimination_week, placement（历史），
+        以及每条规则的 <rule>_elimination_week 和 <rule>_placement
+        """
+        results = self.replay(rules=rules)
+        replay_df = self.contestants.copy()
+        for name, arrays in results.items():
+            replay_df[f'{name}_elimination_week'] = arrays['elimination_week'].astype(int)
+            replay_df[f'{name}_placement'] = arrays['placement'].astype(int)
+        return replay_df
@@ -0,0 +1,130 @@
+"""
+树集成的数组表示 (Tree Ensemble Arrays)
+
+把 sklearn 随机森林的所有树拼接成一组扁平的节点数组：
+
+- children_left / children_right: 子节点的全局编号，叶节点为 -1
+- feature / threshold: 分裂特征和阈值（x[feature] <= threshold 走左子树）
+- value: 节点预测值（叶节点即树的输出）
+- n_node_samples / weighted_n_node_samples: 节点样本数（TreeSHAP 的覆盖度）
+- tree_offsets: 第 t 棵树的节点是 [tree_offsets[t], tree_offsets[t + 1])
+
+这些数组直接写入模型包（utils/model_bundle.py），加载后即可预测和解释，
+不需要反序列化 sklearn 对象。
+"""
+from typing import Dict
+
+import numpy as np
+
+NODE_ARRAYS = ('children_left', 'children_right', 'feature', 'threshold', 'value',
+               'n_node_samples', 'weighted_n_node_samples')
+
+
+class TreeEnsemble:
+    """
+    平均型树集成（随机森林回归）的扁平节点数组
+
+    Parameters:
+    -----------
+    arrays : Mapping[str, np.ndarray]
+        NODE_ARRAYS 中的节点数组、tree_offsets 和 feature_importances
+        （可以是模型包中的只读内存映射）
+    """
+
+    def __init__(self, arrays):
+        for name in NODE_ARRAYS + ('tree_offsets', 'feature_importances'):
+            setattr(self, name, arrays[name])
+        self.n_trees = len(self.tree_offsets) - 1
+        self.n_features = len(self.feature_importances)
+        self.roots = np.asarray(self.tree_offsets[:-1])
+        self.max_depth = self._max_depth()
+
+    @classmethod
+    def from_sklearn(cls, forest) -> 'TreeEnsemble':
+        """从已训练的 RandomForestRegressor（单输出）构建"""
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.zeros(len(trees) + 1, dtype=np.int64)
+        np.cumsum([tree.node_count for tree in trees], out=offsets[1:])
+
+        def concat(get, dtype):
+            return np.concatenate([np.asarray(get(tree), dtype=dtype) for tree in trees])
+
+        # 子节点编号转为全局编号（叶节点保持 -1）
+        children = {}
+        for side in ('children_left', 'children_right'):
+            children[side] = np.concatenate([
+                np.where(getattr(tree, side) >= 0, getattr(tree, side) + offset, -1)
+                for tree, offset in zip(trees, offsets[:-1])
+            ]).astype(np.int64)
+
+        return cls({
+            **children,
+            'feature': concat(lambda tree: tree.feature, np.int64),
+            'threshold': concat(lambda tree: tree.threshold, np.float64),
+            'value': concat(lambda tree: tree.value[:, 0, 0], np.float64),
+            'n_node_samples': concat(lambda tree: tree.n_node_samples, np.int64),
+            'weighted_n_node_samples': concat(lambda tree: tree.weighted_n_node_samples, np.float64),
+            'tree_offsets': offsets,
+            'feature_importances': np.asarray(forest.feature_importances_, dtype=np.float64),
+        })
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """写入模型包的数组"""
+        return {name: getattr(self, name)
+                for name in NODE_ARRAYS + ('tree_offsets', 'feature_importances')}
+
+    def _max_depth(self) -> int:
+        """所有树的最大深度（按层展开一次）"""
+        depth = 0
+        nodes = self.roots
+        while True:
+            nodes = np.concatenate([self.children_left[nodes], self.children_right[nodes]])
+            nodes = nodes[nodes >= 0]
+            if len(nodes) == 0:
+                return depth
+            depth += 1
+
+    @property
+    def feature_importances_(self) -> np.ndarray:
+        """与 sklearn 的 feature_importances_ 相同"""
+        return np.asarray(self.feature_importances)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """每个样本在每棵树中到达的叶节点全局编号，(样本数, 树数)"""
+        # 与 sklearn 一致：特征先转为 float32 再与阈值比较
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            left = self.children_left[nodes]
+            internal = left >= 0
+            # 叶节点的 feature 为 -2，取 0 号特征占位（结果不使用）
+            go_left = X[rows, np.maximum(self.feature[nodes], 0)] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left, self.children_right[nodes]), nodes)
+        return nodes
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """各树叶节点值的平均"""
+        return self.value[self.apply(X)].mean(axis=1)
+
+    def to_shap_model(self) -> Dict:
+        """
+        shap.TreeExplainer 接受的字典格式（每棵树一个节点数组字典，
+        叶值除以树数，使各树之和等于森林预测）
+        """
+        trees = []
+        for t in range(self.n_trees):
+            start, end = self.tree_offsets[t], self.tree_offsets[t + 1]
+            local = {}
+            for side in ('children_left', 'children_right'):
+                child = np.asarray(getattr(self, side)[start:end])
+                local[side] = np.where(child >= 0, child - start, -1)
+            trees.append({
+                **local,
+                'children_default': local['children_left'].copy(),
+                'features': np.asarray(self.feature[start:end]),
+                'thresholds': np.asarray(self.threshold[start:end]),
+                'values': np.asarray(self.value[start:end])[:, None] / self.n_trees,
+                'node_sample_weight': np.asarray(self.weighted_n_node_samples[start:end]),
+            })
+        return {'trees': trees}
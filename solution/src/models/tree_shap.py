@@ -0,0 +1,399 @@
+"""
+树集成的 TreeSHAP (Path-Dependent TreeSHAP on Tree Ensemble Arrays)
+
+直接在 TreeEnsemble 的扁平节点数组上计算 SHAP 值和 SHAP 交互值，
+结果与 shap.TreeExplainer(feature_perturbation='tree_path_dependent') 相同，
+不依赖 shap 库。
+
+对每个叶节点 l，记路径上出现的不同特征为 j = 1..m：
+- z_j: 该特征各分裂边的覆盖度比例之积（与样本无关，预先计算）
+- o_j(x): x 是否满足该特征在路径上的全部分裂条件（0/1）
+
+则叶节点对特征 i 的贡献为 v_l (o_i - z_i) Σ_S w(|S|, m) Π_{j∈S} o_j Π_{j∉S} z_j
+（S 取遍其余 m-1 个特征的子集）。Shapley 权重是 Beta 积分
+w(k, m) = k! (m-k-1)! / m! = ∫_0^1 t^k (1-t)^(m-k-1) dt，因此子集求和等于
+
+    ∫_0^1 Π_{j≠i} (z_j (1-t) + o_j t) dt
+
+被积函数是 m-1 次多项式，ceil(m/2) 个 Gauss-Legendre 节点即可精确求积。
+各节点处先求全部 m 个因子之积，再除以第 i 个因子得到留一积；
+因子均为正数，没有相消误差。每个 (样本, 叶节点) 的开销为 O(m²/2)，
+按 m 把叶节点分组后整块向量化；叶节点的贡献只取决于 o 的 0/1 模式，
+每批样本只对出现过的 (叶节点, 模式) 计算一次，再按模式取回（Fast TreeSHAP v2
+的查表思路，但不预先枚举全部 2^m 个模式，内存与批大小成正比）。
+
+交互值 Φ_ij（i ≠ j，与 shap 相同的约定：完整交互效应为 2 Φ_ij）
+只由路径上同时出现 i 和 j 的叶节点贡献，同样的积分再除去第 j 个因子：
+
+    ½ v_l (o_i - z_i)(o_j - z_j) ∫_0^1 Π_{k≠i,j} (z_k (1-t) + o_k t) dt
+
+- explain_to_parts: 按行分片交给进程池，工作进程由模型包路径重新内存映射
+  节点数组（只读共享页缓存），每个分片完成后立即写出一个列式分片
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from models.tree_ensemble import TreeEnsemble
+from utils.model_bundle import ModelBundle
+from utils.storage import list_parts, write_part
+
+# 每块 (键数 × 路径特征数 × 求积节点数) 的元素上限，控制中间数组内存
+BLOCK_ELEMENTS = 1 << 22
+
+
+def _quadrature(m: int) -> Tuple[np.ndarray, np.ndarray]:
+    """[0, 1] 上对 m-1 次多项式精确的 Gauss-Legendre 节点和权重"""
+    nodes, weights = np.polynomial.legendre.leggauss(max(1, -(-m // 2)))
+    return (nodes + 1) / 2, weights / 2
+
+
+def _blocks(n: int, width: int):
+    """按 BLOCK_ELEMENTS 切分 n 行（每行 width 个元素）"""
+    size = max(1, BLOCK_ELEMENTS // max(width, 1))
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+
+class TreeShapExplainer:
+    """
+    平均型树集成的精确 TreeSHAP
+
+    Parameters:
+    -----------
+    forest : TreeEnsemble
+        树集成（节点数组可以是模型包中的只读内存映射）
+
+    Attributes:
+    -----------
+    expected_value : float
+        覆盖度加权的平均预测（SHAP 值之和 + expected_value = 预测值）
+    thresholds : List[np.ndarray]
+        每个特征的全部分裂阈值（排序去重），样本先按它分箱
+    groups : Dict[int, Dict[str, np.ndarray]]
+        路径特征数 m -> 该组叶节点的 feature / z / lower / upper (叶数, m) 与 value (叶数,)；
+        lower / upper 为分箱编号，o_j(x) = lower < bin(x) <= upper
+    """
+
+    def __init__(self, forest: TreeEnsemble):
+        self.forest = forest
+        self.n_features = forest.n_features
+        split = np.asarray(forest.children_left) >= 0
+        feature = np.asarray(forest.feature)[split]
+        threshold = np.asarray(forest.threshold)[split]
+        self.thresholds = [np.unique(threshold[feature == f]) for f in range(self.n_features)]
+        # 分箱编号 -1 .. len(thresholds)
+        self.bin_dtype = np.int16 if max(map(len, self.thresholds), default=0) < 2 ** 15 - 1 else np.int32
+        self.groups = self._leaf_paths()
+        self.expected_value = float(sum(
+            (group['value'] * group['z'].prod(axis=1)).sum() for group in self.groups.values()
+        ))
+
+    @classmethod
+    def from_bundle(cls, bundle: ModelBundle) -> 'TreeShapExplainer':
+        return cls(TreeEnsemble(bundle))
+
+    def _leaf_paths(self) -> Dict[int, Dict[str, np.ndarray]]:
+        """
+        自叶节点向上回溯（按层向量化），合并同一特征的多次分裂：
+        z 相乘，取值区间 (lower, upper] 取交集
+        """
+        forest = self.forest
+        left = np.asarray(forest.children_left)
+        right = np.asarray(forest.children_right)
+        cover = np.asarray(forest.weighted_n_node_samples, dtype=np.float64)
+        n_nodes = len(left)
+
+        parent = np.full(n_nodes, -1, dtype=np.int64)
+        internal = np.flatnonzero(left >= 0)
+        parent[left[internal]] = internal
+        parent[right[internal]] = internal
+
+        # 节点阈值在所属特征阈值表中的位置：x <= threshold  <=>  bin(x) <= 位置
+        position = np.zeros(n_nodes, dtype=np.int64)
+        node_feature = np.asarray(forest.feature)
+        for f, thresholds in enumerate(self.thresholds):
+            nodes = internal[node_feature[internal] == f]
+            position[nodes] = np.searchsorted(thresholds, np.asarray(forest.threshold)[nodes])
+
+        leaves = np.flatnonzero(left < 0)
+        rows = np.arange(len(leaves))
+        z = np.ones((len(leaves), self.n_features))
+        lower = np.full((len(leaves), self.n_features), -1, dtype=np.int64)
+        upper = np.array([len(t) for t in self.thresholds])[None, :].repeat(len(leaves), axis=0)
+        on_path = np.zeros((len(leaves), self.n_features), dtype=bool)
+
+        node = leaves.copy()
+        for _ in range(forest.max_depth):
+            up = parent[node]
+            active = up >= 0
+            if not active.any():
+                break
+            r, child, p = rows[active], node[active], up[active]
+            feat = node_feature[p]
+            went_left = left[p] == child
+
+            z[r, feat] *= cover[child] / cover[p]
+            on_path[r, feat] = True
+            # 左子树收紧上界，右子树收紧下界
+            upper[r[went_left], feat[went_left]] = np.minimum(
+                upper[r[went_left], feat[went_left]], position[p[went_left]])
+            lower[r[~went_left], feat[~went_left]] = np.maximum(
+                lower[r[~went_left], feat[~went_left]], position[p[~went_left]])
+            node = np.where(active, up, node)
+
+        value = np.asarray(forest.value, dtype=np.float64)[leaves] / forest.n_trees
+        m_per_leaf = on_path.sum(axis=1)
+
+        groups = {}
+        for m in np.unique(m_per_leaf):
+            idx = np.flatnonzero(m_per_leaf == m)
+            # 每个叶节点的路径特征按特征编号排列（on_path 为 True 的列）
+            feature = np.nonzero(on_path[idx])[1].reshape(len(idx), m)
+            take = np.arange(len(idx))[:, None]
+            groups[int(m)] = {
+                'feature': feature,
+                'z': z[idx][take, feature],
+                'lower': lower[idx][take, feature].astype(self.bin_dtype),
+                'upper': upper[idx][take, feature].astype(self.bin_dtype),
+                'value': value[idx],
+            }
+        return groups
+
+    def _bins(self, X: np.ndarray) -> np.ndarray:
+        """
+        样本分箱，(特征数, 样本数)
+
+        与 TreeEnsemble.apply 相同，先转为 float32 再与阈值比较
+        """
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        return np.stack([np.searchsorted(thresholds, X[:, f]).astype(self.bin_dtype)
+                         for f, thresholds in enumerate(self.thresholds)])
+
+    @staticmethod
+    def _patterns(bins: np.ndarray, group: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, sparse.csr_matrix]:
+        """
+        每个 (样本, 叶节点) 的 o_j(x) 取值模式，去重为 (叶节点, 模式) 键
+
+        叶节点的贡献只取决于 m 位 0/1 模式，同一批样本在一个叶节点上
+        只出现少数几种，因此只对出现过的键计算一次。
+
+        Parameters:
+            bins: 样本分箱 (特征数, 样本数)
+            group: 同一 m 的叶节点组
+
+        Returns:
+            (leaf, o, indicator)：键对应的叶节点 (键数,)、模式 (键数, m)，
+            以及 (样本数, 键数) 的稀疏 0/1 矩阵（每行在每个叶节点上恰有一个键）
+        """
+        n_leaves, m = group['feature'].shape
+        n_rows = bins.shape[1]
+
+        if m > 62:
+            raise ValueError(f"路径上的不同特征数 m={m} 超过 62，无法用 64 位整数编码取值模式")
+
+        # 按 (叶节点, 样本) 排列时每个路径特征的取值是对分箱表的整行读取；
+        # 模式的整数类型按 m 选取，保证第 m-1 位不溢出
+        code_dtype = np.int16 if m <= 15 else np.int32 if m <= 31 else np.int64
+        code = np.zeros((n_leaves, n_rows), dtype=code_dtype)
+        for j in range(m):
+            b = bins[group['feature'][:, j]]
+            inside = (b > group['lower'][:, j, None]) & (b <= group['upper'][:, j, None])
+            code[inside] |= code_dtype(1) << code_dtype(j)
+
+        if int(n_leaves - 1).bit_length() + m <= 62:
+            key_dtype = np.int32 if (n_leaves << m) < 2 ** 31 else np.int64
+            keys = np.empty((n_rows, n_leaves), dtype=key_dtype)
+            np.add(code.T, np.arange(n_leaves, dtype=key_dtype) << key_dtype(m), out=keys)
+            if (n_leaves << m) <= max(4 * keys.size, 1 << 20):
+                # 键空间不大时用稠密标记去重，避免排序
+                present = np.zeros(n_leaves << m, dtype=bool)
+                present[keys] = True
+                unique = np.flatnonzero(present)
+                inverse = (np.cumsum(present, dtype=key_dtype) - 1)[keys]
+            else:
+                unique, inverse = np.unique(keys, return_inverse=True)
+                inverse = inverse.reshape(keys.shape)
+            leaf, pattern = unique >> m, unique & ((1 << m) - 1)
+        else:
+            # 叶节点编号和模式拼不进一个 64 位整数时按 (叶节点, 模式) 两列去重
+            pairs = np.stack([np.broadcast_to(np.arange(n_leaves)[:, None], code.shape).T.ravel(),
+                              code.T.ravel().astype(np.int64)], axis=1)
+            unique_pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+            inverse = inverse.reshape(n_rows, n_leaves)
+            leaf, pattern = unique_pairs[:, 0], unique_pairs[:, 1]
+        o = ((pattern[:, None] >> np.arange(m)) & 1).astype(np.float64)
+
+        indicator = sparse.csr_matrix(
+            (np.ones(inverse.size), inverse.ravel(), np.arange(0, inverse.size + 1, n_leaves)),
+            shape=(n_rows, len(leaf)))
+        return leaf, o, indicator
+
+    @staticmethod
+    def _factors(z: np.ndarray, o: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """各求积节点处的因子 z_j (1-t) + o_j t，(键数, m, 节点数)"""
+        return z[..., None] * (1 - t) + o[..., None] * t
+
+    def explain(self, X: np.ndarray, pairs: Sequence[Tuple[int, int]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        SHAP 值和指定特征对的 SHAP 交互值（共用一次模式去重）
+
+        Parameters:
+        -----------
+        X : np.ndarray
+            特征矩阵
+        pairs : Sequence[Tuple[int, int]]
+            特征编号对 (i, j)，i ≠ j
+
+        Returns:
+        --------
+        phi : np.ndarray
+            (样本数, 特征数)
+        interactions : np.ndarray
+            (样本数, 特征对数)，与 shap_interaction_values 矩阵的 [:, i, j] 相同
+        """
+        bins = self._bins(X)
+        n_rows = bins.shape[1]
+        phi = np.zeros((n_rows, self.n_features))
+        interactions = np.zeros((n_rows, len(pairs)))
+
+        for m, group in self.groups.items():
+            if m == 0:
+                continue
+            leaf, o, indicator = self._patterns(bins, group)
+            feature = group['feature'][leaf]
+            z = group['z'][leaf]
+            value = group['value'][leaf]
+
+            # ceil(m/2) 个节点对交互值的 m-2 次被积函数同样精确
+            t, weights = _quadrature(m)
+            # 特征对 (i, j) 在每个键的路径上的位置，不在路径上时该键不贡献
+            slots = {f: (feature == f) for pair in pairs for f in pair}
+            slots = {f: (has.any(axis=1), has.argmax(axis=1)) for f, has in slots.items()}
+
+            contrib = np.zeros((len(leaf), self.n_features))
+            terms = np.zeros((len(leaf), len(pairs)))
+            for keys in _blocks(len(leaf), m * len(t)):
+                factors = self._factors(z[keys], o[keys], t)
+                total = factors.prod(axis=1) * weights
+                np.put_along_axis(contrib[keys], feature[keys],
+                                  (o[keys] - z[keys]) * (total[:, None] / factors).sum(axis=-1) * value[keys, None],
+                                  axis=1)
+
+                for p, (fi, fj) in enumerate(pairs):
+                    (on_i, slot_i), (on_j, slot_j) = slots[fi], slots[fj]
+                    local = np.flatnonzero(on_i[keys] & on_j[keys])
+                    k = keys.start + local
+                    a, b = slot_i[k], slot_j[k]
+                    integral = (total[local] / (factors[local, a] * factors[local, b])).sum(axis=-1)
+                    terms[k, p] = 0.5 * value[k] * integral * (o[k, a] - z[k, a]) * (o[k, b] - z[k, b])
+
+            phi += indicator @ contrib
+            if len(pairs):
+                interactions += indicator @ terms
+
+        return phi, interactions
+
+    def shap_values(self, X: np.ndarray) -> np.ndarray:
+        """SHAP 值，(样本数, 特征数)"""
+        return self.explain(X)[0]
+
+    def shap_interaction_values(self, X: np.ndarray,
+                                pairs: Sequence[Tuple[int, int]]) -> np.ndarray:
+        """指定特征对的 SHAP 交互值 Φ_ij，(样本数, 特征对数)"""
+        return self.explain(X, pairs)[1]
+
+
+# 工作进程内的解释器（每个进程由模型包构建一次）
+_WORKER_EXPLAINER = None
+
+
+def _init_worker(bundle: ModelBundle):
+    global _WORKER_EXPLAINER
+    _WORKER_EXPLAINER = TreeShapExplainer.from_bundle(bundle)
+
+
+def _explain_shard(X: np.ndarray, feature_names: List[str],
+                   pairs: Sequence[Tuple[int, int]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """单个分片：SHAP 值和特征对的交互值（一次模式去重）"""
+    values, interactions = _WORKER_EXPLAINER.explain(X, pairs)
+    return (pd.DataFrame(values, columns=[f'shap_{name}' for name in feature_names]),
+            pd.DataFrame(interactions,
+                         columns=[f'shap_{feature_names[i]}:{feature_names[j]}' for i, j in pairs]))
+
+
+def explain_to_parts(bundle: ModelBundle, X: np.ndarray, keys: pd.DataFrame,
+                     output_dir: Path, pairs: Sequence[Tuple[int, int]] = (),
+                     interaction_dir: Path = None,
+                     shard_size: int = 512, n_jobs: int = None) -> List[Path]:
+    """
+    按行分片并行计算 SHAP 值和交互值，每个分片完成后写出列式分片
+
+    每个分片只遍历一次叶路径和取值模式，同时得到 SHAP 值和 pairs 的交互值。
+
+    Parameters:
+    -----------
+    bundle : ModelBundle
+        随机森林模型包（传给工作进程时只传路径，子进程只读映射节点数组）
+    X : np.ndarray
+        特征矩阵，列顺序与 bundle.meta['feature_names'] 相同
+    keys : DataFrame
+        与 X 逐行对应的标识列（season, week, celebrity_name 等），原样写入每个分片；
+        SHAP 值列为 shap_<特征名>，交互值列为 shap_<特征 i>:<特征 j>
+    output_dir : Path
+        SHAP 值的分片目录（开始前清空旧分片），用 utils.storage.read_parts 读回
+    pairs : Sequence[Tuple[int, int]]
+        需要交互值的特征对，为空时只计算 SHAP 值
+    interaction_dir : Path, optional
+        交互值的分片目录，pairs 非空时必须提供
+    shard_size : int
+        每个分片的行数
+    n_jobs : int, optional
+        进程数；1 时在当前进程中顺序运行，None 时使用 CPU 核数
+
+    Returns:
+    --------
+    parts : List[Path]
+        SHAP 值分片路径（按行顺序）
+    """
+    pairs = list(pairs)
+    if pairs and interaction_dir is None:
+        raise ValueError("interaction_dir is required when pairs are given")
+    output_dir = Path(output_dir)
+    for directory in [output_dir] + ([Path(interaction_dir)] if pairs else []):
+        for stale in list_parts(directory):
+            stale.unlink()
+
+    feature_names = bundle.meta['feature_names']
+    X = np.asarray(X)
+    keys = keys.reset_index(drop=True)
+    starts = range(0, len(X), shard_size)
+
+    def write(start: int, shard: Tuple[pd.DataFrame, pd.DataFrame]) -> Path:
+        shard_keys = keys.iloc[start:start + shard_size].reset_index(drop=True)
+        name = f'part-{start // shard_size:05d}'
+        values, interactions = shard
+        if pairs:
+            write_part(pd.concat([shard_keys, interactions], axis=1), interaction_dir, name)
+        return write_part(pd.concat([shard_keys, values], axis=1), output_dir, name)
+
+    n_workers = n_jobs or os.cpu_count() or 1
+    if n_workers == 1:
+        _init_worker(bundle)
+        return [write(start, _explain_shard(X[start:start + shard_size], feature_names, pairs))
+                for start in starts]
+
+    parts = {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(bundle,)) as executor:
+        futures = {executor.submit(_explain_shard, X[start:start + shard_size], feature_names, pairs): start
+                   for start in starts}
+        for future in as_completed(futures):
+            start = futures[future]
+            parts[start] = write(start, future.result())
+    return [parts[start] for start in sorted(parts)]
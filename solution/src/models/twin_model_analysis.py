@@ -10,83 +10,114 @@ Model D: Twin Model Analysis - 双子模型对比分析
 
 Question 3: Propose a "fairer" or "better" voting system
 """
+import sys
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
 import matplotlib.pyplot as plt
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.model_selection import cross_val_score
+from sklearn.preprocessing import StandardScaler
 from scipy.stats import spearmanr
 import warnings
 warnings.filterwarnings('ignore')
 
+if __name__ == "__main__":
+    # 以脚本方式运行时，添加 src 目录到路径
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data_processing import create_season_meta
+from models.counterfactual_simulation import VotingSimulator
+from models.season_replay import FINALIST_WEEK, SeasonReplayEngine
+from models.voting_rules import (AWVS_BASE_WEIGHT, AWVS_STAGE_SHIFT, AWVS_TREND_BONUS,
+                                 DEFAULT_RULES, first_argmin)
+from models.weight_sweep import WeightSweepResult, sweep_judge_weights
+from utils.cache import cached_stage
+from utils.cross_validation import cross_validate_seasons, summarize_cv
+from utils.encoding import CategoricalEncoder
+from utils.storage import read_table, write_table
+
 
 class ProDancerFeatureBuilder:
     """
     构建职业舞者特征
     注意：防止数据泄露，S_n 的舞伴特征只能用 S_1 到 S_{n-1} 计算
+
+    按赛季顺序单遍扫描：每个舞伴维护累计状态
+    （参赛季数、名次之和、前三次数、最好名次），某赛季的特征只读取
+    此前的状态，输出后再把该赛季并入状态。总开销 O(行数)；
+    新赛季可用 add_season 追加，不需要重算已有赛季。
     """
 
+    # 新舞伴（无历史数据）的默认特征
+    DEFAULT_AVG_PLACE = 7.0
+    DEFAULT_BEST_PLACE = 12
+
     def __init__(self):
+        # 舞伴 -> [参赛季数, 名次之和, 前三次数, 最好名次]
         self.partner_stats = {}
+        self.last_season = None
 
-    def build_partner_features(self, data: pd.DataFrame) -> pd.DataFrame:
+    def add_season(self, season_data: pd.DataFrame) -> pd.DataFrame:
         """
-        为每个舞伴构建历史统计特征
+        追加一个赛季：先用此前赛季的累计状态生成该赛季的舞伴特征，
+        再把该赛季的最终排名并入状态
+
+        Parameters:
+        -----------
+        season_data : DataFrame
+            单个赛季的数据（需含 season, celebrity_name, ballroom_partner, placement），
+            赛季必须晚于已追加的所有赛季
+
+        Returns:
+        --------
+        features : DataFrame
+            每个 (选手, 舞伴) 配对一行
         """
-        # 按赛季排序
-        seasons = sorted(data['season'].unique())
-
-        partner_features = []
-
-        for season in seasons:
-            # 获取该赛季之前的所有数据
-            historical_data = data[data['season'] < season]
-
-            # 获取该赛季的选手-舞伴配对
-            current_season = data[data['season'] == season]
-
-            for _, row in current_season.drop_duplicates(['celebrity_name', 'ballroom_partner']).iterrows():
-                partner = row['ballroom_partner']
-
-                if len(historical_data) > 0:
-                    # 计算该舞伴的历史统计
-                    partner_history = historical_data[historical_data['ballroom_partner'] == partner]
-
-                    if len(partner_history) > 0:
-                        # 获取每个赛季的最终排名
-                        partner_placements = partner_history.groupby('season')['placement'].first()
-
-                        partner_avg_place = partner_placements.mean()
-                        partner_experience = len(partner_placements)
-                        partner_win_rate = (partner_placements <= 3).mean()  # 进入前三的比例
-                        partner_best_place = partner_placements.min()
-                    else:
-                        # 新舞伴，无历史数据
-                        partner_avg_place = 7.0  # 默认中等排名
-                        partner_experience = 0
-                        partner_win_rate = 0.0
-                        partner_best_place = 12
-                else:
-                    # 第一季，所有舞伴都是新的
-                    partner_avg_place = 7.0
-                    partner_experience = 0
-                    partner_win_rate = 0.0
-                    partner_best_place = 12
+        seasons = season_data['season'].unique()
+        if len(seasons) != 1:
+            raise ValueError(f"add_season 需要单个赛季的数据，实际包含 {len(seasons)} 个赛季")
+        season = seasons[0]
+        if self.last_season is not None and season <= self.last_season:
+            raise ValueError(f"赛季 {season} 不晚于已追加的赛季 {self.last_season}")
+
+        pairs = season_data.drop_duplicates(['celebrity_name', 'ballroom_partner'])
+        rows = []
+        for partner in pairs['ballroom_partner']:
+            stats = self.partner_stats.get(partner)
+            if stats is None:
+                rows.append((self.DEFAULT_AVG_PLACE, 0, 0.0, self.DEFAULT_BEST_PLACE))
+            else:
+                experience, place_sum, top3, best = stats
+                rows.append((place_sum / experience, experience, top3 / experience, best))
+        features = pd.DataFrame(rows, columns=['partner_avg_place', 'partner_experience',
+                                               'partner_win_rate', 'partner_best_place'])
+        features.insert(0, 'ballroom_partner', pairs['ballroom_partner'].to_numpy())
+        features.insert(0, 'celebrity_name', pairs['celebrity_name'].to_numpy())
+        features.insert(0, 'season', season)
+
+        # 每个舞伴该赛季的最终排名（取第一条非缺失记录；没有名次的赛季不计入）
+        placements = season_data.groupby('ballroom_partner', sort=False)['placement'].first().dropna()
+        for partner, place in placements.items():
+            stats = self.partner_stats.setdefault(partner, [0, 0, 0, place])
+            stats[0] += 1
+            stats[1] += place
+            stats[2] += place <= 3
+            stats[3] = min(stats[3], place)
+
+        self.last_season = season
+        return features
 
-                partner_features.append({
-                    'season': season,
-                    'celebrity_name': row['celebrity_name'],
-                    'ballroom_partner': partner,
-                    'partner_avg_place': partner_avg_place,
-                    'partner_experience': partner_experience,
-                    'partner_win_rate': partner_win_rate,
-                    'partner_best_place': partner_best_place
-                })
+    def build_partner_features(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        为每个舞伴构建历史统计特征（从空状态开始按赛季顺序追加所有赛季）
+        """
+        self.partner_stats = {}
+        self.last_season = None
 
-        return pd.DataFrame(partner_features)
+        partner_features = [self.add_season(season_data)
+                            for _, season_data in data.groupby('season', sort=True)]
+        return pd.concat(partner_features, ignore_index=True)
 
 
 class TwinModelAnalyzer:
@@ -119,6 +150,8 @@ class TwinModelAnalyzer:
         self.label_encoders = {}
         self.scaler = StandardScaler()
         self.feature_names = []
+        self.groups = None
+        self.cv_results = None
 
     def prepare_features(self, data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
@@ -147,16 +180,19 @@ class TwinModelAnalyzer:
         # 复制数据
         df = data[available_cols + ['fan_vote_share', 'judge_total']].copy()
         df = df.dropna()
+        # 每行的赛季，供按赛季分组的交叉验证使用
+        self.groups = data.loc[df.index, 'season'].to_numpy() if 'season' in data.columns else None
 
         # 编码分类变量
         categorical_cols = ['celebrity_industry']
         for col in categorical_cols:
             if col in df.columns:
                 if col not in self.label_encoders:
-                    self.label_encoders[col] = LabelEncoder()
-                    df[col] = self.label_encoders[col].fit_transform(df[col].astype(str))
+                    self.label_encoders[col] = CategoricalEncoder()
+                    df[col] = self.label_encoders[col].fit_transform(df[col])
                 else:
-                    df[col] = self.label_encoders[col].transform(df[col].astype(str))
+                    # 新数据中未见过的类别编码为 UNKNOWN_CODE
+                    df[col] = self.label_encoders[col].transform(df[col])
 
         # 准备特征矩阵
         X = df[[col for col in available_cols]].values
@@ -170,25 +206,42 @@ class TwinModelAnalyzer:
 
         return X, y_fan, y_judge
 
-    def train(self, X: np.ndarray, y_fan: np.ndarray, y_judge: np.ndarray):
+    def train(self, X: np.ndarray, y_fan: np.ndarray, y_judge: np.ndarray, groups=None,
+              n_jobs: int = None):
         """
         训练双子模型
+
+        交叉验证按赛季分块（groups 默认取 prepare_features 记录的赛季），
+        每折一个进程池任务，fan / judge 两个目标在同一任务中拟合；
+        n_jobs 为进程数，见 cross_validate_seasons。
         """
+        if groups is None:
+            groups = self.groups if self.groups is not None else np.arange(len(X))
+
+        print("Cross-validating M_fan / M_judge (blocked by season)...")
+        self.cv_results = cross_validate_seasons(
+            {'fan': self.model_fan, 'judge': self.model_judge},
+            X, {'fan': y_fan, 'judge': y_judge}, groups, n_jobs=n_jobs
+        )
+        cv_summary = summarize_cv(self.cv_results).set_index('target')
+
         print("Training M_fan (Fan Preference Model)...")
         self.model_fan.fit(X, y_fan)
-        fan_cv_score = cross_val_score(self.model_fan, X, y_fan, cv=5, scoring='r2')
-        print(f"  - CV R2 Score: {fan_cv_score.mean():.4f} (+/- {fan_cv_score.std():.4f})")
+        fan = cv_summary.loc['fan']
+        print(f"  - CV R2 Score: {fan['r2_mean']:.4f} (+/- {fan['r2_std']:.4f}), "
+              f"fold fit time {fan['fit_time_sec']:.2f}s")
 
         print("\nTraining M_judge (Judge Preference Model)...")
         self.model_judge.fit(X, y_judge)
-        judge_cv_score = cross_val_score(self.model_judge, X, y_judge, cv=5, scoring='r2')
-        print(f"  - CV R2 Score: {judge_cv_score.mean():.4f} (+/- {judge_cv_score.std():.4f})")
+        judge = cv_summary.loc['judge']
+        print(f"  - CV R2 Score: {judge['r2_mean']:.4f} (+/- {judge['r2_std']:.4f}), "
+              f"fold fit time {judge['fit_time_sec']:.2f}s")
 
         return {
-            'fan_cv_r2': fan_cv_score.mean(),
-            'fan_cv_std': fan_cv_score.std(),
-            'judge_cv_r2': judge_cv_score.mean(),
-            'judge_cv_std': judge_cv_score.std()
+            'fan_cv_r2': fan['r2_mean'],
+            'fan_cv_std': fan['r2_std'],
+            'judge_cv_r2': judge['r2_mean'],
+            'judge_cv_std': judge['r2_std']
         }
 
     def get_feature_importance(self) -> pd.DataFrame:
@@ -247,6 +300,7 @@ class FairnessAnalyzer:
 
     def __init__(self):
         self.metrics = {}
+        self.weight_sweep = None
 
     def calculate_fairness_metrics(self, data: pd.DataFrame,
                                    importance_df: pd.DataFrame) -> Dict:
@@ -300,6 +354,15 @@ class FairnessAnalyzer:
         self.metrics = metrics
         return metrics
 
+    def sweep_weights(self, data: pd.DataFrame, judge_weights=None) -> WeightSweepResult:
+        """
+        在评委权重网格（默认 0 到 1 步长 0.001）上评估 rank / percent 混合，
+        给出匹配率、相对现行规则的翻转率和被淘汰者平均 FFI 的 Pareto 前沿
+        （见 models/weight_sweep.py）
+        """
+        self.weight_sweep = sweep_judge_weights(data, judge_weights)
+        return self.weight_sweep
+
     def propose_optimal_weights(self, metrics: Dict) -> Dict:
         """
         基于分析结果提出最优权重
@@ -359,9 +422,22 @@ class NewVotingSystem:
     """
     新投票系统提案
     基于双子模型分析结果设计
+
+    Parameters:
+    -----------
+    season_meta : DataFrame, optional
+        create_season_meta 的输出，赛季总周数取 max_weeks；
+        未提供时单周模拟沿用 12 周的假设，逐周评估和整季回放由数据本身构建
     """
 
-    def __init__(self):
+    # 未提供 season_meta 时的赛季总周数
+    DEFAULT_TOTAL_WEEKS = 12
+
+    def __init__(self, season_meta: pd.DataFrame = None):
+        self.season_meta = season_meta
+        self.total_weeks = (
+            None if season_meta is None else season_meta.set_index('season')['max_weeks']
+        )
         self.system_name = "Adaptive Weighted Voting System (AWVS)"
         self.description = """
         A dynamic voting system that adapts weights based on:
@@ -370,46 +446,40 @@ class NewVotingSystem:
         3. Balanced consideration of technical skill and audience engagement
         """
 
-    def calculate_score(self, judge_score: float, fan_vote: float,
-                       week: int, total_weeks: int,
-                       trend: float = 0) -> float:
+    def calculate_score(self, judge_score, fan_vote, week, total_weeks, trend=0):
         """
-        计算新系统下的综合得分
+        计算新系统下的综合得分（参数可以是标量，也可以是同形状/可广播的数组）
 
         Parameters:
         -----------
-        judge_score : float
+        judge_score : float 或 np.ndarray
             标准化评委分数 (0-1)
-        fan_vote : float
+        fan_vote : float 或 np.ndarray
             粉丝投票份额 (0-1)
-        week : int
+        week : int 或 np.ndarray
             当前周次
-        total_weeks : int
+        total_weeks : int 或 np.ndarray
             总周数
-        trend : float
+        trend : float 或 np.ndarray
             表现趋势 (正=进步, 负=退步)
 
         Returns:
         --------
-        combined_score : float
+        combined_score : float 或 np.ndarray
             综合得分
         """
         # 动态权重：随着赛季进展，技术权重增加
         progress = week / total_weeks
 
-        # 基础权重
-        base_judge_weight = 0.5
-        base_fan_weight = 0.5
-
         # 阶段调整：后期更看重技术
-        stage_adjustment = progress * 0.15  # 最多调整 15%
+        stage_adjustment = progress * AWVS_STAGE_SHIFT  # 最多调整 15%
 
         # 趋势奖励：进步的选手获得额外加分
-        trend_bonus = max(0, trend * 0.05)  # 最多 5% 奖励
+        trend_bonus = np.maximum(0, trend * AWVS_TREND_BONUS)  # 最多 5% 奖励
 
-        # 最终权重
-        judge_weight = base_judge_weight + stage_adjustment
-        fan_weight = base_fan_weight - stage_adjustment
+        # 最终权重（基础权重 50-50）
+        judge_weight = AWVS_BASE_WEIGHT + stage_adjustment
+        fan_weight = AWVS_BASE_WEIGHT - stage_adjustment
 
         # 综合得分
         combined_score = (
@@ -420,38 +490,83 @@ class NewVotingSystem:
 
         return combined_score
 
-    def simulate_elimination(self, week_data: pd.DataFrame) -> str:
+    def get_total_weeks(self, season: int) -> int:
+        """赛季总周数（season_meta 的 max_weeks）"""
+        if self.total_weeks is None:
+            return self.DEFAULT_TOTAL_WEEKS
+        return int(self.total_weeks.loc[season])
+
+    def simulate_elimination(self, week_data: pd.DataFrame, total_weeks: int = None) -> str:
+        """
+        模拟新系统下的淘汰结果（单周，整周一次数组计算）
+
+        total_weeks 未指定时按 week_data 的赛季从 season_meta 中查找。
         """
-        模拟新系统下的淘汰结果
+        if total_weeks is None:
+            total_weeks = self.get_total_weeks(week_data['season'].iloc[0])
+
+        # 标准化评委分数
+        judge_norm = week_data['judge_total'].to_numpy(dtype=float) / week_data['judge_total'].max()
+        fan_norm = week_data['fan_vote_share'].to_numpy(dtype=float)
+
+        # 获取趋势
+        if 'trend' in week_data.columns:
+            trend = np.nan_to_num(week_data['trend'].to_numpy(dtype=float), nan=0.0)
+        else:
+            trend = np.zeros(len(week_data))
+
+        scores = self.calculate_score(
+            judge_norm, fan_norm,
+            week_data['week'].to_numpy(dtype=float), total_weeks,
+            trend
+        )
+
+        return week_data['celebrity_name'].iloc[first_argmin(scores)]
+
+    def _season_total_weeks(self, data: pd.DataFrame) -> pd.Series:
+        """赛季 -> 总周数，取 season_meta 的 max_weeks（未提供时由 data 构建）"""
+        season_meta = self.season_meta if self.season_meta is not None else create_season_meta(data)
+        return season_meta.set_index('season')['max_weeks']
+
+    def evaluate_weeks(self, data: pd.DataFrame,
+                       compare_rules: Sequence[str] = DEFAULT_RULES) -> pd.DataFrame:
         """
-        scores = []
-
-        for _, row in week_data.iterrows():
-            # 标准化评委分数
-            judge_norm = row['judge_total'] / week_data['judge_total'].max()
-            fan_norm = row['fan_vote_share']
-
-            # 获取趋势
-            trend = row.get('trend', 0)
-            if pd.isna(trend):
-                trend = 0
-
-            # 计算综合得分
-            score = self.calculate_score(
-                judge_norm, fan_norm,
-                row['week'], 12,  # 假设总共 12 周
-                trend
+        逐周评估：在每一周的历史选手集合上一次性用数组计算 AWVS 淘汰者，
+        并在同一次遍历中计算 VotingSimulator 的规则以便对比
+
+        各周相互独立，反事实淘汰不会带入之后的周；按周推进幸存名单的
+        整季结果见 replay_seasons。
+
+        Returns:
+        --------
+        results_df : DataFrame
+            每周一行：awvs_eliminated、各对比规则的淘汰者、FFI，
+            以及 awvs_vs_<rule>_same
+        """
+        results_df = VotingSimulator().simulate_rules(
+            data, rules=['awvs', *compare_rules], total_weeks=self._season_total_weeks(data)
+        )
+        for rule in compare_rules:
+            results_df[f'awvs_vs_{rule}_same'] = (
+                results_df['awvs_eliminated'] == results_df[f'{rule}_eliminated']
             )
 
-            scores.append({
-                'celebrity_name': row['celebrity_name'],
-                'combined_score': score
-            })
+        return results_df
 
-        scores_df = pd.DataFrame(scores)
-        eliminated = scores_df.loc[scores_df['combined_score'].idxmin(), 'celebrity_name']
+    def replay_seasons(self, data: pd.DataFrame,
+                       compare_rules: Sequence[str] = DEFAULT_RULES) -> pd.DataFrame:
+        """
+        整季回放：用 SeasonReplayEngine 按周推进每个赛季，AWVS 和各对比规则
+        维护各自的幸存名单，被淘汰者不再参加之后的周
 
-        return eliminated
+        Returns:
+        --------
+        replay_df : DataFrame
+            每个 (赛季, 选手) 一行：历史 elimination_week / placement，
+            以及每条规则的 <rule>_elimination_week 和 <rule>_placement
+        """
+        engine = SeasonReplayEngine(data, total_weeks=self._season_total_weeks(data))
+        return engine.replay_frame(['awvs', *compare_rules])
 
     def get_system_description(self) -> Dict:
         """
@@ -483,9 +598,17 @@ class NewVotingSystem:
         }
 
 
-def run_twin_model_analysis(data_path: Path, output_dir: Path):
+@cached_stage("twin_model", inputs=['data_path', 'season_meta_path'],
+              params=['n_estimators', 'random_state'])
+def run_twin_model_analysis(data_path: Path, output_dir: Path,
+                            n_estimators: int = 100, random_state: int = 42,
+                            season_meta_path: Path = None, n_jobs: int = None):
     """
     运行完整的双子模型分析
+
+    season_meta_path 指向 data_processing 输出的 season_meta，
+    AWVS 逐周评估和整季回放的赛季总周数取其中的 max_weeks。
+    n_jobs 传给 TwinModelAnalyzer.train。
     """
     print("=" * 80)
     print("Model D: Twin Model Analysis - Fan vs Judge Preference Comparison")
@@ -493,7 +616,7 @@ def run_twin_model_analysis(data_path: Path, output_dir: Path):
 
     # 1. 加载数据
     print("\n[Step 1] Loading data...")
-    data = pd.read_csv(data_path)
+    data = read_table(data_path)
     print(f"  - Data shape: {data.shape}")
     print(f"  - Seasons: {data['season'].min()} - {data['season'].max()}")
 
@@ -518,13 +641,13 @@ def run_twin_model_analysis(data_path: Path, output_dir: Path):
 
     # 3. 训练双子模型
     print("\n[Step 3] Training Twin Models...")
-    analyzer = TwinModelAnalyzer(n_estimators=100, random_state=42)
+    analyzer = TwinModelAnalyzer(n_estimators=n_estimators, random_state=random_state)
 
     X, y_fan, y_judge = analyzer.prepare_features(data)
     print(f"  - Feature matrix shape: {X.shape}")
     print(f"  - Features: {analyzer.feature_names}")
 
-    cv_scores = analyzer.train(X, y_fan, y_judge)
+    cv_scores = analyzer.train(X, y_fan, y_judge, n_jobs=n_jobs)
 
     # 4. 特征重要性对比
     print("\n[Step 4] Comparing Feature Importance...")
@@ -557,9 +680,19 @@ def run_twin_model_analysis(data_path: Path, output_dir: Path):
 
     print(f"\n{optimal_weights['reasoning']}")
 
+    # 权重网格扫描：用模拟结果检验经验权重
+    weight_sweep = fairness_analyzer.sweep_weights(data)
+    print("[Weight Sweep] Best Pareto points by match rate:")
+    for blend in ['rank', 'percent']:
+        best = weight_sweep.pareto_front(blend).iloc[0]
+        print(f"  - {blend}: judge weight {best['judge_weight']:.3f}, "
+              f"match {best['match_rate']:.2%}, flip {best['flip_rate']:.2%}, "
+              f"mean FFI {best['mean_ffi']:.3f}")
+
     # 8. 新投票系统
     print("\n[Step 8] Proposing New Voting System...")
-    new_system = NewVotingSystem()
+    season_meta = read_table(season_meta_path) if season_meta_path is not None else None
+    new_system = NewVotingSystem(season_meta)
     system_desc = new_system.get_system_description()
 
     print(f"\n[{system_desc['name']}]")
@@ -572,21 +705,66 @@ def run_twin_model_analysis(data_path: Path, output_dir: Path):
     for benefit in system_desc['benefits']:
         print(f"  - {benefit}")
 
-    # 9. 保存结果
+    # 9. AWVS 逐周评估，与现有规则对比
+    print("\n[Step 9] Evaluating AWVS week by week...")
+    awvs_df = new_system.evaluate_weeks(data)
+    awvs_summary = VotingSimulator().summarize_rules(awvs_df, ['awvs', *DEFAULT_RULES])
+
+    print(f"  - Simulated weeks: {len(awvs_df)}")
+    for _, row in awvs_summary.iterrows():
+        print(f"  - {row['rule']}: match actual {row['actual_match_rate']:.2%}, "
+              f"mean FFI of eliminated {row['mean_ffi']:.3f}")
+    for rule in DEFAULT_RULES:
+        print(f"  - AWVS vs {rule} flip rate: {1 - awvs_df[f'awvs_vs_{rule}_same'].mean():.2%}")
+
+    print("\n[Step 9b] Replaying full seasons under AWVS...")
+    replay_df = new_system.replay_seasons(data)
+    eliminated = (replay_df['elimination_week'] > 0) & (replay_df['elimination_week'] < FINALIST_WEEK)
+    for rule in ['awvs', *DEFAULT_RULES]:
+        same_week = (replay_df[f'{rule}_elimination_week'] == replay_df['elimination_week'])[eliminated].mean()
+        print(f"  - {rule}: same elimination week as history {same_week:.2%}")
+
+    # 10. 保存结果
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    awvs_path = output_dir / "awvs_weekly_evaluation.csv"
+    write_table(awvs_df, awvs_path)
+    print(f"\n[Saved] AWVS weekly evaluation: {awvs_path}")
+
+    replay_path = output_dir / "awvs_season_replay.csv"
+    write_table(replay_df, replay_path)
+    print(f"[Saved] AWVS season replay: {replay_path}")
+
+    sweep_path = output_dir / "weight_sweep.csv"
+    write_table(weight_sweep.table, sweep_path)
+    print(f"[Saved] Weight sweep: {sweep_path}")
+
+    pareto_path = output_dir / "weight_pareto_front.csv"
+    write_table(weight_sweep.pareto_front(), pareto_path)
+    print(f"[Saved] Weight Pareto front: {pareto_path}")
+
+    awvs_summary_path = output_dir / "awvs_rule_comparison.csv"
+    write_table(awvs_summary, awvs_summary_path)
+    print(f"[Saved] AWVS rule comparison: {awvs_summary_path}")
+
     # 保存特征重要性
     importance_path = output_dir / "feature_importance_comparison.csv"
-    importance_df.to_csv(importance_path, index=False)
+    write_table(importance_df, importance_path)
     print(f"\n[Saved] Feature importance: {importance_path}")
 
+    cv_path = output_dir / "twin_cv_folds.csv"
+    write_table(analyzer.cv_results, cv_path)
+    print(f"[Saved] Cross-validation folds: {cv_path}")
+
     # 保存分析结果
     results = {
         'cv_scores': cv_scores,
         'correlation': correlation,
         'fairness_metrics': fairness_metrics,
         'optimal_weights': optimal_weights,
-        'system_description': system_desc
+        'system_description': system_desc,
+        'awvs_comparison': awvs_summary,
+        'weight_pareto_front': weight_sweep.pareto_front()
     }
 
     print("\n" + "=" * 80)
@@ -597,17 +775,12 @@ def run_twin_model_analysis(data_path: Path, output_dir: Path):
 
 
 if __name__ == "__main__":
-    import sys
-    from pathlib import Path
-
-    # 添加 src 目录到路径
-    src_dir = Path(__file__).resolve().parents[1]
-    sys.path.insert(0, str(src_dir))
     from config import DATA_DIR
 
     data_path = DATA_DIR / "models" / "ridge_v2" / "ridge_fan_vote_shares_v2.csv"
+    season_meta_path = DATA_DIR / "processed" / "season_meta.csv"
     output_dir = DATA_DIR / "twin_model"
 
     analyzer, importance_df, results, new_system = run_twin_model_analysis(
-        data_path, output_dir
+        data_path, output_dir, season_meta_path=season_meta_path
     )
@@ -0,0 +1,281 @@
+"""
+投票规则注册表 (Voting Rule Registry)
+
+一条规则 = 向量化评分函数 + 淘汰策略：
+
+- 评分函数 score(arrays) 以 WeekArrays 为输入，返回与粉丝投票同形状的
+  (..., 周数, 人数) 数组，分数越低越危险
+- 淘汰策略 (selection) 根据分数选出被淘汰者在周内的位置：
+    bottom      分数最低的 n_eliminated 人淘汰（n_eliminated > 1 即多人淘汰周）
+    judge_save  分数最低的两人进入 bottom two，评委淘汰其中评委分低者
+
+ArrayVotingEngine 对每个人数桶只构建一次 WeekArrays，排名、百分比等中间量
+按需计算并在所有规则间共享，因此任意多条规则在一次遍历中完成评估。
+
+新规则的注册方式：
+
+    @register_rule('judge_heavy', description='评委 70% + 粉丝 30%')
+    def judge_heavy_score(w):
+        return 0.7 * w.judge_percent + 0.3 * w.fan_percent
+"""
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _descending_ranks(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    最后一维（同一周）内的降序排名，NaN 不参与排名
+
+    Returns:
+        (min 排名, average 排名)，分别与 pandas rank(ascending=False, method='min')
+        和 rank(ascending=False, method='average') 一致
+    """
+    greater = (x[..., None, :] > x[..., :, None]).sum(axis=-1)
+    equal = (x[..., None, :] == x[..., :, None]).sum(axis=-1)
+    missing = np.isnan(x)
+    min_rank = np.where(missing, np.nan, 1.0 + greater)
+    average_rank = np.where(missing, np.nan, 1 + greater + (equal - 1) / 2)
+    return min_rank, average_rank
+
+
+def _descending_min_rank(x: np.ndarray) -> np.ndarray:
+    """只计算 min 排名（_descending_ranks 的第一项），省去并列计数"""
+    greater = (x[..., None, :] > x[..., :, None]).sum(axis=-1)
+    return np.where(np.isnan(x), np.nan, 1.0 + greater)
+
+
+def first_argmin(x: np.ndarray) -> np.ndarray:
+    """最后一维的 idxmin：跳过 NaN，并列取第一个"""
+    return np.where(np.isnan(x), np.inf, x).argmin(axis=-1)
+
+
+def _nansum(x: np.ndarray) -> np.ndarray:
+    """与 pandas Series.sum() 相同的求和（NaN 视为 0）"""
+    return np.where(np.isnan(x), 0.0, x).sum(axis=-1)
+
+
+class WeekArrays:
+    """
+    一批同人数周的输入数组（最后一维为周内选手）
+
+    Parameters:
+    -----------
+    judge : np.ndarray
+        评委总分，(1 或 批数, 周数, 人数)
+    fan : np.ndarray
+        粉丝投票份额，(批数, 周数, 人数)
+    week : np.ndarray
+        周次，(周数,)
+    total_weeks : np.ndarray, optional
+        所在赛季的总周数，(周数,)
+    trend : np.ndarray, optional
+        评委分趋势（本周分 - 上周分），(1 或 批数, 周数, 人数)，缺失视为 0
+
+    派生量（排名、百分比、FFI 等）在第一次访问时计算并缓存，供各规则共享。
+    """
+
+    def __init__(self, judge: np.ndarray, fan: np.ndarray, week: np.ndarray,
+                 total_weeks: Optional[np.ndarray] = None, trend: Optional[np.ndarray] = None):
+        self.judge = judge
+        self.fan = fan
+        self.size = fan.shape[-1]
+        self.week = np.asarray(week, dtype=float)[:, None]
+        self.total_weeks = None if total_weeks is None else np.asarray(total_weeks, dtype=float)[:, None]
+        self.trend = np.zeros_like(judge) if trend is None else np.where(np.isnan(trend), 0.0, trend)
+
+    @cached_property
+    def _judge_ranks(self) -> Tuple[np.ndarray, np.ndarray]:
+        return _descending_ranks(self.judge)
+
+    @cached_property
+    def _fan_ranks(self) -> Tuple[np.ndarray, np.ndarray]:
+        return _descending_ranks(self.fan)
+
+    @cached_property
+    def judge_rank(self) -> np.ndarray:
+        """评委分降序排名（method='min'，1 = 最好）"""
+        if '_judge_ranks' in self.__dict__:
+            return self._judge_ranks[0]
+        return _descending_min_rank(self.judge)
+
+    @cached_property
+    def fan_rank(self) -> np.ndarray:
+        """粉丝投票降序排名（method='min'，1 = 最好）"""
+        if '_fan_ranks' in self.__dict__:
+            return self._fan_ranks[0]
+        return _descending_min_rank(self.fan)
+
+    @cached_property
+    def judge_percent(self) -> np.ndarray:
+        """评委分占当周总分的比例"""
+        return self.judge / _nansum(self.judge)[..., None]
+
+    @cached_property
+    def fan_percent(self) -> np.ndarray:
+        """粉丝投票占当周总票数的比例"""
+        return self.fan / _nansum(self.fan)[..., None]
+
+    @cached_property
+    def judge_norm(self) -> np.ndarray:
+        """评委分除以当周最高分"""
+        week_max = np.where(np.isnan(self.judge), -np.inf, self.judge).max(axis=-1)
+        return self.judge / week_max[..., None]
+
+    @cached_property
+    def progress(self) -> np.ndarray:
+        """赛季进度 week / total_weeks，(周数, 1)"""
+        if self.total_weeks is None:
+            raise ValueError("该规则需要 total_weeks（赛季总周数）")
+        return self.week / self.total_weeks
+
+    @cached_property
+    def ffi(self) -> np.ndarray:
+        """FFI = (评委排名 - 粉丝排名) / (N - 1)，使用 average 排名"""
+        return (self._judge_ranks[1] - self._fan_ranks[1]) / (self.size - 1)
+
+
+# =============================================================================
+# 淘汰策略
+# =============================================================================
+
+SELECTION_POLICIES: Dict[str, Callable] = {}
+
+
+def register_policy(name: str):
+    """
+    注册淘汰策略
+
+    策略函数签名：policy(score, arrays, n_eliminated) -> positions，
+    score 为 (批数, 周数, 人数)，positions 为 (批数, 周数, n_eliminated)
+    的周内位置（按危险程度排序，不足时用 -1 填充）。
+    """
+    def decorator(func):
+        SELECTION_POLICIES[name] = func
+        return func
+    return decorator
+
+
+@register_policy('bottom')
+def select_bottom(score: np.ndarray, arrays: WeekArrays, n_eliminated: int) -> np.ndarray:
+    """分数最低的 n_eliminated 人淘汰（跳过 NaN，并列时靠前者先淘汰），至少保留一人"""
+    if n_eliminated == 1:
+        return first_argmin(score)[..., None]
+
+    n_out = min(n_eliminated, arrays.size - 1)
+    order = np.argsort(np.where(np.isnan(score), np.inf, score), axis=-1, kind='stable')
+    positions = np.full(score.shape[:-1] + (n_eliminated,), -1, dtype=np.int64)
+    positions[..., :n_out] = order[..., :n_out]
+    return positions
+
+
+@register_policy('judge_save')
+def select_judge_save(score: np.ndarray, arrays: WeekArrays, n_eliminated: int) -> np.ndarray:
+    """分数最低的两人进入 bottom two，评委淘汰其中评委分低者（并列时淘汰分数更低者）"""
+    first = first_argmin(score)
+    masked = np.where(np.isnan(score), np.inf, score)
+    np.put_along_axis(masked, first[..., None], np.inf, axis=-1)
+    second = masked.argmin(axis=-1)
+
+    judge = np.broadcast_to(arrays.judge, score.shape)
+    judge_first = np.take_along_axis(judge, first[..., None], axis=-1)[..., 0]
+    judge_second = np.take_along_axis(judge, second[..., None], axis=-1)[..., 0]
+    pick_second = (judge_second < judge_first) | (np.isnan(judge_first) & ~np.isnan(judge_second))
+    return np.where(pick_second, second, first)[..., None]
+
+
+# =============================================================================
+# 规则注册表
+# =============================================================================
+
+class VotingRule:
+    """
+    一条投票规则
+
+    Args:
+        name: 规则名（结果列名的前缀）
+        score: 评分函数 score(arrays) -> 分数数组，分数越低越危险
+        selection: 淘汰策略名，见 SELECTION_POLICIES
+        n_eliminated: 每周淘汰人数
+        description: 规则说明
+    """
+
+    def __init__(self, name: str, score: Callable[[WeekArrays], np.ndarray],
+                 selection: str = 'bottom', n_eliminated: int = 1, description: str = ''):
+        if selection not in SELECTION_POLICIES:
+            raise ValueError(f"Unknown selection policy: {selection}")
+        self.name = name
+        self.score = score
+        self.selection = selection
+        self.n_eliminated = n_eliminated
+        self.description = description
+
+    def __repr__(self) -> str:
+        return f"VotingRule({self.name!r}, selection={self.selection!r}, n_eliminated={self.n_eliminated})"
+
+    def select(self, arrays: WeekArrays) -> np.ndarray:
+        """被淘汰者在周内的位置，(批数, 周数, n_eliminated)"""
+        score = np.broadcast_to(self.score(arrays), arrays.fan.shape)
+        return SELECTION_POLICIES[self.selection](score, arrays, self.n_eliminated)
+
+
+RULE_REGISTRY: Dict[str, VotingRule] = {}
+
+
+def register_rule(name: str, selection: str = 'bottom', n_eliminated: int = 1,
+                  description: str = ''):
+    """把评分函数注册为投票规则（装饰器）；同名规则会被覆盖"""
+    def decorator(score):
+        RULE_REGISTRY[name] = VotingRule(name, score, selection, n_eliminated, description)
+        return score
+    return decorator
+
+
+def get_rules(names: Optional[Sequence[str]] = None) -> List[VotingRule]:
+    """按名字取规则，names 为 None 时返回全部已注册规则"""
+    if names is None:
+        return list(RULE_REGISTRY.values())
+    unknown = [name for name in names if name not in RULE_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown rule: {', '.join(unknown)}")
+    return [RULE_REGISTRY[name] for name in names]
+
+
+# =============================================================================
+# 内置规则
+# =============================================================================
+
+@register_rule('rank_sum', description='Rank Sum：评委排名 + 粉丝排名，总和最大者淘汰')
+def rank_sum_score(w: WeekArrays) -> np.ndarray:
+    return -(w.judge_rank + w.fan_rank)
+
+
+@register_rule('percent_sum', description='Percent Sum：评委百分比 + 粉丝百分比，总和最小者淘汰')
+def percent_sum_score(w: WeekArrays) -> np.ndarray:
+    return w.judge_percent + w.fan_percent
+
+
+@register_rule('judge_save', selection='judge_save',
+               description='Judge Save：Rank Sum 确定倒数两名，评委淘汰评分低者')
+def judge_save_score(w: WeekArrays) -> np.ndarray:
+    return rank_sum_score(w)
+
+
+# AWVS 参数（与 twin_model_analysis.NewVotingSystem.calculate_score 一致）
+AWVS_BASE_WEIGHT = 0.5
+AWVS_STAGE_SHIFT = 0.15
+AWVS_TREND_BONUS = 0.05
+
+
+@register_rule('awvs', description='AWVS：动态权重（后期更看重评委）+ 进步奖励，综合得分最低者淘汰')
+def awvs_score(w: WeekArrays) -> np.ndarray:
+    stage_adjustment = w.progress * AWVS_STAGE_SHIFT
+    judge_weight = AWVS_BASE_WEIGHT + stage_adjustment
+    fan_weight = AWVS_BASE_WEIGHT - stage_adjustment
+    trend_bonus = np.maximum(0, w.trend * AWVS_TREND_BONUS)
+    return judge_weight * w.judge_norm + fan_weight * w.fan + trend_bonus
+
+
+# VotingSimulator 原有的三种规则（simulate_all_weeks 的输出列）
+DEFAULT_RULES = ('rank_sum', 'percent_sum', 'judge_save')
@@ -0,0 +1,223 @@
+"""
+评委/粉丝权重扫描 (Judge Weight Sweep)
+
+FairnessAnalyzer.propose_optimal_weights 和 NewVotingSystem 的权重来自经验规则。
+本模块在稠密的评委权重网格上直接评估两种混合方式：
+
+- rank:    w × 评委排名 + (1 - w) × 粉丝排名，最大者淘汰
+- percent: w × 评委百分比 + (1 - w) × 粉丝百分比，最小者淘汰
+
+每周的排名、百分比和 FFI 只预计算一次（WeekRankCache），
+每个网格点只需要一次加权求和和一次 argmin。w = 0.5 时两种混合
+分别与 Rank Sum / Percent Sum 的淘汰结果相同。
+
+评估指标：
+- match_rate: 有实际淘汰者的周中，淘汰者与实际一致的比例
+- flip_rate:  与等权（w = 0.5，即现行规则）淘汰者不同的周比例
+- mean_ffi:   被淘汰者 FFI 的均值（接近 0 表示粉丝与评委意见平衡）
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.counterfactual_simulation import ArrayVotingEngine
+from models.voting_rules import WeekArrays, first_argmin
+
+BLENDS = ('rank', 'percent')
+
+
+class WeekRankCache:
+    """
+    每周的评委/粉丝排名、百分比和 FFI，按人数分桶预计算一次
+
+    Parameters:
+    -----------
+    data : DataFrame
+        包含 judge_total 和 fan_vote_share 的周级数据
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        engine = ArrayVotingEngine(data)
+        fan_votes = data['fan_vote_share'].to_numpy(dtype=float)
+
+        self.n_weeks = engine.n_weeks
+        self.seasons = engine.seasons
+        self.weeks = engine.weeks
+        # 有实际淘汰者的周（实际淘汰者不在有效行中时永远不匹配）
+        self.has_actual = engine.actual_row >= 0
+
+        self.buckets = []
+        for members, rows in engine.buckets:
+            arrays = WeekArrays(
+                judge=engine.judge_scores[rows][None],
+                fan=fan_votes[rows][None],
+                week=engine.weeks[members],
+            )
+            ffi = arrays.ffi[0]
+            self.buckets.append({
+                'members': members,
+                'judge_rank': arrays.judge_rank[0],
+                'fan_rank': arrays.fan_rank[0],
+                'judge_percent': arrays.judge_percent[0],
+                'fan_percent': arrays.fan_percent[0],
+                'ffi': ffi,
+                'actual_pos': engine.actual_pos[members],
+            })
+
+    def eliminate(self, judge_weights: np.ndarray, blend: str) -> Dict[str, np.ndarray]:
+        """
+        每个网格点每周的淘汰者
+
+        Returns:
+        --------
+        dict，形状均为 (网格点数, 周数)：
+            pos: 淘汰者在有效行中的周内位置
+            match: 是否与实际淘汰者一致
+            ffi: 淘汰者的 FFI
+        """
+        if blend not in BLENDS:
+            raise ValueError(f"Unknown blend: {blend}")
+
+        w = np.asarray(judge_weights, dtype=float)[:, None, None]
+        n_grid = w.shape[0]
+        out = {
+            'pos': np.full((n_grid, self.n_weeks), -1, dtype=np.int64),
+            'match': np.zeros((n_grid, self.n_weeks), dtype=bool),
+            'ffi': np.full((n_grid, self.n_weeks), np.nan),
+        }
+
+        for bucket in self.buckets:
+            # 分数越低越危险：排名和取负号，百分比和直接比较
+            if blend == 'rank':
+                score = -(w * bucket['judge_rank'] + (1 - w) * bucket['fan_rank'])
+            else:
+                score = w * bucket['judge_percent'] + (1 - w) * bucket['fan_percent']
+            pos = first_argmin(score)
+
+            members = bucket['members']
+            out['pos'][:, members] = pos
+            out['match'][:, members] = pos == bucket['actual_pos']
+            out['ffi'][:, members] = np.take_along_axis(bucket['ffi'][None], pos[..., None], axis=-1)[..., 0]
+
+        return out
+
+
+class WeightSweepResult:
+    """
+    权重扫描结果
+
+    Attributes:
+    -----------
+    table : DataFrame
+        每个 (blend, judge_weight) 一行：match_rate, flip_rate, mean_ffi, abs_mean_ffi, pareto
+    """
+
+    # Pareto 前沿的目标：match_rate 越大越好，flip_rate 和 |mean_ffi| 越小越好
+    OBJECTIVES = {'match_rate': 'max', 'flip_rate': 'min', 'abs_mean_ffi': 'min'}
+
+    def __init__(self, table: pd.DataFrame):
+        table = table.reset_index(drop=True)
+        table['pareto'] = self._pareto_mask(table)
+        self.table = table
+
+    @classmethod
+    def _pareto_mask(cls, table: pd.DataFrame) -> np.ndarray:
+        """非支配点（所有目标都不差且至少一个更好的点不存在）"""
+        # 统一为越小越好
+        costs = np.column_stack([
+            -table[col].to_numpy(dtype=float) if sense == 'max' else table[col].to_numpy(dtype=float)
+            for col, sense in cls.OBJECTIVES.items()
+        ])
+        costs = np.nan_to_num(costs, nan=np.inf)
+
+        # 每次取 512 个点与全部点两两比较，避免 (点数 × 点数 × 目标数) 的一次性分配
+        dominated = np.zeros(len(costs), dtype=bool)
+        for start in range(0, len(costs), 512):
+            block = costs[start:start + 512]
+            no_worse = (costs[None, :, :] <= block[:, None, :]).all(axis=-1)
+            better = (costs[None, :, :] < block[:, None, :]).any(axis=-1)
+            dominated[start:start + 512] = (no_worse & better).any(axis=1)
+        return ~dominated
+
+    def pareto_front(self, blend: str = None) -> pd.DataFrame:
+        """Pareto 前沿（按 match_rate 降序），可按混合方式过滤"""
+        front = self.table[self.table['pareto']]
+        if blend is not None:
+            front = front[front['blend'] == blend]
+        return front.sort_values(['match_rate', 'judge_weight'], ascending=[False, True])
+
+    def query(self, blend: str = None, min_match_rate: float = None,
+              max_flip_rate: float = None, max_abs_ffi: float = None,
+              objective: str = 'match_rate', pareto_only: bool = True) -> pd.DataFrame:
+        """
+        按约束查询候选权重，按 objective 排序（越好越靠前）
+
+        例：result.query(max_abs_ffi=0.05, max_flip_rate=0.2) 给出
+        |mean FFI| ≤ 0.05 且相对现行规则翻转不超过 20% 时匹配率最高的权重
+        """
+        candidates = self.table[self.table['pareto']] if pareto_only else self.table
+        if blend is not None:
+            candidates = candidates[candidates['blend'] == blend]
+        if min_match_rate is not None:
+            candidates = candidates[candidates['match_rate'] >= min_match_rate]
+        if max_flip_rate is not None:
+            candidates = candidates[candidates['flip_rate'] <= max_flip_rate]
+        if max_abs_ffi is not None:
+            candidates = candidates[candidates['abs_mean_ffi'] <= max_abs_ffi]
+
+        ascending = self.OBJECTIVES.get(objective, 'max') == 'min'
+        return candidates.sort_values([objective, 'judge_weight'], ascending=[ascending, True])
+
+
+def sweep_judge_weights(data: pd.DataFrame, judge_weights: Sequence[float] = None,
+                        blends: Sequence[str] = BLENDS, chunk_size: int = 256,
+                        cache: WeekRankCache = None) -> WeightSweepResult:
+    """
+    在评委权重网格上评估 rank / percent 两种混合方式
+
+    Parameters:
+    -----------
+    data : DataFrame
+        包含 judge_total 和 fan_vote_share 的周级数据
+    judge_weights : Sequence[float], optional
+        评委权重网格，默认 0 到 1 步长 0.001
+    blends : Sequence[str]
+        混合方式，'rank' 和/或 'percent'
+    chunk_size : int
+        每批网格点数（控制 (网格点数 × 周数 × 人数) 的内存）
+    cache : WeekRankCache, optional
+        已构建的排名缓存（多次扫描时复用）
+
+    Returns:
+    --------
+    result : WeightSweepResult
+    """
+    if judge_weights is None:
+        judge_weights = np.round(np.linspace(0, 1, 1001), 3)
+    judge_weights = np.asarray(judge_weights, dtype=float)
+    cache = cache or WeekRankCache(data)
+    has_actual = cache.has_actual
+    n_actual = max(int(has_actual.sum()), 1)
+
+    tables = []
+    for blend in blends:
+        # 现行规则（等权）的淘汰者，作为翻转率的基准
+        current_pos = cache.eliminate(np.array([0.5]), blend)['pos'][0]
+
+        for start in range(0, len(judge_weights), chunk_size):
+            weights = judge_weights[start:start + chunk_size]
+            outcome = cache.eliminate(weights, blend)
+            mean_ffi = np.nanmean(outcome['ffi'], axis=1)
+
+            tables.append(pd.DataFrame({
+                'blend': blend,
+                'judge_weight': weights,
+                'fan_weight': 1 - weights,
+                'match_rate': outcome['match'][:, has_actual].sum(axis=1) / n_actual,
+                'flip_rate': (outcome['pos'] != current_pos).mean(axis=1),
+                'mean_ffi': mean_ffi,
+                'abs_mean_ffi': np.abs(mean_ffi),
+            }))
+
+    return WeightSweepResult(pd.concat(tables, ignore_index=True))
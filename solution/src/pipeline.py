@@ -5,9 +5,18 @@
 - 综合评委打分和粉丝投票
 - 根据综合评分确定淘汰选手
 - 支持评委拯救权机制
+- 由淘汰结果反推粉丝投票份额（受约束的逆向求解）
 """
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import permutations
+from typing import Dict, List, Tuple
 
+import numpy as np
 import pandas as pd
+from scipy.optimize import linear_sum_assignment, minimize
+
+from models.voting_rules import SELECTION_POLICIES, WeekArrays, get_rules
 
 
 def combine_rank(judge_total: pd.Series, fan_votes: pd.Series) -> pd.Series:
@@ -44,11 +53,6 @@ def combine_percent(judge_total: pd.Series, fan_votes: pd.Series) -> pd.Series:
     Returns:
         综合百分比序列（分数越高越优秀）
     """
-    judge_percent = judge_total / judge_total.sum()
-    fan_percent = fan_votes / fan_votes.sum()
-    return judge_percent + fan_percent
-
-
     # 计算各自的百分比占比
     judge_percent = judge_total / judge_total.sum()
     fan_percent = fan_votes / fan_votes.sum()
@@ -86,9 +90,10 @@ def select_eliminated(
     if n_eliminate < 1:
         return []
 
-    # 根据指定方法计算综合评分
+    # 根据指定方法计算综合评分（统一为越低越差）
     if method == "rank":
-        combined = combine_rank(week_df["judge_total"], fan_votes)
+        # 排名和越大越差，取负号后与百分比法同向
+        combined = -combine_rank(week_df["judge_total"], fan_votes)
     elif method == "percent":
         combined = combine_percent(week_df["judge_total"], fan_votes)
     else:
@@ -106,20 +111,306 @@ def select_eliminated(
     return list(combined.nsmallest(n_eliminate).index)
 
 
+# =============================================================================
+# 粉丝投票逆向求解 (Inverse Fan Vote Reconstruction)
+# =============================================================================
+
+# 各赛季的投票规则（docs/00_problem_summary.md）：(method, judge_save)
+def season_rule(season: int) -> Tuple[str, bool]:
+    """第 1-2 季排名法，第 3-27 季百分比法，第 28 季起排名法 + 评委拯救"""
+    if season <= 2:
+        return "rank", False
+    if season <= 27:
+        return "percent", False
+    return "rank", True
+
+
+DEFAULT_CONFIG = {
+    'margin': 1e-4,       # 约束的最小间隔（严格不等式的松弛）
+    'min_share': 1e-3,    # 每位选手的最低份额
+    'n_jobs': None,       # 赛季并行的进程数；1 时顺序运行
+}
+
+
+def _rule_name(method: str, judge_save: bool, n_eliminate: int) -> str:
+    """select_eliminated 的参数对应的注册规则名"""
+    if method == "percent":
+        return "percent_sum"
+    if method == "rank":
+        return "judge_save" if judge_save and n_eliminate == 1 else "rank_sum"
+    raise ValueError(f"Unknown method: {method}")
+
+
+def _eliminates(rule_name: str, judge: np.ndarray, fan: np.ndarray,
+                eliminated: np.ndarray) -> np.ndarray:
+    """
+    一批粉丝份额向量 (批数, 人数) 下，规则淘汰的是否恰好是 eliminated 中的选手
+    （与 select_eliminated 的语义一致：单人淘汰按规则选择，多人淘汰取综合分最低的若干人）
+    """
+    rule = get_rules([rule_name])[0]
+    arrays = WeekArrays(judge=judge[None, None, :], fan=fan[:, None, :], week=np.zeros(1))
+    n_out = len(eliminated)
+    if n_out == 1:
+        return rule.select(arrays)[:, 0, 0] == eliminated[0]
+
+    score = np.broadcast_to(rule.score(arrays), arrays.fan.shape)
+    chosen = SELECTION_POLICIES['bottom'](score, arrays, n_out)[:, 0, :]
+    return (np.sort(chosen, axis=-1) == np.sort(eliminated)).all(axis=-1)
+
+
+def _bottom_cases(judge: np.ndarray, eliminated: np.ndarray,
+                  rule_name: str) -> List[Tuple[np.ndarray, int]]:
+    """
+    排名法下淘汰结果对应的 bottom 组合：(综合排名最差的若干人, 必须排第一危险的人或 -1)
+
+    - rank_sum：被淘汰者恰好是综合排名最差的 len(eliminated) 人，组内顺序不限
+    - judge_save：被淘汰者 e 与搭档 p 是 bottom two。e 最危险时要求
+      judge_p ≥ judge_e；p 最危险时要求 judge_e < judge_p
+      （与 select_judge_save 的并列规则一致）
+    """
+    if rule_name != "judge_save":
+        return [(eliminated, -1)]
+
+    e = eliminated[0]
+    cases = []
+    for p in range(len(judge)):
+        if p == e or judge[p] < judge[e]:
+            continue
+        # 评委分相同时只有 e 排在最危险位置才会被淘汰
+        cases.append((np.array([e, p]), -1 if judge[p] > judge[e] else e))
+    return cases
+
+
+def rank_cases(judge: np.ndarray, eliminated: np.ndarray, rule_name: str):
+    """
+    排名法下复现淘汰结果的所有粉丝排序，按 (bottom 组合, 组内粉丝排名) 分组枚举
+
+    规则只取决于排名。枚举 bottom 组合（_bottom_cases）及组内选手的粉丝排名后，
+    其余选手的危险键必须低于 bottom 中最小的危险键，即各自的粉丝排名有上界。
+    危险键 = 综合排名 × (n + 1) + (n - 1 - 位置)，并列时周内靠前者先淘汰
+    （与 first_argmin 和稳定排序一致）。不同分组的排序互不重叠。
+
+    Yields:
+        (bottom, bottom_rank, others, upper, free)：bottom 选手及其粉丝排名（1 = 最好），
+        其余选手、各自的排名上界，以及留给他们的排名；上界可能无法同时满足
+    """
+    n = len(judge)
+    judge_rank = 1 + (judge[None, :] > judge[:, None]).sum(axis=1)
+    tie_break = n - 1 - np.arange(n)
+    ranks = np.arange(1, n + 1)
+
+    for bottom, first in _bottom_cases(judge, eliminated, rule_name):
+        others = np.setdiff1d(np.arange(n), bottom)
+        for bottom_rank in permutations(ranks, len(bottom)):
+            bottom_rank = np.array(bottom_rank)
+            bottom_key = (judge_rank[bottom] + bottom_rank) * (n + 1) + tie_break[bottom]
+            if first >= 0 and bottom_key[bottom == first][0] != bottom_key.max():
+                continue
+
+            # 其余选手的危险键 < bottom 的最小键 ⇔ 粉丝排名 ≤ upper
+            upper = (bottom_key.min() - tie_break[others] - 1) // (n + 1) - judge_rank[others]
+            yield bottom, bottom_rank, others, upper, np.setdiff1d(ranks, bottom_rank)
+
+
+def _rank_order(prior: np.ndarray, judge: np.ndarray, eliminated: np.ndarray,
+                rule_name: str) -> Tuple[np.ndarray, bool]:
+    """
+    排名法：满足淘汰结果、且与先验粉丝排序的位移总量最小的严格排序（完全搜索）
+
+    对 rank_cases 的每个分组，只有上界的二分匹配按 Hall 条件排序即可判定可行，
+    再用指派问题（linear_sum_assignment）求位移总量 Σ|新排名 - 先验排名| 最小的分配。
+
+    只有所有组合都不可行时才判为不可行，此时把被淘汰者移到最后、
+    其余选手保持先验顺序。
+
+    Returns:
+        (排序：从最好到最差的选手编号, 是否可行)
+    """
+    n = len(prior)
+    position = np.empty(n, dtype=np.int64)
+    position[np.argsort(-prior, kind='stable')] = np.arange(1, n + 1)
+
+    best_cost, best_rank = np.inf, None
+    for bottom, bottom_rank, others, upper, free in rank_cases(judge, eliminated, rule_name):
+        bottom_cost = np.abs(bottom_rank - position[bottom]).sum()
+        if bottom_cost >= best_cost or not (np.sort(upper) >= free).all():
+            continue
+
+        cost = np.abs(free[None, :] - position[others, None]).astype(float)
+        cost[free[None, :] > upper[:, None]] = np.inf
+        rows, cols = linear_sum_assignment(cost)
+        total = cost[rows, cols].sum() + bottom_cost
+        if total < best_cost:
+            best_cost = total
+            best_rank = np.empty(n, dtype=np.int64)
+            best_rank[bottom] = bottom_rank
+            best_rank[others[rows]] = free[cols]
+
+    if best_rank is None:
+        is_out = np.isin(np.arange(n), eliminated)
+        return np.lexsort((position, is_out)), False
+    return np.argsort(best_rank), True
+
+
+def elimination_constraints(prior: np.ndarray, judge: np.ndarray, eliminated: np.ndarray,
+                            method: str, judge_save: bool,
+                            margin: float) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """
+    单周淘汰结果对粉丝份额的线性约束 A f ≥ b（不含 Σf = 1 和下界）
+
+    - 百分比法：P^J_e + f_e ≤ P^J_j + f_j - margin（e 被淘汰，j 晋级）
+    - 排名法：按 _rank_order 在 prior 附近选出的排序，相邻两人 f_a ≥ f_b + margin
+
+    Returns:
+        (A, b, info)；info 包含规则名和排序是否可行，无淘汰的周 A 为 0 行
+    """
+    n = len(prior)
+    rule_name = _rule_name(method, judge_save, len(eliminated))
+    info = {'rule': rule_name, 'order_feasible': True}
+
+    rows = []
+    bounds_b = []
+    if len(eliminated) == 0:
+        pass
+    elif method == "percent":
+        judge_percent = judge / judge.sum()
+        survivors = np.setdiff1d(np.arange(n), eliminated)
+        for e in eliminated:
+            for j in survivors:
+                row = np.zeros(n)
+                row[j], row[e] = 1.0, -1.0
+                rows.append(row)
+                bounds_b.append(margin - (judge_percent[j] - judge_percent[e]))
+    else:
+        order, info['order_feasible'] = _rank_order(prior, judge, eliminated, rule_name)
+        for better, worse in zip(order[:-1], order[1:]):
+            row = np.zeros(n)
+            row[better], row[worse] = 1.0, -1.0
+            rows.append(row)
+            bounds_b.append(margin)
+
+    return np.array(rows).reshape(-1, n), np.array(bounds_b), info
+
+
+def _solve_week(prior: np.ndarray, judge: np.ndarray, eliminated: np.ndarray,
+                method: str, judge_save: bool, margin: float,
+                min_share: float) -> Tuple[np.ndarray, Dict]:
+    """
+    单周的约束二次规划：min ||f - prior||²，s.t. Σf = 1，f ≥ min_share，
+    A f ≥ b（见 elimination_constraints）
+
+    以先验（上一周的解）为初值热启动。
+    """
+    n = len(prior)
+    A, b, info = elimination_constraints(prior, judge, eliminated, method, judge_save, margin)
+
+    if len(eliminated) == 0:
+        return prior, {**info, 'status': 'no_elimination', 'feasible': True}
+
+    constraints = [
+        {'type': 'eq', 'fun': lambda f: f.sum() - 1.0, 'jac': lambda f: np.ones(n)},
+        {'type': 'ineq', 'fun': lambda f: A @ f - b, 'jac': lambda f: A},
+    ]
+    result = minimize(
+        lambda f: 0.5 * np.sum((f - prior) ** 2),
+        x0=prior,
+        jac=lambda f: f - prior,
+        bounds=[(min_share, 1.0)] * n,
+        constraints=constraints,
+        method='SLSQP',
+    )
+    shares = np.clip(result.x, min_share, None)
+    shares /= shares.sum()
+
+    feasible = bool(_eliminates(info['rule'], judge, shares[None, :], eliminated)[0])
+    return shares, {**info, 'status': result.message, 'feasible': feasible}
+
+
+def week_eliminated(week_df: pd.DataFrame, week: int) -> np.ndarray:
+    """本周被淘汰者在 week_df 中的位置（只有一人参赛的周视为无淘汰）"""
+    if len(week_df) < 2:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero((week_df['elimination_week'] == week).to_numpy())
+
+
+def _estimate_season(season_df: pd.DataFrame, config: Dict) -> Tuple[pd.Series, List[Dict]]:
+    """
+    单个赛季逐周求解（在进程池工作进程中运行）
+
+    每周的先验是上一周的解在本周选手上重新归一化（新出现的选手取均值），
+    既作为二次规划的目标，也作为初值。
+    """
+    season = int(season_df['season'].iloc[0])
+    method, judge_save = season_rule(season)
+    shares = pd.Series(np.nan, index=season_df.index)
+    diagnostics = []
+    previous: Dict[str, float] = {}
+
+    valid = season_df[season_df['week_valid'] == True]
+    for week, week_df in valid.groupby('week', sort=True):
+        names = week_df['celebrity_name'].to_numpy()
+        n = len(names)
+        judge = week_df['judge_total'].to_numpy(dtype=float)
+
+        prior = np.array([previous.get(name, np.nan) for name in names])
+        fill = np.nanmean(prior) if np.isfinite(prior).any() else 1.0 / n
+        prior = np.where(np.isfinite(prior), prior, fill)
+        prior = prior / prior.sum()
+
+        eliminated = week_eliminated(week_df, week)
+
+        week_shares, info = _solve_week(
+            prior, judge, eliminated, method, judge_save,
+            config['margin'], config['min_share']
+        )
+        shares.loc[week_df.index] = week_shares
+        previous = dict(zip(names, week_shares))
+
+        diagnostics.append({
+            'season': season,
+            'week': week,
+            'method': method,
+            'judge_save': judge_save,
+            'num_contestants': n,
+            'num_eliminated': len(eliminated),
+            'shift_from_prior': float(np.abs(week_shares - prior).sum()),
+            **info,
+        })
+
+    return shares, diagnostics
+
+
 def estimate_fan_votes(panel, config=None):
     """
     估算粉丝投票数
-    
-    根据给定的面板数据和配置参数，估算每个选手获得的粉丝投票数
-    
+
+    根据给定的面板数据和配置参数，估算每个选手获得的粉丝投票数。
+    对每周求与实际淘汰结果一致（在该季规则下由 select_eliminated 选出）、
+    且最接近上一周估计的粉丝份额向量（docs/02_model_design.md 的可行域）；
+    各赛季在进程池中并行求解。决赛周的名次不作为约束。
+
     Args:
-        panel: 选手面板数据
-        config: 模型配置参数，默认为None
-    
+        panel: 选手面板数据（weekly_panel：season, week, celebrity_name,
+               judge_total, week_valid, elimination_week）
+        config: 模型配置参数（见 DEFAULT_CONFIG），默认为None
+
     Returns:
-        粉丝投票数序列
-    
-    Note:
-        具体实现详见 docs/02_model_design.md 中的模型设计说明
+        粉丝投票份额序列（与 panel 的行对齐，无效周为 NaN）；
+        每周的求解诊断信息在返回值的 attrs['diagnostics'] 中
     """
-    raise NotImplementedError("Implement in docs/02_model_design.md")
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    seasons = [season_df for _, season_df in panel.groupby('season', sort=True)]
+
+    if config['n_jobs'] == 1:
+        season_results = [_estimate_season(season_df, config) for season_df in seasons]
+    else:
+        n_workers = config['n_jobs'] or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            season_results = list(executor.map(_estimate_season, seasons, [config] * len(seasons)))
+
+    shares = pd.concat([result[0] for result in season_results]).reindex(panel.index)
+    shares.name = 'fan_vote_share'
+    shares.attrs['diagnostics'] = pd.DataFrame(
+        [row for result in season_results for row in result[1]]
+    )
+    return shares
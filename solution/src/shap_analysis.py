@@ -1,64 +1,73 @@
 """
 SHAP 分析脚本
 使用 SHAP 值深度分析 Random Forest 模型的特征影响
+
+两种计算方式：
+- mode='fast'（默认）：models/tree_shap.py 的 TreeSHAP，训练集 + 测试集全部样本
+  按行分片并行计算，SHAP 值和 Top 特征对的交互值在同一遍中逐片写入列式分片目录
+  （shap_values/、shap_interactions/）；Top 特征由随机抽取的 pair_sample 行的
+  SHAP 值预先确定
+- mode='shap'：shap.TreeExplainer 解释训练集前 sample_size 个样本（原流程）
+
+作图依赖 shap 库；未安装时只输出数值结果。
 """
+import itertools
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import shap
 from pathlib import Path
-import pickle
 
+from models.random_forest_model import RandomForestFanPreferenceModel
+from models.tree_ensemble import TreeEnsemble
+from models.tree_shap import TreeShapExplainer, explain_to_parts
+from utils.model_bundle import ModelBundle, load_bundle
+from utils.storage import read_parts, read_table
 
-def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path):
-    """
-    运行 SHAP 分析
-    """
-    print("=" * 80)
-    print("SHAP 分析：Random Forest 特征影响深度解析")
-    print("=" * 80)
+# 随 SHAP 值一起写出的标识列
+KEY_COLUMNS = ['season', 'week', 'celebrity_name', 'residual']
 
-    # 1. 加载模型
-    print("\n[Step 1] 加载模型")
-    with open(model_path, 'rb') as f:
-        model_data = pickle.load(f)
 
-    model = model_data['model']
-    feature_names = model_data['feature_names']
-    print(f"  - 模型加载成功")
-    print(f"  - 特征数量: {len(feature_names)}")
+def _load_panels(bundle: ModelBundle, predictions_path: Path, test_data_path: Path = None):
+    """
+    训练集（RF 预测结果中的特征）和测试集（用已加载模型包中的编码器重新编码）
 
-    # 2. 加载预测数据
-    print("\n[Step 2] 加载预测数据")
-    predictions_df = pd.read_csv(predictions_path)
-    print(f"  - 数据形状: {predictions_df.shape}")
+    Returns:
+        (X, keys)：特征矩阵和逐行对应的标识列（含 split）
+    """
+    model = RandomForestFanPreferenceModel.from_bundle(bundle)
 
-    # 准备特征矩阵（与训练时相同的特征）
-    X = predictions_df[feature_names].values
-    print(f"  - 特征矩阵形状: {X.shape}")
+    train_df = read_table(predictions_path)
+    frames = [train_df[model.feature_names].to_numpy()]
+    keys = [train_df[KEY_COLUMNS].assign(split='train')]
 
-    # 3. 创建 SHAP Explainer
-    print("\n[Step 3] 创建 SHAP Explainer")
-    print("  - 使用 TreeExplainer（针对树模型优化）")
+    if test_data_path is not None:
+        test_df = read_table(test_data_path)
+        X_test, _, test_featured = model.prepare_features(test_df)
+        frames.append(X_test)
+        keys.append(test_featured[KEY_COLUMNS].assign(split='test'))
 
-    # 使用 TreeExplainer（针对树模型，速度快）
-    explainer = shap.TreeExplainer(model)
+    return np.vstack(frames), pd.concat(keys, ignore_index=True)
 
-    # 计算 SHAP 值（使用子集以加快速度）
-    sample_size = min(500, len(X))
-    X_sample = X[:sample_size]
-    print(f"  - 计算 SHAP 值（样本数: {sample_size}）...")
 
-    shap_values = explainer.shap_values(X_sample)
-    print(f"  - SHAP 值形状: {shap_values.shape}")
+def _plot_shap(shap_values: np.ndarray, X: np.ndarray, feature_names, residuals: np.ndarray,
+               expected_value: float, dependence_partners: dict, output_dir: Path):
+    """
+    Steps 4-7：summary / bar / dependence / force 图（未安装 shap 时返回 False）
 
-    # 创建输出目录
-    output_dir.mkdir(parents=True, exist_ok=True)
+    dependence_partners 为特征编号 -> 着色用的交互特征编号；
+    提供时 dependence_plot 不再逐图估计交互特征
+    """
+    try:
+        import shap
+    except ImportError:
+        print("\n[Step 4-7] 未安装 shap，跳过作图")
+        return False
 
     # 4. SHAP Summary Plot（最重要的图）
     print("\n[Step 4] 生成 SHAP Summary Plot")
     plt.figure(figsize=(12, 8))
-    shap.summary_plot(shap_values, X_sample, feature_names=feature_names, show=False)
+    shap.summary_plot(shap_values, X, feature_names=feature_names, show=False)
     plt.tight_layout()
     plt.savefig(output_dir / 'shap_summary_plot.png', dpi=300, bbox_inches='tight')
     print(f"  - 保存: {output_dir / 'shap_summary_plot.png'}")
@@ -67,7 +76,7 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
     # 5. SHAP Bar Plot（特征重要性）
     print("\n[Step 5] 生成 SHAP Bar Plot")
     plt.figure(figsize=(10, 8))
-    shap.summary_plot(shap_values, X_sample, feature_names=feature_names,
+    shap.summary_plot(shap_values, X, feature_names=feature_names,
                       plot_type="bar", show=False)
     plt.tight_layout()
     plt.savefig(output_dir / 'shap_bar_plot.png', dpi=300, bbox_inches='tight')
@@ -86,8 +95,8 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
         print(f"  - 生成 {feat_name} 的 dependence plot...")
 
         plt.figure(figsize=(10, 6))
-        shap.dependence_plot(idx, shap_values, X_sample,
-                            feature_names=feature_names, show=False)
+        shap.dependence_plot(idx, shap_values, X, feature_names=feature_names,
+                             interaction_index=dependence_partners.get(idx, "auto"), show=False)
         plt.tight_layout()
 
         # 清理文件名
@@ -101,10 +110,9 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
 
     # 选择几个有代表性的样本
     # 找出残差最大和最小的样本
-    residuals_sample = predictions_df['residual'].values[:sample_size]
-    max_idx = np.argmax(residuals_sample)
-    min_idx = np.argmin(residuals_sample)
-    median_idx = np.argsort(residuals_sample)[len(residuals_sample)//2]
+    max_idx = np.argmax(residuals)
+    min_idx = np.argmin(residuals)
+    median_idx = np.argsort(residuals)[len(residuals)//2]
 
     for idx, label in [(max_idx, 'highest_fan_support'),
                        (min_idx, 'lowest_fan_support'),
@@ -114,9 +122,9 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
 
         # 创建 force plot
         shap.force_plot(
-            explainer.expected_value,
+            expected_value,
             shap_values[idx],
-            X_sample[idx],
+            X[idx],
             feature_names=feature_names,
             matplotlib=True,
             show=False
@@ -127,6 +135,104 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
                    dpi=300, bbox_inches='tight')
         plt.close()
 
+    return True
+
+
+def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path,
+                      test_data_path: Path = None, mode: str = 'fast', n_jobs: int = None,
+                      shard_size: int = 512, top_k: int = 5, sample_size: int = 500,
+                      pair_sample: int = 1024):
+    """
+    运行 SHAP 分析
+
+    Parameters:
+    -----------
+    model_path : Path
+        随机森林模型包
+    predictions_path : Path
+        RF 预测结果（训练集特征）
+    output_dir : Path
+        输出目录
+    test_data_path : Path, optional
+        测试集（Ridge V2 测试集份额）；mode='fast' 时一并解释
+    mode : str
+        'fast'（TreeSHAP 全量、分片并行）或 'shap'（shap.TreeExplainer，前 sample_size 个样本）
+    n_jobs : int, optional
+        mode='fast' 的进程数，None 时使用 CPU 核数
+    shard_size : int
+        mode='fast' 每个分片的行数
+    top_k : int
+        mode='fast' 对平均绝对 SHAP 值最大的 top_k 个特征两两计算交互值
+    pair_sample : int
+        mode='fast' 选取 Top 特征时随机抽取的行数（固定种子），
+        之后 SHAP 值和交互值在一遍分片计算中得到
+    """
+    print("=" * 80)
+    print("SHAP 分析：Random Forest 特征影响深度解析")
+    print("=" * 80)
+
+    # 1. 加载模型
+    print("\n[Step 1] 加载模型")
+    # 模型包中的节点数组为内存映射，无需反序列化 sklearn 对象
+    bundle = load_bundle(model_path)
+    forest = TreeEnsemble(bundle)
+    feature_names = bundle.meta['feature_names']
+    print(f"  - 模型加载成功（{forest.n_trees} 棵树）")
+    print(f"  - 特征数量: {len(feature_names)}")
+
+    # 2. 加载预测数据
+    print("\n[Step 2] 加载数据")
+    if mode == 'fast':
+        X, keys = _load_panels(bundle, predictions_path, test_data_path)
+    else:
+        predictions_df = read_table(predictions_path)
+        X = predictions_df[feature_names].values[:sample_size]
+        keys = predictions_df[KEY_COLUMNS].iloc[:sample_size].assign(split='train')
+    print(f"  - 特征矩阵形状: {X.shape}")
+    for split, count in keys['split'].value_counts(sort=False).items():
+        print(f"  - {split}: {count} 行")
+
+    # 创建输出目录
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 3. 计算 SHAP 值
+    print("\n[Step 3] 计算 SHAP 值")
+    interactions = None
+    if mode == 'fast':
+        explainer = TreeShapExplainer(forest)
+
+        # Top 特征由抽样行的平均绝对 SHAP 值确定，全量 SHAP 值和交互值只需一遍
+        rows = np.random.default_rng(0).choice(len(X), size=min(pair_sample, len(X)), replace=False)
+        ranking = np.argsort(np.abs(explainer.shap_values(X[rows])).mean(axis=0))[::-1]
+        pairs = list(itertools.combinations(sorted(int(f) for f in ranking[:top_k]), 2))
+        print(f"  - 交互值: Top {top_k} 特征的 {len(pairs)} 个特征对（按 {len(rows)} 行抽样排序）")
+
+        print(f"  - TreeSHAP（分片 {shard_size} 行，进程数 {n_jobs or '全部 CPU'}）")
+        explain_to_parts(bundle, X, keys, output_dir / 'shap_values', pairs=pairs,
+                         interaction_dir=output_dir / 'shap_interactions',
+                         shard_size=shard_size, n_jobs=n_jobs)
+        shap_values = read_parts(output_dir / 'shap_values')[[f'shap_{f}' for f in feature_names]].to_numpy()
+        interactions = (read_parts(output_dir / 'shap_interactions').drop(columns=keys.columns)
+                        .rename(columns=lambda column: column.removeprefix('shap_')))
+    else:
+        import shap
+
+        print("  - 使用 shap.TreeExplainer（针对树模型优化）")
+        explainer = shap.TreeExplainer(forest.to_shap_model())
+        shap_values = explainer.shap_values(X)
+    print(f"  - SHAP 值形状: {shap_values.shape}")
+
+    # 每个特征着色用交互最强的伙伴特征（按强度升序覆盖，最强的最后写入）
+    dependence_partners = {}
+    if interactions is not None:
+        strength = interactions.abs().mean().to_numpy()
+        for (i, j), _ in sorted(zip(pairs, strength), key=lambda item: item[1]):
+            dependence_partners[i], dependence_partners[j] = j, i
+
+    residuals = keys['residual'].to_numpy()
+    plotted = _plot_shap(shap_values, X, feature_names, residuals, explainer.expected_value,
+                         dependence_partners, output_dir)
+
     # 8. 生成 SHAP 值统计报告
     print("\n[Step 8] 生成 SHAP 值统计报告")
 
@@ -139,14 +245,17 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
     for feat, val in mean_abs_shap.head(10).items():
         print(f"  {feat}: {val:.4f}")
 
-    # 保存 SHAP 值
-    shap_df['residual'] = residuals_sample
-    shap_df['celebrity_name'] = predictions_df['celebrity_name'].values[:sample_size]
-    shap_df['season'] = predictions_df['season'].values[:sample_size]
-    shap_df['week'] = predictions_df['week'].values[:sample_size]
+    if interactions is not None:
+        interaction_strength = interactions.abs().mean().sort_values(ascending=False)
+        print(f"\n[SHAP 交互值排序（Top {top_k} 特征两两之间，完整交互效应为 2 倍）]")
+        for pair, val in interaction_strength.items():
+            print(f"  {pair}: {val:.4f}")
+        interaction_strength.rename_axis('pair').reset_index(name='mean_abs_interaction').to_csv(
+            output_dir / 'shap_interaction_importance.csv', index=False)
 
+    # 保存 SHAP 值（加 shap_ 前缀，避免与同名标识列 week 冲突）
     shap_output_path = output_dir / 'shap_values.csv'
-    shap_df.to_csv(shap_output_path, index=False)
+    pd.concat([keys, shap_df.add_prefix('shap_')], axis=1).to_csv(shap_output_path, index=False)
     print(f"\n[保存] SHAP 值已保存到: {shap_output_path}")
 
     # 9. 分析关键发现
@@ -158,7 +267,7 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
     if 'age' in feature_names:
         age_idx = feature_names.index('age')
         age_shap = shap_values[:, age_idx]
-        age_values = X_sample[:, age_idx]
+        age_values = X[:, age_idx]
 
         print(f"\n[年龄的影响]")
         print(f"  - 平均绝对 SHAP 值: {np.abs(age_shap).mean():.4f}")
@@ -187,15 +296,18 @@ def run_shap_analysis(model_path: Path, predictions_path: Path, output_dir: Path
     print("SHAP 分析完成！")
     print("=" * 80)
 
-    print(f"\n生成的图表:")
-    print(f"  1. shap_summary_plot.png - SHAP 值总览（最重要）")
-    print(f"  2. shap_bar_plot.png - 特征重要性条形图")
-    print(f"  3. shap_dependence_*.png - Top 5 特征的依赖图")
-    print(f"  4. shap_force_*.png - 3 个代表性样本的解释")
+    if plotted:
+        print(f"\n生成的图表:")
+        print(f"  1. shap_summary_plot.png - SHAP 值总览（最重要）")
+        print(f"  2. shap_bar_plot.png - 特征重要性条形图")
+        print(f"  3. shap_dependence_*.png - Top 5 特征的依赖图")
+        print(f"  4. shap_force_*.png - 3 个代表性样本的解释")
+    if mode == 'fast':
+        print(f"\n列式分片: shap_values/（SHAP 值）, shap_interactions/（交互值）")
 
 
 if __name__ == "__main__":
-    model_path = Path("F:/Mathematical_modeling/solution/Data/models/random_forest/random_forest_model.pkl")
+    model_path = Path("F:/Mathematical_modeling/solution/Data/models/random_forest/random_forest_model.bundle")
     predictions_path = Path("F:/Mathematical_modeling/solution/Data/models/random_forest/rf_predictions.csv")
     output_dir = Path("F:/Mathematical_modeling/solution/figures/shap_analysis")
 
@@ -0,0 +1,7 @@
+"""测试共用设置：把 src 加入导入路径（与 python main.py 的运行方式一致）"""
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
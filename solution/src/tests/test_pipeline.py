@@ -0,0 +1,91 @@
+"""pipeline.estimate_fan_votes：可行周必须复现实际淘汰，只有确实不可行的周才被标记"""
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import DATA_DIR
+from pipeline import (_eliminates, _rank_order, _rule_name, estimate_fan_votes, rank_cases,
+                      season_rule, select_eliminated, week_eliminated)
+
+PANEL_PATH = DATA_DIR / "processed" / "weekly_panel.csv"
+
+# 穷举检验的最大周人数（8! = 40320 种排序）
+MAX_EXHAUSTIVE = 8
+
+
+@pytest.fixture(scope="module")
+def panel() -> pd.DataFrame:
+    if not PANEL_PATH.exists():
+        pytest.skip(f"缺少 {PANEL_PATH}（先运行 data_processing）")
+    return pd.read_csv(PANEL_PATH)
+
+
+@pytest.fixture(scope="module")
+def estimate(panel):
+    return estimate_fan_votes(panel, {'n_jobs': 1})
+
+
+def _elimination_weeks(panel: pd.DataFrame):
+    """有淘汰的有效周：(season, week, week_df, eliminated)"""
+    valid = panel[panel['week_valid'] == True]
+    for (season, week), week_df in valid.groupby(['season', 'week'], sort=True):
+        eliminated = week_eliminated(week_df, week)
+        if len(eliminated):
+            yield season, week, week_df, eliminated
+
+
+def test_feasible_weeks_reproduce_elimination(panel, estimate):
+    """排序可行的周，估计出的份额在 select_eliminated 下淘汰的正是实际被淘汰者"""
+    diagnostics = estimate.attrs['diagnostics']
+    order_feasible = dict(zip(zip(diagnostics['season'], diagnostics['week']),
+                              diagnostics['order_feasible']))
+    mismatched = []
+    for season, week, week_df, eliminated in _elimination_weeks(panel):
+        if not order_feasible[(season, week)]:
+            continue
+        method, judge_save = season_rule(season)
+        # 不带 attrs（诊断表）的份额，避免 pandas 在拼接时比较 attrs
+        fan_votes = pd.Series(estimate.loc[week_df.index].to_numpy(), index=week_df.index)
+        chosen = select_eliminated(week_df, fan_votes, method,
+                                   n_eliminate=len(eliminated), judge_save=judge_save)
+        if sorted(chosen) != sorted(week_df.index[eliminated]):
+            mismatched.append((season, week))
+    assert mismatched == []
+
+
+def test_rank_feasibility_matches_exhaustive_search(panel):
+    """排名法周：_rank_order 判为不可行当且仅当没有任何严格排序能复现淘汰结果，
+    rank_cases 枚举出的排序数等于可行排序总数"""
+    rng = np.random.default_rng(0)
+    checked = 0
+    for season, week, week_df, eliminated in _elimination_weeks(panel):
+        method, judge_save = season_rule(season)
+        n = len(week_df)
+        if method != "rank" or n > MAX_EXHAUSTIVE:
+            continue
+        judge = week_df['judge_total'].to_numpy(dtype=float)
+        rule_name = _rule_name(method, judge_save, len(eliminated))
+
+        # 每种排序对应一个严格递减的份额向量
+        orders = np.array(list(permutations(range(n))))
+        fan = (n - np.argsort(orders, axis=-1)).astype(float)
+        n_feasible = int(_eliminates(rule_name, judge, fan / fan.sum(axis=-1, keepdims=True),
+                                     eliminated).sum())
+        any_feasible = n_feasible > 0
+
+        order, feasible = _rank_order(rng.dirichlet(np.ones(n)), judge, eliminated, rule_name)
+        assert feasible == any_feasible, (season, week)
+
+        # rank_cases 的分组不重叠，组内排序数之和等于可行排序总数
+        n_orders = 0
+        for _, _, _, upper, free in rank_cases(judge, eliminated, rule_name):
+            choices = (free[None, :] <= np.sort(upper)[:, None]).sum(axis=1) - np.arange(len(upper))
+            n_orders += int(np.prod(np.maximum(choices, 0)))
+        assert n_orders == n_feasible, (season, week)
+        if feasible:
+            shares = (n - np.argsort(order)).astype(float)
+            assert _eliminates(rule_name, judge, shares[None, :] / shares.sum(), eliminated)[0]
+        checked += 1
+    assert checked > 0
@@ -1 +1 @@
-﻿__all__ = ["data", "metrics"]
+﻿__all__ = ["cache", "data", "encoding", "metrics", "model_bundle", "storage", "week_index"]
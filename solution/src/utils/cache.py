@@ -0,0 +1,293 @@
+"""
+内容哈希的阶段缓存 (Content-Hashed Stage Cache)
+
+缓存键 = 阶段名 + 输入文件内容哈希 + 阶段参数 + 阶段代码的哈希。
+阶段代码包括 run_* 所在模块，以及它（递归）导入的 src 下全部模块
+（静态解析 import 语句，函数体内的延迟导入同样计入），
+修改 utils/、models/voting_rules.py、pipeline.py 等辅助模块也会使缓存失效。
+上游没有变化时，run_* 直接返回缓存的结果，不再重新计算。
+
+缓存目录结构：
+    <cache_dir>/<stage>/<key>/result.pkl     # run_* 的返回值
+    <cache_dir>/<stage>/<key>/manifest.json  # 输入/输出文件哈希、参数、耗时
+
+命中条件：键相同，且 manifest 中记录的输出文件仍存在且内容未变。
+
+使用方法：
+    python -m utils.cache list
+    python -m utils.cache evict [stage]
+"""
+import ast
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from config import DATA_DIR
+
+CACHE_DIR = DATA_DIR / "cache"
+SRC_ROOT = Path(__file__).resolve().parents[1]
+
+
+def file_digest(path: Path) -> str:
+    """文件内容的 SHA-256；不存在时返回空串"""
+    path = Path(path)
+    if not path.exists():
+        return ""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def input_digest(path: Path) -> str:
+    """
+    输入表的内容哈希
+
+    输入路径沿用 .csv 文件名，read_table 可能读取同名 .parquet，
+    因此两者都计入哈希。
+    """
+    path = Path(path)
+    csv_digest = file_digest(path.with_suffix(".csv"))
+    parquet_digest = file_digest(path.with_suffix(".parquet"))
+    return hashlib.sha256(f"{csv_digest}:{parquet_digest}".encode()).hexdigest()
+
+
+def _module_file(module: str) -> Optional[Path]:
+    """src 下模块名对应的源文件；不是项目模块时返回 None"""
+    base = SRC_ROOT.joinpath(*module.split('.'))
+    for candidate in (base.with_suffix('.py'), base / '__init__.py'):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _imported_modules(path: Path) -> List[str]:
+    """源文件中全部 import 语句（含函数体内）引用的模块名"""
+    tree = ast.parse(path.read_text(encoding='utf-8-sig'))
+    package = '.'.join(path.resolve().relative_to(SRC_ROOT).with_suffix('').parts[:-1])
+    modules = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                parts = package.split('.') if package else []
+                parts = parts[:len(parts) - (node.level - 1)]
+                base = '.'.join(parts + ([node.module] if node.module else []))
+            else:
+                base = node.module
+            modules.append(base)
+            # from package import submodule
+            modules.extend(f"{base}.{alias.name}" for alias in node.names)
+    return modules
+
+
+def code_dependencies(path: Path) -> List[Path]:
+    """path 及其递归导入的全部 src 模块源文件（排序）"""
+    path = Path(path).resolve()
+    seen = {path}
+    stack = [path]
+    while stack:
+        for module in _imported_modules(stack.pop()):
+            dep = _module_file(module)
+            if dep is not None and dep.resolve() not in seen:
+                seen.add(dep.resolve())
+                stack.append(dep.resolve())
+    return sorted(seen)
+
+
+def make_key(stage: str, inputs: Dict[str, Path], params: Dict[str, Any],
+             code_paths: Sequence[Path] = ()) -> str:
+    """由阶段名、输入内容、参数和代码文件计算缓存键"""
+    payload = {
+        'stage': stage,
+        'inputs': {name: input_digest(path) for name, path in sorted(inputs.items())},
+        'params': params,
+        'code': {str(Path(path).relative_to(SRC_ROOT)) if Path(path).is_relative_to(SRC_ROOT) else str(path):
+                 file_digest(path) for path in code_paths},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class StageCache:
+    """
+    阶段缓存
+
+    每个条目保存 run_* 的返回值（pickle）和 manifest。
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+
+    def entry_dir(self, stage: str, key: str) -> Path:
+        return self.cache_dir / stage / key
+
+    def load(self, stage: str, key: str) -> Tuple[bool, Any]:
+        """返回 (是否命中, 缓存的结果)"""
+        entry = self.entry_dir(stage, key)
+        manifest_path = entry / "manifest.json"
+        result_path = entry / "result.pkl"
+        if not manifest_path.exists() or not result_path.exists():
+            return False, None
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        # 输出文件被删除或修改过，视为未命中
+        for path, digest in manifest['outputs'].items():
+            if file_digest(Path(path)) != digest:
+                return False, None
+
+        with open(result_path, 'rb') as f:
+            return True, pickle.load(f)
+
+    def store(self, stage: str, key: str, result: Any,
+              inputs: Dict[str, Path], params: Dict[str, Any],
+              outputs: Iterable[Path], elapsed: float) -> Path:
+        """保存结果和 manifest"""
+        entry = self.entry_dir(stage, key)
+        entry.mkdir(parents=True, exist_ok=True)
+
+        with open(entry / "result.pkl", 'wb') as f:
+            pickle.dump(result, f)
+
+        manifest = {
+            'stage': stage,
+            'key': key,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'elapsed_sec': elapsed,
+            'inputs': {name: str(path) for name, path in inputs.items()},
+            'params': params,
+            'outputs': {str(path): file_digest(path) for path in outputs},
+        }
+        with open(entry / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+
+        return entry
+
+    def list_entries(self) -> pd.DataFrame:
+        """列出所有缓存条目"""
+        rows = []
+        for manifest_path in sorted(self.cache_dir.glob("*/*/manifest.json")):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            entry = manifest_path.parent
+            size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+            rows.append({
+                'stage': manifest['stage'],
+                'key': manifest['key'][:12],
+                'created': manifest['created'],
+                'elapsed_sec': manifest['elapsed_sec'],
+                'params': json.dumps(manifest['params'], sort_keys=True, default=str),
+                'size_kb': size / 1024,
+            })
+        return pd.DataFrame(rows, columns=['stage', 'key', 'created', 'elapsed_sec', 'params', 'size_kb'])
+
+    def evict(self, stage: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        删除缓存条目
+
+        stage 为 None 时清空全部；key 可以是完整键或前缀。
+        Returns: 删除的条目数
+        """
+        pattern = f"{stage or '*'}/{key + '*' if key else '*'}"
+        entries = [p for p in self.cache_dir.glob(pattern) if p.is_dir()]
+        for entry in entries:
+            shutil.rmtree(entry)
+        return len(entries)
+
+
+def _new_files(directory: Path, since: float) -> List[Path]:
+    """目录下在 since 之后写入的文件"""
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(p for p in directory.rglob("*") if p.is_file() and p.stat().st_mtime >= since)
+
+
+def cached_stage(stage: str, inputs: Sequence[str], params: Sequence[str] = (),
+                 output_arg: str = 'output_dir', code_deps: Sequence[Path] = ()):
+    """
+    为 run_* 入口增加缓存的装饰器
+
+    Args:
+        stage: 阶段名（缓存子目录名）
+        inputs: 作为输入文件的参数名（值为 None 的可选输入不计入）
+        params: 计入缓存键的阶段参数名（如 alpha, n_estimators, random_state）
+        output_arg: 输出目录的参数名（计入缓存键）；运行期间写入该目录的文件记入 manifest
+        code_deps: 额外计入缓存键的代码文件（静态 import 解析不到的依赖，
+            如按字符串动态加载的模块）
+
+    被装饰的函数额外接受 use_cache=True 和 cache_dir=None 两个关键字参数。
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        code_path = Path(inspect.getsourcefile(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, use_cache: bool = True, cache_dir: Optional[Path] = None, **kwargs):
+            if not use_cache:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            stage_inputs = {
+                name: Path(bound.arguments[name]) for name in inputs
+                if bound.arguments[name] is not None
+            }
+            stage_params = {name: bound.arguments[name] for name in params}
+            output_dir = Path(bound.arguments[output_arg])
+
+            cache = StageCache(cache_dir)
+            # 每次调用重新解析依赖，运行期间修改的辅助模块同样计入
+            code_paths = code_dependencies(code_path) + [Path(path) for path in code_deps]
+            key = make_key(stage, stage_inputs, {**stage_params, output_arg: str(output_dir)}, code_paths)
+
+            hit, result = cache.load(stage, key)
+            if hit:
+                print(f"[缓存命中] {stage} ({key[:12]})，跳过重新计算")
+                return result
+
+            start = time.time()
+            result = func(*bound.args, **bound.kwargs)
+            elapsed = time.time() - start
+
+            outputs = _new_files(output_dir, start)
+            cache.store(stage, key, result, stage_inputs, stage_params, outputs, elapsed)
+            print(f"[缓存] 已保存 {stage} ({key[:12]})")
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+if __name__ == "__main__":
+    import sys
+
+    cache = StageCache()
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if command == "list":
+        entries = cache.list_entries()
+        if len(entries) == 0:
+            print(f"缓存为空: {cache.cache_dir}")
+        else:
+            print(entries.to_string(index=False))
+    elif command == "evict":
+        stage = sys.argv[2] if len(sys.argv) > 2 else None
+        removed = cache.evict(stage)
+        print(f"已删除 {removed} 个缓存条目")
+    else:
+        print("用法: python -m utils.cache [list | evict [stage]]")
@@ -0,0 +1,61 @@
+"""
+分类变量编码 (Categorical Encoding)
+
+LabelEncoder.transform 遇到未见过的类别会报错，逐行调用又很慢。
+CategoricalEncoder 整列编码：先对列取一次 np.unique，只对不同取值
+在有序词表上 searchsorted，再按逆索引展开到所有行。
+
+- 编码与 LabelEncoder 相同（词表为排序后的 astype(str) 取值）
+- 未见过的类别映射为保留编码 unknown_code（默认 -1）
+- classes_ 可直接写入模型包，加载时用 CategoricalEncoder(classes=...) 恢复
+"""
+import numpy as np
+
+UNKNOWN_CODE = -1
+
+
+def _as_strings(values) -> np.ndarray:
+    """与 Series.astype(str) 相同的字符串化（缺失值为 'nan'）"""
+    if hasattr(values, 'astype') and not isinstance(values, np.ndarray):
+        values = values.astype(str)
+    return np.asarray(values, dtype=str)
+
+
+class CategoricalEncoder:
+    """
+    词表编码器
+
+    Parameters:
+    -----------
+    classes : array-like, optional
+        已有词表（已排序）；为 None 时需先 fit
+    unknown_code : int
+        未见过的类别的编码
+    """
+
+    def __init__(self, classes=None, unknown_code: int = UNKNOWN_CODE):
+        self.classes_ = None if classes is None else np.asarray(classes, dtype=str)
+        self.unknown_code = unknown_code
+
+    def fit(self, values) -> 'CategoricalEncoder':
+        self.classes_ = np.unique(_as_strings(values))
+        return self
+
+    def fit_transform(self, values) -> np.ndarray:
+        self.classes_, codes = np.unique(_as_strings(values), return_inverse=True)
+        return codes.astype(np.int64)
+
+    def transform(self, values) -> np.ndarray:
+        """整列编码；不在词表中的取值为 unknown_code"""
+        if self.classes_ is None:
+            raise ValueError("CategoricalEncoder 尚未拟合，请先调用 fit")
+
+        uniques, inverse = np.unique(_as_strings(values), return_inverse=True)
+        if len(self.classes_) == 0:
+            return np.full(len(inverse), self.unknown_code, dtype=np.int64)
+
+        position = np.searchsorted(self.classes_, uniques)
+        clipped = np.minimum(position, len(self.classes_) - 1)
+        known = self.classes_[clipped] == uniques
+        codes = np.where(known, clipped, self.unknown_code)
+        return codes[inverse].astype(np.int64)
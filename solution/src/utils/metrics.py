@@ -1,5 +1,9 @@
-﻿import numpy as np
+﻿from typing import Dict
+
+import numpy as np
 import pandas as pd
+
+from utils.week_index import WeekIndex
 # 这个模块用于评估指标 | This module is used for evaluation metrics
 
 def elimination_match_rate(actual_eliminated: pd.Series, predicted_eliminated: pd.Series) -> float:
@@ -7,3 +11,68 @@ def elimination_match_rate(actual_eliminated: pd.Series, predicted_eliminated: p
     predicted = predicted_eliminated.astype(str)
     return np.mean(actual == predicted)
 # 计算淘汰匹配率 | Calculate elimination match rate
+
+
+def build_week_layout(df: pd.DataFrame, index: WeekIndex) -> Dict:
+    """
+    将周级数据排成 (周数, 最大人数) 的填充矩阵，供批量淘汰匹配率计算
+
+    Returns:
+        judge_rank: 评委排名矩阵，填充位为 NaN
+        actual_col: 每周实际淘汰者（当周 week == elimination_week 的第一行）所在列，无淘汰为 -1
+        counted: 参与匹配率统计的周（人数 > 3 且有实际淘汰者）
+        n_counted: 参与统计的周数
+    """
+    eliminated = (
+        (df['week'] == df['elimination_week']) &
+        (df['elimination_week'] > 0)
+    ).to_numpy()
+    actual_col = index.first_true(eliminated)
+
+    # 跳过人数太少的周
+    counted = (index.sizes > 3) & (actual_col >= 0)
+
+    return {
+        'index': index,
+        'judge_rank': index.pad(df['judge_rank_in_week'].to_numpy(dtype=float)),
+        'actual_col': actual_col,
+        'counted': counted,
+        'n_counted': int(counted.sum()),
+    }
+
+
+def rank_sum_predicted_cols(shares: np.ndarray, layout: Dict) -> np.ndarray:
+    """
+    Rank Sum 规则下每周预测的淘汰者所在列
+
+    周内粉丝排名 = 1 + 份额更高的人数 + (份额相同的人数 - 1) / 2，
+    与 pandas rank(ascending=False, method='average') 一致；
+    综合排名 = 评委排名 + 粉丝排名，取最大者（并列取周内靠前的行）。
+
+    Args:
+        shares: (候选数, 行数) 的粉丝投票份额矩阵
+        layout: build_week_layout 的结果
+
+    Returns:
+        (候选数, 周数) 的列号矩阵
+    """
+    index = layout['index']
+    padded = np.moveaxis(index.pad(np.asarray(shares).T, fill=-np.inf), -1, 0)
+
+    # 周内两两比较：(候选, 周, i, j)
+    greater = (padded[..., None, :] > padded[..., :, None]).sum(axis=-1)
+    equal = (padded[..., None, :] == padded[..., :, None]).sum(axis=-1)
+    fan_rank = 1 + greater + (equal - 1) / 2
+
+    combined = layout['judge_rank'][None] + fan_rank
+    combined = np.where(np.isnan(combined), -np.inf, combined)
+    return combined.argmax(axis=-1)
+
+
+def rank_sum_match_rates(shares: np.ndarray, layout: Dict) -> np.ndarray:
+    """由 (候选数, 行数) 的粉丝投票份额矩阵计算每个候选的淘汰匹配率"""
+    predicted_col = rank_sum_predicted_cols(shares, layout)
+
+    counted = layout['counted']
+    correct = (predicted_col[:, counted] == layout['actual_col'][counted]).sum(axis=1)
+    return correct / max(layout['n_counted'], 1)
@@ -0,0 +1,167 @@
+"""
+模型包 (Model Bundle)
+
+替代 pickle 的模型持久化格式：一个文件 = JSON 头 + 若干原始 NumPy 数组。
+
+    [8 字节魔数][8 字节头长度][JSON 头][对齐填充][数组 0][数组 1]...
+
+- JSON 头保存标量参数（alpha、特征名等）和每个数组的 dtype / shape / 偏移
+- 数组按 64 字节对齐连续存放，加载时用 np.memmap 只读映射，
+  不解析、不复制，加载耗时与模型大小无关
+- 多个工作进程映射同一文件时共享操作系统的页缓存；
+  ModelBundle 序列化时只传递路径，传给进程池不会复制数组
+
+写入先写临时文件再原子替换，中断时不会留下半个模型包。
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Mapping
+
+import numpy as np
+
+BUNDLE_SUFFIX = ".bundle"
+MAGIC = b"MDLBNDL1"
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_bundle(path: Path, arrays: Mapping[str, np.ndarray], meta: Mapping[str, Any] = None) -> Path:
+    """
+    保存模型包
+
+    Parameters:
+    -----------
+    path : Path
+        输出路径（建议使用 .bundle 后缀）
+    arrays : Mapping[str, np.ndarray]
+        数组名 -> 数组（数值或定长字符串 dtype，不支持 object）
+    meta : Mapping[str, Any], optional
+        可 JSON 序列化的标量参数
+
+    Returns:
+    --------
+    path : Path
+    """
+    path = Path(path)
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise TypeError(f"数组 {name} 为 object dtype，无法写入模型包")
+
+    # 头的长度决定第一个数组的偏移：先用占位偏移估计头长度，
+    # 再用真实偏移重算一次（预留一个对齐块吸收数字位数的变化）
+    layout = {name: {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': 0}
+              for name, array in arrays.items()}
+    header = {'meta': dict(meta or {}), 'arrays': layout}
+    for _ in range(2):
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        offset = _aligned(len(MAGIC) + 8 + len(header_bytes) + ALIGNMENT)
+        for name, array in arrays.items():
+            layout[name]['offset'] = offset
+            offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            if f.tell() > layout[name]['offset']:
+                raise RuntimeError("模型包头部超出预留空间")
+            f.write(b"\0" * (layout[name]['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class ModelBundle:
+    """
+    已加载的模型包
+
+    Attributes:
+    -----------
+    path : Path
+    meta : dict
+        保存时的标量参数
+    arrays : Dict[str, np.ndarray]
+        只读内存映射数组
+
+    支持 bundle['coef'] 取数组，bundle.meta['alpha'] 取参数。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是模型包文件: {self.path}")
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length).decode('utf-8'))
+
+        # 整个文件只映射一次，各数组是映射上的只读视图
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.meta: Dict[str, Any] = header['meta']
+        self.arrays: Dict[str, np.ndarray] = {
+            name: np.ndarray(tuple(spec['shape']), dtype=spec['dtype'],
+                             buffer=self._buffer, offset=spec['offset'])
+            for name, spec in header['arrays'].items()
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+    def __reduce__(self):
+        # 传给工作进程时只传路径，由子进程重新映射
+        return (load_bundle, (self.path,))
+
+    def __repr__(self) -> str:
+        return f"ModelBundle({str(self.path)!r}, arrays={list(self.arrays)})"
+
+
+def load_bundle(path: Path) -> ModelBundle:
+    """以只读内存映射方式加载模型包"""
+    return ModelBundle(path)
+
+
+def linear_model_arrays(model, scaler) -> Dict[str, np.ndarray]:
+    """已训练的 Ridge + StandardScaler 的系数和标准化统计量"""
+    return {
+        'coef': np.asarray(model.coef_, dtype=np.float64),
+        'intercept': np.atleast_1d(np.asarray(model.intercept_, dtype=np.float64)),
+        'scaler_mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_, dtype=np.float64),
+        'scaler_var': np.asarray(scaler.var_, dtype=np.float64),
+        'scaler_n_samples_seen': np.atleast_1d(np.asarray(scaler.n_samples_seen_, dtype=np.int64)),
+    }
+
+
+def restore_linear_model(bundle: ModelBundle, alpha: float):
+    """
+    由模型包恢复已训练的 Ridge 和 StandardScaler（拟合属性直接指向内存映射数组）
+
+    Returns:
+        (model, scaler)
+    """
+    from sklearn.linear_model import Ridge
+    from sklearn.preprocessing import StandardScaler
+
+    model = Ridge(alpha=alpha)
+    model.coef_ = bundle['coef']
+    model.intercept_ = float(bundle['intercept'][0])
+    model.n_features_in_ = len(bundle['coef'])
+
+    scaler = StandardScaler()
+    scaler.mean_ = bundle['scaler_mean']
+    scaler.scale_ = bundle['scaler_scale']
+    scaler.var_ = bundle['scaler_var']
+    scaler.n_samples_seen_ = int(bundle['scaler_n_samples_seen'][0])
+    scaler.n_features_in_ = len(bundle['scaler_mean'])
+    return model, scaler
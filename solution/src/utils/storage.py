@@ -0,0 +1,198 @@
+"""
+列式存储层 (Columnar Artifact Storage)
+
+处理后的面板数据以 Parquet 列式格式保存，并固定各列 dtype；
+CSV 仅作为导出格式（便于 Excel / 人工查看）。
+
+- write_artifact / read_artifact: 按产物名读写 (weekly_panel, train_panel, ...)
+- write_table / read_table: 按路径读写，路径沿用原来的 .csv 文件名，
+  存在较新的同名 .parquet 时优先读取列式文件
+- write_part / read_parts: 分片目录，每个分片原子写入，
+  用于按赛季流式输出（中断后已完成的分片仍然可读）
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+COLUMNAR_SUFFIX = ".parquet"
+
+# 面板类产物（weekly/train/test 共用同一 schema）的显式 dtype
+PANEL_DTYPES: Dict[str, str] = {
+    'season': 'int64',
+    'week': 'int64',
+    'judge_total': 'float64',
+    'judge_rank_in_week': 'float64',
+    'week_valid': 'bool',
+    'celebrity_age_during_season': 'int64',
+    'placement': 'int64',
+    'elimination_week': 'int64',
+    'relative_judge_score': 'float64',
+    'cumulative_average': 'float64',
+    'trend': 'float64',
+    'is_bottom_2_judge': 'bool',
+}
+
+# 反事实模拟结果；某个分片中整列为空时也保持字符串类型
+SIMULATION_DTYPES: Dict[str, str] = {
+    'season': 'int64',
+    'week': 'int64',
+    'num_contestants': 'int64',
+    'actual_eliminated': 'str',
+    'rank_sum_eliminated': 'str',
+    'percent_sum_eliminated': 'str',
+    'judge_save_eliminated': 'str',
+    'ffi_actual': 'float64',
+    'ffi_rank_sum': 'float64',
+    'ffi_percent_sum': 'float64',
+    'ffi_judge_save': 'float64',
+    'mean_ffi': 'float64',
+    'std_ffi': 'float64',
+    'rank_vs_percent_same': 'bool',
+    'rank_vs_judge_save_same': 'bool',
+    'percent_vs_judge_save_same': 'bool',
+    'all_same': 'bool',
+}
+
+# 产物名 -> 显式 dtype（面板中的字符串列保持 pandas 默认类型，不在此列出）
+ARTIFACT_DTYPES: Dict[str, Dict[str, str]] = {
+    'weekly_panel': PANEL_DTYPES,
+    'train_panel': PANEL_DTYPES,
+    'test_panel': PANEL_DTYPES,
+    'contestant_static': {
+        'season': 'int64',
+        'celebrity_age_during_season': 'int64',
+        'placement': 'int64',
+        'elimination_week': 'int64',
+        'avg_judge_score': 'float64',
+    },
+    'season_meta': {
+        'season': 'int64',
+        'max_weeks': 'int64',
+        'num_contestants': 'int64',
+    },
+    'simulation_results': SIMULATION_DTYPES,
+}
+
+
+def apply_dtypes(df: pd.DataFrame, dtypes: Optional[Dict[str, str]]) -> pd.DataFrame:
+    """按 dtypes 转换存在的列；未列出的列保持不变"""
+    if not dtypes:
+        return df
+    present = {col: dtype for col, dtype in dtypes.items() if col in df.columns}
+    return df.astype(present)
+
+
+def columnar_path(path: Path) -> Path:
+    """与 CSV 路径对应的列式文件路径"""
+    return Path(path).with_suffix(COLUMNAR_SUFFIX)
+
+
+def write_table(df: pd.DataFrame, path: Path,
+                dtypes: Optional[Dict[str, str]] = None,
+                export_csv: bool = True) -> Path:
+    """
+    写出列式文件；export_csv=True 时同时导出同名 CSV
+
+    Args:
+        df: 待保存的数据
+        path: 逻辑路径（.csv 文件名），列式文件为同名 .parquet
+        dtypes: 显式 dtype，None 时使用产物注册表中与文件名同名的条目
+        export_csv: 是否同时导出 CSV
+
+    Returns:
+        列式文件路径
+    """
+    path = Path(path)
+    if dtypes is None:
+        dtypes = ARTIFACT_DTYPES.get(path.stem)
+
+    df = apply_dtypes(df, dtypes).reset_index(drop=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 先写 CSV 再写列式文件，保证列式文件的修改时间不早于 CSV
+    if export_csv:
+        df.to_csv(path.with_suffix(".csv"), index=False)
+
+    out_path = columnar_path(path)
+    df.to_parquet(out_path, index=False)
+
+    return out_path
+
+
+def read_table(path: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    读取数据表
+
+    优先读取同名列式文件；若不存在，或 CSV 比它更新（例如被手工修改过），
+    则回退到 CSV，并按产物注册表固定 dtype。
+    """
+    path = Path(path)
+    csv_path = path.with_suffix(".csv")
+    parquet_path = columnar_path(path)
+
+    use_columnar = parquet_path.exists() and (
+        not csv_path.exists()
+        or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime
+    )
+
+    if use_columnar:
+        return pd.read_parquet(parquet_path, columns=columns)
+
+    df = pd.read_csv(csv_path, usecols=columns)
+    return apply_dtypes(df, ARTIFACT_DTYPES.get(path.stem))
+
+
+def write_artifact(df: pd.DataFrame, directory: Path, name: str,
+                   export_csv: bool = True) -> Path:
+    """按产物名保存（使用注册表中的显式 dtype）"""
+    if name not in ARTIFACT_DTYPES:
+        raise ValueError(f"Unknown artifact: {name}")
+    return write_table(df, Path(directory) / f"{name}.csv", ARTIFACT_DTYPES[name], export_csv)
+
+
+def read_artifact(directory: Path, name: str,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """按产物名读取"""
+    if name not in ARTIFACT_DTYPES:
+        raise ValueError(f"Unknown artifact: {name}")
+    return read_table(Path(directory) / f"{name}.csv", columns)
+
+
+def write_part(df: pd.DataFrame, directory: Path, part: str,
+               dtypes: Optional[Dict[str, str]] = None) -> Path:
+    """
+    向分片目录写入一个分片
+
+    先写临时文件再重命名，进程中断时不会留下不完整的分片。
+
+    Returns:
+        分片路径 <directory>/<part>.parquet
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    out_path = directory / f"{part}{COLUMNAR_SUFFIX}"
+    tmp_path = directory / f".{part}{COLUMNAR_SUFFIX}.tmp"
+    apply_dtypes(df, dtypes).reset_index(drop=True).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+
+    return out_path
+
+
+def list_parts(directory: Path) -> List[Path]:
+    """分片目录中已完成的分片（按名称排序）"""
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(directory.glob(f"*{COLUMNAR_SUFFIX}"))
+
+
+def read_parts(directory: Path, columns: Optional[List[str]] = None,
+               dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """按名称顺序读取并拼接全部分片"""
+    parts = [pd.read_parquet(path, columns=columns) for path in list_parts(directory)]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return apply_dtypes(pd.concat(parts, ignore_index=True), dtypes)
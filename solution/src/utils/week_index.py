@@ -0,0 +1,142 @@
+"""
+周级索引 (Week Index)
+
+对一张周级面板只构建一次的 CSR 风格索引：
+
+- order:   按 (season, week) 稳定排序后的行号
+- offsets: 第 g 周的行是 order[offsets[g]:offsets[g + 1]]
+- sizes:   每周参赛人数
+- position: 每行在本周内的位置（保持原行序）
+
+按周的循环（淘汰匹配率、投票规则模拟、Softmax 归一化）都在排序后的
+连续 NumPy 切片上完成，不再对 DataFrame 重复 groupby。
+"""
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class WeekIndex:
+    """
+    (season, week) 分组的 CSR 索引
+
+    Parameters:
+    -----------
+    group_ids : array-like
+        每行的组号；负数表示不属于任何组（如分组键缺失），不参与索引
+    keys : pd.DataFrame, optional
+        每组的键（如 season, week），第 g 行对应压缩后的组号 g
+    """
+
+    def __init__(self, group_ids, keys: Optional[pd.DataFrame] = None):
+        group_ids = np.asarray(group_ids)
+        valid = group_ids >= 0
+
+        # 组号压缩为 0..n_groups-1
+        uniques, dense = np.unique(group_ids[valid], return_inverse=True)
+        self.group_ids = np.full(len(group_ids), -1, dtype=np.int64)
+        self.group_ids[valid] = dense
+
+        self.n_rows = len(group_ids)
+        self.n_groups = len(uniques)
+        # 压缩后组号 g 对应的原始组号
+        self.labels = uniques
+
+        rows = np.flatnonzero(valid)
+        self.order = rows[np.argsort(dense, kind='stable')]
+        self.sizes = np.bincount(dense, minlength=self.n_groups).astype(np.int64)
+        self.offsets = np.zeros(self.n_groups + 1, dtype=np.int64)
+        np.cumsum(self.sizes, out=self.offsets[1:])
+        self.max_size = int(self.sizes.max()) if self.n_groups else 0
+
+        self.position = np.full(self.n_rows, -1, dtype=np.int64)
+        self.position[self.order] = (
+            np.arange(len(self.order)) - np.repeat(self.offsets[:-1], self.sizes)
+        )
+
+        self.keys = keys
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame,
+                   keys: Sequence[str] = ('season', 'week')) -> "WeekIndex":
+        """按 keys 分组构建索引（组的顺序与 groupby 一致）"""
+        grouped = df.groupby(list(keys))
+        group_keys = grouped.size().index.to_frame(index=False)
+        return cls(grouped.ngroup().to_numpy(), group_keys)
+
+    def __len__(self) -> int:
+        return self.n_groups
+
+    def rows(self, g: int) -> np.ndarray:
+        """第 g 组的原始行号"""
+        return self.order[self.offsets[g]:self.offsets[g + 1]]
+
+    def slices(self) -> Iterator[Tuple[int, slice]]:
+        """依次给出 (组号, 排序后数组上的切片)"""
+        for g in range(self.n_groups):
+            yield g, slice(self.offsets[g], self.offsets[g + 1])
+
+    def row_sizes(self) -> np.ndarray:
+        """每行所在组的人数（原行序；不属于任何组的行为 0）"""
+        return np.where(self.group_ids >= 0, self.sizes[self.group_ids], 0)
+
+    def take(self, values) -> np.ndarray:
+        """按组排序后的数组（同组的行连续）"""
+        return np.asarray(values)[self.order]
+
+    def scatter(self, sorted_values: np.ndarray, fill=np.nan) -> np.ndarray:
+        """take 的逆操作：把排序后的数组放回原行序"""
+        sorted_values = np.asarray(sorted_values)
+        out = np.full((self.n_rows,) + sorted_values.shape[1:], fill,
+                      dtype=np.result_type(sorted_values, np.asarray(fill)))
+        out[self.order] = sorted_values
+        return out
+
+    def broadcast(self, group_values: np.ndarray) -> np.ndarray:
+        """把每组一个值展开到排序后的每一行"""
+        return np.repeat(np.asarray(group_values), self.sizes, axis=0)
+
+    def reduce_max(self, sorted_values: np.ndarray) -> np.ndarray:
+        """每组最大值（输入为 take 之后的数组）"""
+        return np.maximum.reduceat(sorted_values, self.offsets[:-1], axis=0)
+
+    def reduce_sum(self, sorted_values: np.ndarray) -> np.ndarray:
+        """每组求和（输入为 take 之后的数组）"""
+        return np.add.reduceat(sorted_values, self.offsets[:-1], axis=0)
+
+    def softmax(self, logits: np.ndarray, scale=1.0) -> np.ndarray:
+        """
+        组内 Softmax，返回原行序
+
+        share_i = exp(scale × (x_i - max_g x)) / Σ_{j∈g} exp(scale × (x_j - max_g x))
+
+        logits 可以是 (n,) 或 (n, k)，k 列各自独立归一化。
+        """
+        logits = np.asarray(logits, dtype=float)
+        if self.n_groups == 0:
+            return np.zeros_like(logits)
+
+        sorted_logits = self.take(logits)
+        group_max = self.reduce_max(sorted_logits)
+        raw_votes = np.exp(scale * (sorted_logits - self.broadcast(group_max)))
+        group_sum = self.reduce_sum(raw_votes)
+
+        return self.scatter(raw_votes / (self.broadcast(group_sum) + 1e-12), fill=0.0)
+
+    def pad(self, values, fill=np.nan) -> np.ndarray:
+        """排成 (组数, 最大人数) 的填充矩阵；同组保持原行序"""
+        values = np.asarray(values)
+        out = np.full((self.n_groups, self.max_size) + values.shape[1:], fill,
+                      dtype=np.result_type(values, np.asarray(fill)))
+        valid = self.group_ids >= 0
+        out[self.group_ids[valid], self.position[valid]] = values[valid]
+        return out
+
+    def first_true(self, mask) -> np.ndarray:
+        """每组第一个为 True 的行在组内的位置，没有则为 -1"""
+        mask = np.asarray(mask, dtype=bool) & (self.group_ids >= 0)
+        first = np.full(self.n_groups, self.max_size, dtype=np.int64)
+        np.minimum.at(first, self.group_ids[mask], self.position[mask])
+        first[first == self.max_size] = -1
+        return first
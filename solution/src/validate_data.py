@@ -4,6 +4,7 @@
 import pandas as pd
 from pathlib import Path
 from config import DATA_DIR
+from utils.storage import read_artifact
 
 
 def validate_data_quality():
@@ -16,11 +17,11 @@ def validate_data_quality():
 
     # 1. 加载所有处理后的文件
     print("\n[1] 加载处理后的数据文件")
-    weekly_panel = pd.read_csv(processed_dir / "weekly_panel.csv")
-    contestant_static = pd.read_csv(processed_dir / "contestant_static.csv")
-    season_meta = pd.read_csv(processed_dir / "season_meta.csv")
-    train_panel = pd.read_csv(processed_dir / "train_panel.csv")
-    test_panel = pd.read_csv(processed_dir / "test_panel.csv")
+    weekly_panel = read_artifact(processed_dir, "weekly_panel")
+    contestant_static = read_artifact(processed_dir, "contestant_static")
+    season_meta = read_artifact(processed_dir, "season_meta")
+    train_panel = read_artifact(processed_dir, "train_panel")
+    test_panel = read_artifact(processed_dir, "test_panel")
 
     print(f"  [OK] weekly_panel: {weekly_panel.shape}")
     print(f"  [OK] contestant_static: {contestant_static.shape}")
@@ -4,6 +4,8 @@
 import pandas as pd
 from pathlib import Path
 
+from utils.storage import read_artifact
+
 # 设置显示选项
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
@@ -19,7 +21,7 @@ def view_processed_data():
     # 1. weekly_panel.csv
     print("\n[1] weekly_panel.csv - 前10行")
     print("-" * 80)
-    weekly = pd.read_csv(processed_dir / "weekly_panel.csv")
+    weekly = read_artifact(processed_dir, "weekly_panel")
     print(weekly.head(10))
     print(f"\n形状: {weekly.shape}")
     print(f"列名: {list(weekly.columns)}")
@@ -36,14 +38,14 @@ def view_processed_data():
     print("\n" + "=" * 80)
     print("[3] contestant_static.csv - 前10行")
     print("-" * 80)
-    static = pd.read_csv(processed_dir / "contestant_static.csv")
+    static = read_artifact(processed_dir, "contestant_static")
     print(static.head(10))
 
     # 4. season_meta.csv
     print("\n" + "=" * 80)
     print("[4] season_meta.csv - 所有赛季")
     print("-" * 80)
-    season = pd.read_csv(processed_dir / "season_meta.csv")
+    season = read_artifact(processed_dir, "season_meta")
     print(season.to_string())
 
     # 5. 数据统计
@@ -8,6 +8,10 @@ import numpy as np
 from pathlib import Path
 from collections import defaultdict
 
+from utils.metrics import build_week_layout, rank_sum_predicted_cols
+from utils.storage import read_table
+from utils.week_index import WeekIndex
+
 
 def compute_detailed_elimination_match_rate(df: pd.DataFrame):
     """
@@ -28,49 +32,44 @@ def compute_detailed_elimination_match_rate(df: pd.DataFrame):
 
     details = []
 
-    for (season, week), group in df.groupby(['season', 'week']):
-        if len(group) <= 3:  # 跳过人数太少的周
-            continue
-
-        # 使用 Rank Sum 方法
-        judge_rank = group['judge_rank_in_week']
-        fan_rank = group['fan_vote_share'].rank(ascending=False)
-
-        combined_rank = judge_rank + fan_rank
-
-        # 预测淘汰者（综合排名最差）
-        predicted_eliminated_idx = combined_rank.idxmax()
-        predicted_eliminated = group.loc[predicted_eliminated_idx, 'celebrity_name']
-
-        # 实际淘汰者
-        actual_eliminated_mask = (
-            (group['week'] == group['elimination_week']) &
-            (group['elimination_week'] > 0)
-        )
-
-        if actual_eliminated_mask.any():
-            actual_eliminated_idx = group[actual_eliminated_mask].index[0]
-            actual_eliminated = group.loc[actual_eliminated_idx, 'celebrity_name']
-
-            is_match = (predicted_eliminated_idx == actual_eliminated_idx)
-
-            if is_match:
-                correct_eliminations += 1
-                match_by_season[season]['correct'] += 1
-                match_by_week[week]['correct'] += 1
-
-            match_by_season[season]['total'] += 1
-            match_by_week[week]['total'] += 1
-            total_weeks += 1
-
-            details.append({
-                'season': season,
-                'week': week,
-                'predicted': predicted_eliminated,
-                'actual': actual_eliminated,
-                'match': is_match,
-                'num_contestants': len(group)
-            })
+    # 周级索引只构建一次；使用 Rank Sum 方法一次性预测每周淘汰者
+    index = WeekIndex.from_frame(df)
+    layout = build_week_layout(df, index)
+    shares = df['fan_vote_share'].to_numpy(dtype=float)[None, :]
+    predicted_col = rank_sum_predicted_cols(shares, layout)[0]
+    actual_col = layout['actual_col']
+
+    names = df['celebrity_name'].to_numpy()
+    seasons = index.keys['season'].to_numpy()
+    weeks = index.keys['week'].to_numpy()
+
+    # 跳过人数太少（≤ 3）和没有实际淘汰者的周
+    for g in np.flatnonzero(layout['counted']):
+        season, week = seasons[g], weeks[g]
+        rows = index.rows(g)
+
+        predicted_eliminated = names[rows[predicted_col[g]]]
+        actual_eliminated = names[rows[actual_col[g]]]
+
+        is_match = bool(predicted_col[g] == actual_col[g])
+
+        if is_match:
+            correct_eliminations += 1
+            match_by_season[season]['correct'] += 1
+            match_by_week[week]['correct'] += 1
+
+        match_by_season[season]['total'] += 1
+        match_by_week[week]['total'] += 1
+        total_weeks += 1
+
+        details.append({
+            'season': season,
+            'week': week,
+            'predicted': predicted_eliminated,
+            'actual': actual_eliminated,
+            'match': is_match,
+            'num_contestants': int(index.sizes[g])
+        })
 
     overall_match_rate = correct_eliminations / total_weeks if total_weeks > 0 else 0
 
@@ -86,7 +85,7 @@ def visualize_elimination_match_rate(data_path: Path, output_dir: Path):
     print("=" * 80)
 
     # 加载数据
-    df = pd.read_csv(data_path)
+    df = read_table(data_path)
     print(f"\n加载数据: {len(df)} 行")
 
     # 计算详细匹配率
@@ -8,6 +8,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.ticker import PercentFormatter
 
+from utils.storage import read_table
+
 
 def compute_flip_rate_by_season(results_df: pd.DataFrame, mode: str = "any") -> pd.DataFrame:
     """
@@ -66,7 +68,7 @@ def plot_flip_rate_by_season(results_path: Path, output_dir: Path, mode: str = "
         "gray": "#808080",
     }
 
-    results_df = pd.read_csv(results_path)
+    results_df = read_table(results_path)
     season_flip = compute_flip_rate_by_season(results_df, mode=mode)
 
     seasons = season_flip["season"].tolist()
@@ -7,6 +7,8 @@ import numpy as np
 from pathlib import Path
 import seaborn as sns
 
+from utils.storage import read_table
+
 
 def visualize_random_forest_results(importance_path: Path, predictions_path: Path, output_dir: Path):
     """
@@ -17,8 +19,8 @@ def visualize_random_forest_results(importance_path: Path, predictions_path: Pat
     print("=" * 80)
 
     # 加载数据
-    importance_df = pd.read_csv(importance_path)
-    predictions_df = pd.read_csv(predictions_path)
+    importance_df = read_table(importance_path)
+    predictions_df = read_table(predictions_path)
 
     print(f"\n加载数据:")
     print(f"  - 特征重要性: {len(importance_df)} 个特征")
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
 
+from utils.storage import read_table
+
+
 def visualize_ridge_results(results_path: Path, output_dir: Path):
     """
     可视化 Ridge 回归结果
@@ -15,7 +18,7 @@ def visualize_ridge_results(results_path: Path, output_dir: Path):
     print("=" * 60)
 
     # 加载结果
-    df = pd.read_csv(results_path)
+    df = read_table(results_path)
     print(f"\n加载数据: {len(df)} 行")
 
     # 创建输出目录
@@ -13,6 +13,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
 
+from utils.storage import read_table
+
 
 def plot_ffi_distribution(results_df: pd.DataFrame, output_dir: Path):
     """
@@ -258,12 +260,12 @@ def visualize_simulation_results(results_path: Path, case_path: Path, output_dir
     print("=" * 80)
 
     # 加载数据
-    results_df = pd.read_csv(results_path)
+    results_df = read_table(results_path)
 
     # 尝试加载争议案例数据
     case_df = None
     if case_path.exists():
-        case_df = pd.read_csv(case_path)
+        case_df = read_table(case_path)
         print(f"\n加载数据:")
         print(f"  - 模拟结果: {len(results_df)} 周")
         print(f"  - 争议案例: {len(case_df)} 条记录")
@@ -7,6 +7,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+from utils.storage import read_table
+
 
 def plot_feature_importance_comparison(importance_df: pd.DataFrame, output_dir: Path):
     """
@@ -361,9 +363,9 @@ def visualize_twin_model_results(data_path: Path, importance_path: Path,
     print("=" * 80)
 
     # 加载数据
-    data = pd.read_csv(data_path)
-    importance_df = pd.read_csv(importance_path)
-    simulation_results = pd.read_csv(simulation_path)
+    data = read_table(data_path)
+    importance_df = read_table(importance_path)
+    simulation_results = read_table(simulation_path)
 
     print(f"\nLoaded data:")
     print(f"  - Main data: {len(data)} rows")